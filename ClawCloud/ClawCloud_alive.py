@@ -9,118 +9,38 @@ ClawCloud 自动登录脚本
 import os
 import sys
 import time
-import base64
 import re
-import requests
-import pyotp  # 用于生成 2FA 验证码
 from urllib.parse import urlparse
-from playwright.sync_api import sync_playwright
-from requests.exceptions import RequestException
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.proxy import (
+    parse_proxies,
+    rank_proxies,
+    record_result,
+    detect_egress_ip_async,
+)
+from engine.http_pool import run_background
+from engine.waits import wait_url, wait_until, settle
+from engine.locate import race, summary as locate_summary
+from engine.github_identity import GitHubIdentity
+from engine.browser import browser_scope
+from engine.secret_writer import write_secret
+from engine.history import StepTimer
+from engine.telegram_bot import Telegram
+from engine.profiling import profiled
+from engine import scope
 # ==================== 配置 ====================
 # 固定登录入口，OAuth后会自动跳转到实际区域
 LOGIN_ENTRY_URL = "https://console.run.claw.cloud"
 SIGNIN_URL = f"{LOGIN_ENTRY_URL}/signin"
-DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
-TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "120"))  # 2FA验证 默认等 120 秒
 STATUS_OK = "OK"
 STATUS_PARTIAL = "PARTIAL"
 STATUS_FAIL = "FAIL"
 
-class Telegram:
-    """Telegram 通知"""
-    
-    def __init__(self):
-        self.token = os.environ.get('TG_BOT_TOKEN')
-        self.chat_id = os.environ.get('TG_CHAT_ID')
-        self.ok = bool(self.token and self.chat_id)
-    
-    def send(self, msg):
-        if not self.ok:
-            return
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
-                data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
-                timeout=30
-            )
-        except:
-            pass
-    
-    def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
-            return
-        try:
-            with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
-                    timeout=60
-                )
-        except:
-            pass
-    
-    def flush_updates(self):
-        """刷新 offset 到最新，避免读到旧消息"""
-        if not self.ok:
-            return 0
-        try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
-                params={"timeout": 0},
-                timeout=10
-            )
-            data = r.json()
-            if data.get("ok") and data.get("result"):
-                return data["result"][-1]["update_id"] + 1
-        except:
-            pass
-        return 0
-    
-    def wait_code(self, timeout=120):
-        """
-        等待你在 TG 里发 /code 123456
-        只接受来自 TG_CHAT_ID 的消息
-        """
-        if not self.ok:
-            return None
-        
-        # 先刷新 offset，避免读到旧的 /code
-        offset = self.flush_updates()
-        deadline = time.time() + timeout
-        pattern = re.compile(r"^/code\s+(\d{6,8})$")  # 6位TOTP 或 8位恢复码也行
-        
-        while time.time() < deadline:
-            try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
-                    params={"timeout": 20, "offset": offset},
-                    timeout=30
-                )
-                data = r.json()
-                if not data.get("ok"):
-                    time.sleep(2)
-                    continue
-                
-                for upd in data.get("result", []):
-                    offset = upd["update_id"] + 1
-                    msg = upd.get("message") or {}
-                    chat = msg.get("chat") or {}
-                    if str(chat.get("id")) != str(self.chat_id):
-                        continue
-                    
-                    text = (msg.get("text") or "").strip()
-                    m = pattern.match(text)
-                    if m:
-                        return m.group(1)
-            
-            except Exception:
-                pass
-            
-            time.sleep(2)
-        
-        return None
-
+# 登录页上的 GitHub 按钮（Playwright 选择器列表）
+GITHUB_BUTTON = 'button:has-text("GitHub"), a:has-text("GitHub"), [data-provider="github"]'
 
 class SecretUpdater:
     """GitHub Secret 更新器"""
@@ -137,37 +57,7 @@ class SecretUpdater:
     def update(self, name, value):
         if not self.ok:
             return False
-        try:
-            from nacl import encoding, public
-            
-            headers = {
-                "Authorization": f"token {self.token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            # 获取公钥
-            r = requests.get(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
-                headers=headers, timeout=30
-            )
-            if r.status_code != 200:
-                return False
-            
-            key_data = r.json()
-            pk = public.PublicKey(key_data['key'].encode(), encoding.Base64Encoder())
-            encrypted = public.SealedBox(pk).encrypt(value.encode())
-            
-            # 更新 Secret
-            r = requests.put(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
-                headers=headers,
-                json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_data['key_id']},
-                timeout=30
-            )
-            return r.status_code in [201, 204]
-        except Exception as e:
-            print(f"更新 Secret 失败: {e}")
-            return False
+        return write_secret(name, value)
 
 
 class AutoLogin:
@@ -178,11 +68,21 @@ class AutoLogin:
         self.username = os.environ.get('GH_USERNAME')
         self.password = os.environ.get('GH_PASSWORD')
         self.gh_session = os.environ.get('GH_SESSION', '').strip()
-        self.totp_secret = os.environ.get("GH_2FA_SECRET")
         self.tg = Telegram()
         self.secret = SecretUpdater()
+        self.steps = StepTimer("clawcloud", self.username)
+        # GitHub 登录 / 校验 / GH_SESSION 回写统一交给身份代理
+        self.github = GitHubIdentity(
+            username=self.username,
+            password=self.password,
+            tg=self.tg,
+            log=self.log,
+            shot=self.shot,
+            save_secret=self.secret.update,
+        )
         self.shots = []
         self.logs = []
+        self.proxy_ranking = []  # [(server, latency, ip_text)]，按延迟排序
         self.n = 0
         
         # 区域相关
@@ -192,7 +92,9 @@ class AutoLogin:
     def log(self, msg, level="INFO"):
         icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
         line = f"{icons.get(level, '•')} {msg}"
-        print(line)
+        if level == "STEP":
+            self.steps.mark(msg)
+        print(scope.tag(line))
         self.logs.append(line)
     
     def shot(self, page, name):
@@ -205,17 +107,17 @@ class AutoLogin:
             pass
         return f
     
-    def click(self, page, sels, desc=""):
-        for s in sels:
-            try:
-                el = page.locator(s).first
-                if el.is_visible(timeout=3000):
-                    el.click()
-                    self.log(f"已点击: {desc}", "SUCCESS")
-                    return True
-            except:
-                pass
-        return False
+    def click(self, page, sels, desc="", timeout=5):
+        # 所有候选同时等待，胜出的选择器下次优先
+        el, _ = race(page, sels, f"click:{desc}", timeout, log=self.log)
+        if not el:
+            return False
+        try:
+            el.click()
+            self.log(f"已点击: {desc}", "SUCCESS")
+            return True
+        except:
+            return False
     
     def detect_region(self, url):
         """
@@ -265,313 +167,15 @@ class AutoLogin:
             return self.region_base_url
         return LOGIN_ENTRY_URL
     
-    def get_session(self, context):
-        """提取 Session Cookie"""
-        try:
-            for c in context.cookies():
-                if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
-                    return c['value']
-        except:
-            pass
-        return None
-    
-    def save_cookie(self, value):
-        """保存新 Cookie"""
-        if not value:
-            return
-        
-        self.log(f"新 Cookie: {value[:15]}...{value[-8:]}", "SUCCESS")
-        
-        # 自动更新 Secret
-        if self.secret.update('GH_SESSION', value):
-            self.log("已自动更新 GH_SESSION", "SUCCESS")
-            self.tg.send("🔑 <b>Cookie 已自动更新</b>\n\nGH_SESSION 已保存")
-        else:
-            # 通过 Telegram 发送
-            self.tg.send(f"""🔑 <b>新 Cookie</b>
-
-请更新 Secret <b>GH_SESSION</b>:
-<code>{value}</code>""")
-            self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
-    
-    def wait_device(self, page):
-        """等待设备验证"""
-        self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
-        self.shot(page, "设备验证")
-        
-        self.tg.send(f"""⚠️ <b>需要设备验证</b>
-
-请在 {DEVICE_VERIFY_WAIT} 秒内批准：
-1️⃣ 检查邮箱点击链接
-2️⃣ 或在 GitHub App 批准""")
-        
-        if self.shots:
-            self.tg.photo(self.shots[-1], "设备验证页面")
-        
-        for i in range(DEVICE_VERIFY_WAIT):
-            time.sleep(1)
-            if i % 5 == 0:
-                self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)")
-                url = page.url
-                if 'verified-device' not in url and 'device-verification' not in url:
-                    self.log("设备验证通过！", "SUCCESS")
-                    self.tg.send("✅ <b>设备验证通过</b>")
-                    return True
-                try:
-                    page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
-                except:
-                    pass
-        
-        if 'verified-device' not in page.url:
-            return True
-        
-        self.log("设备验证超时", "ERROR")
-        self.tg.send("❌ <b>设备验证超时</b>")
-        return False
-    
-    def wait_two_factor_mobile(self, page):
-        """等待 GitHub Mobile 两步验证批准，并把数字截图提前发到电报"""
-        self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
-        
-        # 先截图并立刻发出去（让你看到数字）
-        shot = self.shot(page, "两步验证_mobile")
-        self.tg.send(f"""⚠️ <b>需要两步验证（GitHub Mobile）</b>
-
-请打开手机 GitHub App 批准本次登录（会让你确认一个数字）。
-等待时间：{TWO_FACTOR_WAIT} 秒""")
-        if shot:
-            self.tg.photo(shot, "两步验证页面（数字在图里）")
-        
-        # 不要频繁 reload，避免把流程刷回登录页
-        for i in range(TWO_FACTOR_WAIT):
-            time.sleep(1)
-            
-            url = page.url
-            
-            # 如果离开 two-factor 流程页面，认为通过
-            if "github.com/sessions/two-factor/" not in url:
-                self.log("两步验证通过！", "SUCCESS")
-                self.tg.send("✅ <b>两步验证通过</b>")
-                return True
-            
-            # 如果被刷回登录页，说明这次流程断了（不要硬等）
-            if "github.com/login" in url:
-                self.log("两步验证后回到了登录页，需重新登录", "ERROR")
-                return False
-            
-            # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
-            if i % 10 == 0 and i != 0:
-                self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
-                shot = self.shot(page, f"两步验证_{i}s")
-                if shot:
-                    self.tg.photo(shot, f"两步验证页面（第{i}秒）")
-            
-            # 只在 30 秒、60 秒... 做一次轻刷新（可选，频率很低）
-            if i % 30 == 0 and i != 0:
-                try:
-                    page.reload(timeout=30000)
-                    page.wait_for_load_state('domcontentloaded', timeout=30000)
-                except:
-                    pass
-        
-        self.log("两步验证超时", "ERROR")
-        self.tg.send("❌ <b>两步验证超时</b>")
-        return False
-    
-    def handle_2fa_code_input(self, page):
-        """处理 TOTP 验证码输入（通过 Telegram 发送 /code 123456）"""
-        self.log("需要输入验证码", "WARN")
-        shot = self.shot(page, "两步验证_code")
-        
-        # 先尝试点击"Use an authentication app"或类似按钮（如果在 mobile 页面）
-        try:
-            more_options = [
-                'a:has-text("Use an authentication app")',
-                'a:has-text("Enter a code")',
-                'button:has-text("Use an authentication app")',
-                '[href*="two-factor/app"]'
-            ]
-            for sel in more_options:
-                try:
-                    el = page.locator(sel).first
-                    if el.is_visible(timeout=2000):
-                        el.click()
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
-                        self.log("已切换到验证码输入页面", "SUCCESS")
-                        shot = self.shot(page, "两步验证_code_切换后")
-                        break
-                except:
-                    pass
-        except:
-            pass
-        if shot:
-            self.tg.photo(shot, "两步验证页面")
-        # 首选计算验证码
-        self.log("🔢 正在计算动态验证码 (TOTP)...")
-        # 使用密钥生成当前的 6 位验证码
-        totp = pyotp.TOTP(self.totp_secret)
-        code = totp.now()
-        
-      
-        if not code:
-            self.log("生成的验证码超时", "ERROR")
-            self.tg.send("❌ <b>计算验证码超时，手动输入验证码</b>")
-
-        
-
-            # 发送提示并等待验证码
-            self.tg.send(f"""🔐 <b>需要验证码登录</b>
-    
-    请在 Telegram 里发送：
-    <code>/code 你的6位验证码</code>
-    
-    等待时间：{TWO_FACTOR_WAIT} 秒""")
-        
-        
-            self.log(f"等待验证码（{TWO_FACTOR_WAIT}秒）...", "WARN")
-            code = self.tg.wait_code(timeout=TWO_FACTOR_WAIT)
-        if not code:
-            self.log("等待验证码超时", "ERROR")
-            self.tg.send("❌ <b>等待验证码超时</b>")
-            return False
-
-                # 不打印验证码明文，只提示收到
-        self.log(f"   获取到验证码: {code}，正在填入...", "SUCCESS")
-        
-        # 常见 OTP 输入框 selector（优先级排序）
-        selectors = [
-            'input[autocomplete="one-time-code"]',
-            'input[name="app_otp"]',
-            'input[name="otp"]',
-            'input#app_totp',
-            'input#otp',
-            'input[inputmode="numeric"]'
-        ]
-        
-        for sel in selectors:
-            try:
-                el = page.locator(sel).first
-                if el.is_visible(timeout=2000):
-                    el.fill(code)
-                    self.log(f"已填入验证码", "SUCCESS")
-                    time.sleep(1)
-                    
-                    # 优先点击 Verify 按钮，不行再 Enter
-                    submitted = False
-                    verify_btns = [
-                        'button:has-text("Verify")',
-                        'button[type="submit"]',
-                        'input[type="submit"]'
-                    ]
-                    for btn_sel in verify_btns:
-                        try:
-                            btn = page.locator(btn_sel).first
-                            if btn.is_visible(timeout=1000):
-                                btn.click()
-                                submitted = True
-                                self.log("已点击 Verify 按钮", "SUCCESS")
-                                break
-                        except:
-                            pass
-                    
-                    if not submitted:
-                        page.keyboard.press("Enter")
-                        self.log("已按 Enter 提交", "SUCCESS")
-                    
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=60000)
-                    self.shot(page, "验证码提交后")
-                    
-                    # 检查是否通过
-                    if "github.com/sessions/two-factor/" not in page.url:
-                        self.log("验证码验证通过！", "SUCCESS")
-                        self.tg.send("✅ <b>验证码验证通过</b>")
-                        return True
-                    else:
-                        self.log("验证码可能错误", "ERROR")
-                        self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
-                        return False
-            except:
-                pass
-        
-        self.log("没找到验证码输入框", "ERROR")
-        self.tg.send("❌ <b>没找到验证码输入框</b>")
-        return False
+    def timing(self, start_ts):
+        """耗时行，附带选择器解析耗时"""
+        text = f"耗时:{time.time() - start_ts:.1f}s"
+        report = locate_summary()
+        return f"{text}\n{report}" if report else text
     
     def login_github(self, page, context):
-        """登录 GitHub"""
-        self.log("登录 GitHub...", "STEP")
-        self.shot(page, "github_登录页")
-        
-        try:
-            page.locator('input[name="login"]').fill(self.username)
-            page.locator('input[name="password"]').fill(self.password)
-            self.log("已输入凭据")
-        except Exception as e:
-            self.log(f"输入失败: {e}", "ERROR")
-            return False
-        
-        self.shot(page, "github_已填写")
-        
-        try:
-            page.locator('input[type="submit"], button[type="submit"]').first.click()
-        except:
-            pass
-        
-        time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
-        self.shot(page, "github_登录后")
-        
-        url = page.url
-        self.log(f"当前: {url}")
-        
-        # 设备验证
-        if 'verified-device' in url or 'device-verification' in url:
-            if not self.wait_device(page):
-                return False
-            time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
-            self.shot(page, "验证后")
-        
-        # 2FA
-        if 'two-factor' in page.url:
-            self.log("需要两步验证！", "WARN")
-            self.shot(page, "两步验证")
-            
-            # GitHub Mobile：等待你在手机上批准
-            if 'two-factor/mobile' in page.url:
-                if not self.wait_two_factor_mobile(page):
-                    return False
-                # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
-            
-            else:
-                # 其它两步验证方式（TOTP/恢复码等），尝试通过 Telegram 输入验证码
-                if not self.handle_2fa_code_input(page):
-                    return False
-                # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
-        
-        # 错误
-        try:
-            err = page.locator('.flash-error').first
-            if err.is_visible(timeout=2000):
-                self.log(f"错误: {err.inner_text()}", "ERROR")
-                return False
-        except:
-            pass
-        
-        return True
+        """登录 GitHub（交给共享的 GitHub 身份代理）"""
+        return self.github.login(page, context)
     
     def oauth(self, page):
         """处理 OAuth"""
@@ -579,17 +183,30 @@ class AutoLogin:
             self.log("处理 OAuth...", "STEP")
             self.shot(page, "oauth")
             self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
-            time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            wait_url(page, lambda url: 'github.com/login/oauth/authorize' not in url, 30)
     
     def wait_redirect(self, page, wait=60):
-        """等待重定向并检测区域"""
+        """等待重定向并检测区域（导航事件驱动）"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
-            url = page.url
-            
+        deadline = time.time() + wait
+        
+        def arrived(url):
             # 检查是否已跳转到 claw.cloud
-            if 'claw.cloud' in url and 'signin' not in url.lower():
+            return 'claw.cloud' in url and 'signin' not in url.lower()
+        
+        while time.time() < deadline:
+            hit = wait_url(
+                page,
+                lambda url: arrived(url) or 'github.com/login/oauth/authorize' in url,
+                deadline - time.time(),
+                tick=10,
+                on_tick=lambda sec: self.log(f"  等待... ({sec}秒)")
+            )
+            if not hit:
+                break
+            
+            url = page.url
+            if arrived(url):
                 self.log("重定向成功！", "SUCCESS")
                 
                 # 检测并记录区域
@@ -597,12 +214,7 @@ class AutoLogin:
                 
                 return True
             
-            if 'github.com/login/oauth/authorize' in url:
-                self.oauth(page)
-            
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+            self.oauth(page)
         
         self.log("重定向超时", "ERROR")
         return False
@@ -627,21 +239,20 @@ class AutoLogin:
         for url, name in pages_to_visit:
             try:
                 page.goto(url, timeout=30000)
-                page.wait_for_load_state('networkidle', timeout=15000)
+                settle(page)
                 self.log(f"已访问: {name} ({url})", "SUCCESS")
                 
                 # 再次检测区域（以防中途跳转）
                 current_url = page.url
                 if 'claw.cloud' in current_url:
                     self.detect_region(current_url)
-                
-                time.sleep(2)
             except Exception as e:
                 self.log(f"访问 {name} 失败: {e}", "WARN")
         
         self.shot(page, "完成")
     
     def notify(self, ok, err=""):
+        self.steps.finish("ok" if ok else "fail")
         if not self.tg.ok:
             return
         
@@ -668,93 +279,58 @@ class AutoLogin:
                 self.tg.photo(self.shots[-1], "完成")
     def pick_available_proxy(self, timeout=10):
         """
-        使用 requests 轮询代理
-        返回 (proxy_server | None, msg)
+        并发探测所有代理，按延迟排序
+        返回 (最快的 proxy_server | None, msg)，完整排名存在 self.proxy_ranking 供故障切换
         """
     
         if not self.server:
             self.log("未提供代理列表，使用直连", "INFO")
             return None, "未配置代理，跳过代理检测"
     
-        proxies_list = [p.strip() for p in self.server.split(",") if p.strip()]
-        self.log(f"🔁 开始轮询代理（共 {len(proxies_list)} 个）", "STEP")
+        proxies_list = parse_proxies(self.server)
+        self.log(f"🔁 并发探测代理（共 {len(proxies_list)} 个）", "STEP")
     
-        test_url = "https://myip.ipip.net"
-        headers = {
-            "User-Agent": "Mozilla/5.0"
-        }
+        self.proxy_ranking = rank_proxies(
+            proxies_list,
+            timeout=timeout,
+            log=lambda m: self.log(m, "INFO")
+        )
     
-        for idx, server in enumerate(proxies_list, 1):
-            # 自动补协议
-            if not server.startswith(("http://", "https://", "socks5://")):
-                server = f"http://{server}"
-    
-            proxy_cfg = {
-                "http": server,
-                "https": server,
-            }
-    
-            self.log(f"🌐 测试代理 {idx}/{len(proxies_list)}: {server}", "INFO")
-    
-            try:
-                resp = requests.get(
-                    test_url,
-                    proxies=proxy_cfg,
-                    headers=headers,
-                    timeout=timeout,
-                    verify=False,          # 防止代理 https 证书问题
-                    allow_redirects=True
-                )
-    
-                if resp.status_code == 200 and resp.text.strip():
-                    ip_text = resp.text.strip()
-                    self.log(f"代理可用: {ip_text}", "SUCCESS")
-                    return server, f"当前 IP : {ip_text}"
-    
-                self.log(f"⚠️ 响应异常: HTTP {resp.status_code}", "WARN")
-    
-            except RequestException as e:
-                self.log(f"❌ 代理失败: {repr(e)}", "WARN")
+        if self.proxy_ranking:
+            server, latency, ip_text = self.proxy_ranking[0]
+            self.log(f"代理可用: {server}（{latency * 1000:.0f}ms）{ip_text}", "SUCCESS")
+            return server, f"当前 IP : {ip_text}"
     
         self.log("🚫 所有代理均不可用，将使用直连", "WARN")
         return None, "🚫 所有代理均不可用，将使用直连"
         
-    def detect_proxy_available(self):
+    def open_signin(self, browser, context, page, context_args):
         """
-        检测代理是否可用
-        成功返回 True，失败返回 False
+        打开登录页；走代理打不开时记一次失败，按 self.proxy_ranking 换下一个代理重建 context，
+        都不行最后直连。返回 (context, page)
         """
-        if not self.server:
-            self.log("未配置代理，跳过代理检测", "INFO")
-            return False,"未配置代理，跳过代理检测"
-    
-        self.log("🔍 检测代理可用性...", "STEP")
-
-
-        try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox'],
-                    proxy={"server": self.server}
-                )
-                context = browser.new_context()
+        current = (context_args.get("proxy") or {}).get("server")
+        backups = [s for s, _, _ in self.proxy_ranking if s != current] + [None] if current else []
+        while True:
+            try:
+                page.goto(SIGNIN_URL, timeout=60000)
+                if current:
+                    record_result(current, True)
+                return context, page
+            except Exception as e:
+                if not current:
+                    raise
+                record_result(current, False)
+                current = backups.pop(0)
+                self.log(f"代理打不开登录页（{e}），切换到 {current or '直连'}", "WARN")
+                context.close()
+                if current:
+                    context_args["proxy"] = {"server": current}
+                else:
+                    context_args.pop("proxy", None)
+                context = self.github.new_context(browser, **context_args)
                 page = context.new_page()
-    
-                page.goto("https://myip.ipip.net", timeout=20000)
-                page.wait_for_load_state("domcontentloaded", timeout=20000)
-    
-                ip_text = page.text_content("body") or ""
-                self.log(f"🌐 当前 IP : {ip_text.strip()}", "SUCCESS")
-                
-    
-                browser.close()
-                return True,f"当前 IP : {ip_text.strip()}"
-    
-        except Exception as e:
-            self.log(f"代理不可用: {e}", "WARN")
-            return False,f"❌代理不可用: {e}"
-            
+
     def run(self):
         start_ts = time.time()
         level = STATUS_OK
@@ -777,61 +353,61 @@ class AutoLogin:
             self.notify(False, "凭据未配置")
             sys.exit(1)
         
-        with sync_playwright() as p:
+        # 代理探测 / 出口 IP 检测都和浏览器启动并行
+        proxy_future = run_background(self.pick_available_proxy) if self.server else None
+        egress = detect_egress_ip_async()
+
+        with browser_scope() as launch:
             use_proxy = False
 
-            if self.server:
-                proxy_cfg,proxy_msg=self.pick_available_proxy()
+            browser = launch(
+                headless=True,
+                args=['--no-sandbox']
+            )
+            context_args = dict(
+                viewport={'width': 1920, 'height': 1080},
+                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+            )
+
+            if proxy_future:
+                proxy_cfg,proxy_msg=proxy_future.result()
                 
                 if proxy_cfg:
                     use_proxy = True
                     self.log(proxy_msg, "SUCCESS")
                     tg_lines.append(proxy_msg)
+                    context_args["proxy"] = {"server": proxy_cfg}
                     
                 else:
                     self.log(f"❌ {proxy_msg}，已自动切换为直连", "WARN")
                     self.server = None
             
-            launch_args = dict(
-                headless=True,
-                args=['--no-sandbox']
-            )
-            
-            if use_proxy:
-                launch_args["proxy"] = {"server": proxy_cfg}
-            
-            browser = p.chromium.launch(**launch_args)
-            context = browser.new_context(
-                viewport={'width': 1920, 'height': 1080},
-                user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            )
+            context = self.github.new_context(browser, **context_args)
             page = context.new_page()
             
 
             try:
                 if not use_proxy:
-                    page.goto("https://myip.ipip.net", timeout=20000)
-                    page.wait_for_load_state("domcontentloaded", timeout=20000)
-        
-                    ip_text = page.text_content("body") or ""
-                    self.log(f"🌐 当前 IP: {ip_text.strip()}")
-                    tg_lines.append(f"🌐 当前 IP: {ip_text.strip()}")
-                # 预加载 Cookie
-                if self.gh_session:
+                    # 浏览器启动期间已在后台检测
                     try:
-                        context.add_cookies([
-                            {'name': 'user_session', 'value': self.gh_session, 'domain': 'github.com', 'path': '/'},
-                            {'name': 'logged_in', 'value': 'yes', 'domain': 'github.com', 'path': '/'}
-                        ])
-                        self.log("已加载 Session Cookie", "SUCCESS")
-                    except:
-                        self.log("加载 Cookie 失败", "WARN")
+                        ok, ip_text = egress.result(timeout=20)
+                    except Exception as e:
+                        ok, ip_text = False, repr(e)
+                    if ok:
+                        self.log(f"🌐 当前 IP: {ip_text}")
+                        tg_lines.append(f"🌐 当前 IP: {ip_text}")
+                    else:
+                        self.log(f"出口 IP 检测失败: {ip_text}", "WARN")
                 
                 # 1. 访问 ClawCloud 登录入口
                 self.log("步骤1: 打开 ClawCloud 登录页", "STEP")
-                page.goto(SIGNIN_URL, timeout=60000)
-                page.wait_for_load_state('networkidle', timeout=30000)
-                time.sleep(2)
+                context, page = self.open_signin(browser, context, page, context_args)
+                # 已登录会自动跳到控制台；否则等 GitHub 按钮出现
+                wait_until(
+                    lambda: 'signin' not in page.url.lower()
+                    or page.locator(GITHUB_BUTTON).first.is_visible(),
+                    30, page=page
+                )
                 self.shot(page, "clawcloud")
                 
                 # 检查当前 URL，可能已经自动跳转到区域
@@ -844,9 +420,7 @@ class AutoLogin:
                     self.detect_region(current_url)
                     self.keepalive(page)
                     # 提取并保存新 Cookie
-                    new = self.get_session(context)
-                    if new:
-                        self.save_cookie(new)
+                    self.github.persist(context)
                     self.notify(True)
                     print("\n✅ 成功！\n")
                     return
@@ -862,8 +436,13 @@ class AutoLogin:
                     self.notify(False, "找不到 GitHub 按钮")
                     sys.exit(1)
                 
-                time.sleep(3)
-                page.wait_for_load_state('networkidle', timeout=60000)
+                # 跳到 GitHub（或已授权直接回到 ClawCloud）即可
+                wait_url(
+                    page,
+                    lambda url: 'github.com' in url or ('claw.cloud' in url and 'signin' not in url.lower()),
+                    60
+                )
+                settle(page)
                 self.shot(page, "点击后")
                 
                 url = page.url
@@ -908,11 +487,7 @@ class AutoLogin:
                 
                 # 7. 提取并保存新 Cookie
                 self.log("步骤6: 更新 Cookie", "STEP")
-                new = self.get_session(context)
-                if new:
-                    self.save_cookie(new)
-                else:
-                    self.log("未获取到新 Cookie", "WARN")
+                self.github.persist(context)
                 
                 self.notify(True)
                 print("\n" + "="*50)
@@ -923,7 +498,7 @@ class AutoLogin:
 
                 msgtemp = "\n".join(tg_lines)
                 self.tg.send(
-                        f"ClawCloud 自动登录\n\n{msgtemp}\n\n状态:{level}\n耗时:{time.time() - start_ts:.1f}s"
+                        f"ClawCloud 自动登录\n\n{msgtemp}\n\n状态:{level}\n{self.timing(start_ts)}"
                     )
 
             
@@ -934,9 +509,7 @@ class AutoLogin:
                 traceback.print_exc()
                 self.notify(False, str(e))
                 sys.exit(1)
-            finally:
-                browser.close()
 
 
 if __name__ == "__main__":
-    AutoLogin().run()
+    profiled(lambda: AutoLogin().run(), "clawcloud")
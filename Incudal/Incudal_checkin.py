@@ -9,19 +9,37 @@ Incudal 自动登录脚本
 import os
 import sys
 import time
-import base64
-import re
 import json
 import requests
-from requests.exceptions import RequestException
-import pyotp  # 用于生成 2FA 验证码
 from urllib.parse import urlparse
-from playwright.sync_api import sync_playwright
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.auth_token import (
+    inspect_session,
+    record_session,
+    mark_invalid,
+    needs_refresh,
+    describe,
+)
+from engine.http_pool import mount_paced, run_concurrent
+from engine.waits import wait_url, wait_until, wait_selector, settle
+from engine.locate import race, summary as locate_summary
+from engine.github_identity import GitHubIdentity
+from engine.browser import browser_scope
+from engine.secret_writer import write_secret
+from engine.history import StepTimer, track_http
+from engine.telegram_bot import Telegram
+from engine.profiling import profiled
+from engine.state import open_state, default_account
+from engine import scope
+from engine.proxy import (
+    parse_proxies,
+    rank_proxies,
+    detect_egress_ip_async,
+)
 # ====================== 基础配置 ======================
-tg_lines = [
-    f"📅 日期：{time.strftime('%Y-%m-%d')}",
-    "🖥 GitHub Actions",
-]
 INSTANCE_IDS = {"greenwave1987":[1223, 753],"jdtaxi":[2013]}
 
 TARGET_URL = "https://incudal.com"
@@ -29,7 +47,6 @@ SIGNIN_URL = f"{TARGET_URL}/login"
 CONSOLE_URL = "https://incudal.com/console"
 
 TIMEOUT = 15
-DELAY = 1
 
 STATUS_OK = "OK"
 STATUS_PARTIAL = "PARTIAL"
@@ -37,104 +54,13 @@ STATUS_FAIL = "FAIL"
 
 ##IN_ENTRY_URL = "https://console.run.claw.cloud"
 ##SIGNIN_URL = f"{IN_ENTRY_URL}/signin"
-DEVICE_VERIFY_WAIT = 30  # Mobile验证 默认等 30 秒
-TWO_FACTOR_WAIT = int(os.environ.get("TWO_FACTOR_WAIT", "120"))  # 2FA验证 默认等 120 秒
 
+# 登录页上的 GitHub 按钮（Playwright 选择器列表）
+GITHUB_BUTTON = 'button:has-text("GitHub"), a:has-text("GitHub"), [data-provider="github"]'
 
-class Telegram:
-    """Telegram 通知"""
-    
-    def __init__(self):
-        self.token = os.environ.get('TG_BOT_TOKEN')
-        self.chat_id = os.environ.get('TG_CHAT_ID')
-        self.ok = bool(self.token and self.chat_id)
-    
-    def send(self, msg):
-        if not self.ok:
-            return
-        try:
-            requests.post(
-                f"https://api.telegram.org/bot{self.token}/sendMessage",
-                data={"chat_id": self.chat_id, "text": msg, "parse_mode": "HTML"},
-                timeout=30
-            )
-        except:
-            pass
-    
-    def photo(self, path, caption=""):
-        if not self.ok or not os.path.exists(path):
-            return
-        try:
-            with open(path, 'rb') as f:
-                requests.post(
-                    f"https://api.telegram.org/bot{self.token}/sendPhoto",
-                    data={"chat_id": self.chat_id, "caption": caption[:1024]},
-                    files={"photo": f},
-                    timeout=60
-                )
-        except:
-            pass
-    
-    def flush_updates(self):
-        """刷新 offset 到最新，避免读到旧消息"""
-        if not self.ok:
-            return 0
-        try:
-            r = requests.get(
-                f"https://api.telegram.org/bot{self.token}/getUpdates",
-                params={"timeout": 0},
-                timeout=10
-            )
-            data = r.json()
-            if data.get("ok") and data.get("result"):
-                return data["result"][-1]["update_id"] + 1
-        except:
-            pass
-        return 0
-    
-    def wait_code(self, timeout=120):
-        """
-        等待你在 TG 里发 /code 123456
-        只接受来自 TG_CHAT_ID 的消息
-        """
-        if not self.ok:
-            return None
-        
-        # 先刷新 offset，避免读到旧的 /code
-        offset = self.flush_updates()
-        deadline = time.time() + timeout
-        pattern = re.compile(r"^/code\s+(\d{6,8})$")  # 6位TOTP 或 8位恢复码也行
-        
-        while time.time() < deadline:
-            try:
-                r = requests.get(
-                    f"https://api.telegram.org/bot{self.token}/getUpdates",
-                    params={"timeout": 20, "offset": offset},
-                    timeout=30
-                )
-                data = r.json()
-                if not data.get("ok"):
-                    time.sleep(2)
-                    continue
-                
-                for upd in data.get("result", []):
-                    offset = upd["update_id"] + 1
-                    msg = upd.get("message") or {}
-                    chat = msg.get("chat") or {}
-                    if str(chat.get("id")) != str(self.chat_id):
-                        continue
-                    
-                    text = (msg.get("text") or "").strip()
-                    m = pattern.match(text)
-                    if m:
-                        return m.group(1)
-            
-            except Exception:
-                pass
-            
-            time.sleep(2)
-        
-        return None
+
+class SessionExpired(Exception):
+    """USER_SESSION 被服务端拒绝（401）"""
 
 
 class SecretUpdater:
@@ -152,52 +78,38 @@ class SecretUpdater:
     def update(self, name, value):
         if not self.ok:
             return False
-        try:
-            from nacl import encoding, public
-            
-            headers = {
-                "Authorization": f"token {self.token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-            
-            # 获取公钥
-            r = requests.get(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/public-key",
-                headers=headers, timeout=30
-            )
-            if r.status_code != 200:
-                return False
-            
-            key_data = r.json()
-            pk = public.PublicKey(key_data['key'].encode(), encoding.Base64Encoder())
-            encrypted = public.SealedBox(pk).encrypt(value.encode())
-            
-            # 更新 Secret
-            r = requests.put(
-                f"https://api.github.com/repos/{self.repo}/actions/secrets/{name}",
-                headers=headers,
-                json={"encrypted_value": base64.b64encode(encrypted).decode(), "key_id": key_data['key_id']},
-                timeout=30
-            )
-            return r.status_code in [201, 204]
-        except Exception as e:
-            print(f"更新 Secret 失败: {e}")
-            return False
+        return write_secret(name, value)
 
 
 class AutoLogin:
     """自动登录"""
     
     def __init__(self):
-        self.server = os.environ.get('PROXY')
+        # 和兑换 / 创建脚本共用 INCUDAL_PROXY；未配置时浏览器直连
+        self.server = os.environ.get('INCUDAL_PROXY')
         self.username = os.environ.get('GH_USERNAME')
         self.password = os.environ.get('GH_PASSWORD')
         self.gh_session = os.environ.get('GH_SESSION', '').strip()
-        self.totp_secret = os.environ.get("GH_2FA_SECRET")
         self.tg = Telegram()
         self.secret = SecretUpdater()
+        self.steps = StepTimer("incudal", self.username)
+        # GitHub 登录 / 校验 / GH_SESSION 回写统一交给身份代理
+        self.github = GitHubIdentity(
+            username=self.username,
+            password=self.password,
+            tg=self.tg,
+            log=self.log,
+            shot=self.shot,
+            save_secret=self.secret.update,
+        )
         self.shots = []
         self.logs = []
+        # 本次运行的 TG 汇总；每个实例一份，同进程里多个账号 / 脚本互不串
+        self.tg_lines = [
+            f"📅 日期：{time.strftime('%Y-%m-%d')}",
+            "🖥 GitHub Actions",
+        ]
+        self.proxy_ranking = []  # [(server, latency, ip_text)]，按延迟排序
         self.s = []
         self.n = 0
         
@@ -208,7 +120,9 @@ class AutoLogin:
     def log(self, msg, level="INFO"):
         icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
         line = f"{icons.get(level, '•')} {msg}"
-        print(line, flush=True)
+        if level == "STEP":
+            self.steps.mark(msg)
+        print(scope.tag(line), flush=True)
         self.logs.append(line)
     
     def shot(self, page, name):
@@ -221,27 +135,23 @@ class AutoLogin:
             pass
         return f
     
-    def click(self, page, sels, desc=""):
-        for s in sels:
-            try:
-                el = page.locator(s).first
-                if el.is_visible(timeout=3000):
-                    el.click()
-                    self.log(f"已点击: {desc}", "SUCCESS")
-                    return True
-            except:
-                pass
-        return False
-    
-    def get_session(self, context):
-        """提取 Session Cookie"""
+    def click(self, page, sels, desc="", timeout=5):
+        # 所有候选同时等待，胜出的选择器下次优先
+        el, _ = race(page, sels, f"click:{desc}", timeout, log=self.log)
+        if not el:
+            return False
         try:
-            for c in context.cookies():
-                if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
-                    return c['value']
+            el.click()
+            self.log(f"已点击: {desc}", "SUCCESS")
+            return True
         except:
-            pass
-        return None
+            return False
+    
+    def timing(self, start_ts):
+        """耗时行，附带选择器解析耗时"""
+        text = f"耗时:{time.time() - start_ts:.1f}s"
+        report = locate_summary()
+        return f"{text}\n{report}" if report else text
     
     def save_user_cookie(self, value):
         """保存新 Cookie"""
@@ -252,6 +162,7 @@ class AutoLogin:
         
         # 自动更新 Secret
         if self.secret.update('USER_SESSION', value):
+            open_state().mark_exported("USER_SESSION")
             self.log("已自动更新 USER_SESSION", "SUCCESS")
             self.tg.send("🔑 <b>Cookie 已自动更新</b>\n\n USER_SESSION 已保存")
         else:
@@ -262,358 +173,9 @@ class AutoLogin:
 <code>{value}</code>""")
             self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
             
-    def save_github_cookie(self, value):
-        """保存新 Cookie"""
-        if not value:
-            return
-        
-        self.log(f"新 Cookie: {value[:15]}...{value[-8:]}", "SUCCESS")
-        
-        # 自动更新 Secret
-        if self.secret.update('GH_SESSION', value):
-            self.log("已自动更新 GH_SESSION", "SUCCESS")
-            self.tg.send("🔑 <b>Cookie 已自动更新</b>\n\nGH_SESSION 已保存")
-        else:
-            # 通过 Telegram 发送
-            self.tg.send(f"""🔑 <b>新 Cookie</b>
-
-请更新 Secret <b>GH_SESSION</b>:
-<code>{value}</code>""")
-            self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
-    
-    def wait_device(self, page):
-        """等待设备验证"""
-        self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
-        self.shot(page, "设备验证")
-        
-        self.tg.send(f"""⚠️ <b>需要设备验证</b>
-
-请在 {DEVICE_VERIFY_WAIT} 秒内批准：
-1️⃣ 检查邮箱点击链接
-2️⃣ 或在 GitHub App 批准""")
-        
-        if self.shots:
-            self.tg.photo(self.shots[-1], "设备验证页面")
-        
-        for i in range(DEVICE_VERIFY_WAIT):
-            time.sleep(1)
-            if i % 5 == 0:
-                self.log(f"  等待... ({i}/{DEVICE_VERIFY_WAIT}秒)")
-                url = page.url
-                if 'verified-device' not in url and 'device-verification' not in url:
-                    self.log("设备验证通过！", "SUCCESS")
-                    self.tg.send("✅ <b>设备验证通过</b>")
-                    return True
-                try:
-                    page.reload(timeout=10000)
-                    page.wait_for_load_state('networkidle', timeout=10000)
-                except:
-                    pass
-        
-        if all(x not in page.url for x in [
-            'device-verification',
-            'verified-device'
-        ]):
-            return True
-        
-        self.log("设备验证超时", "ERROR")
-        self.tg.send("❌ <b>设备验证超时</b>")
-        return False
-    def wait_two_factor_mobile(self, page):
-        """
-        完全不 reload 的 GitHub Mobile 2FA 等待
-        只被动观察 URL / DOM 变化
-        """
-        self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
-    
-        # 首次截图（立刻发，给你看数字）
-        shot = self.shot(page, "two_factor_mobile_init")
-        self.tg.send(
-            f"⚠️ <b>需要两步验证（GitHub Mobile）</b>\n\n"
-            f"请在手机 GitHub App 中批准本次登录\n"
-            f"⏳ 等待时间：{TWO_FACTOR_WAIT} 秒"
-        )
-        if shot:
-            self.tg.photo(shot, "两步验证页面（首次）")
-    
-        start_url = page.url
-        deadline = time.time() + TWO_FACTOR_WAIT
-        last_shot_at = 0
-    
-        while time.time() < deadline:
-            time.sleep(1)
-    
-            try:
-                url = page.url
-            except:
-                continue
-    
-            # ✅ 成功：离开 two-factor 流程
-            if "github.com/sessions/two-factor/" not in url:
-                self.log("两步验证通过！", "SUCCESS")
-                self.tg.send("✅ <b>两步验证通过</b>")
-                return True
-    
-            # ❌ 失败：被 GitHub 主动打回登录页
-            if "github.com/login" in url:
-                self.log("两步验证失败，被返回登录页", "ERROR")
-                self.tg.send("❌ <b>两步验证失败，需要重新登录</b>")
-                return False
-    
-            # 📸 每 10 秒补一张截图（不触发任何请求）
-            now = time.time()
-            if now - last_shot_at >= 10:
-                last_shot_at = now
-                sec = int(TWO_FACTOR_WAIT - (deadline - now))
-                self.log(f"  等待中... ({sec}/{TWO_FACTOR_WAIT} 秒)")
-                shot = self.shot(page, f"two_factor_mobile_{sec}s")
-                if shot:
-                    self.tg.photo(shot, f"两步验证页面（{sec}s）")
-    
-        # ⏰ 超时
-        self.log("两步验证超时", "ERROR")
-        self.tg.send("❌ <b>两步验证超时</b>")
-        return False
-
-    def jwait_two_factor_mobile(self, page):
-        """等待 GitHub Mobile 两步验证批准，并把数字截图提前发到电报"""
-        self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
-        
-        # 先截图并立刻发出去（让你看到数字）
-        shot = self.shot(page, "两步验证_mobile")
-        self.tg.send(f"""⚠️ <b>需要两步验证（GitHub Mobile）</b>
-
-请打开手机 GitHub App 批准本次登录（会让你确认一个数字）。
-等待时间：{TWO_FACTOR_WAIT} 秒""")
-        if shot:
-            self.tg.photo(shot, "两步验证页面（数字在图里）")
-        
-        # 不要频繁 reload，避免把流程刷回登录页
-        for i in range(TWO_FACTOR_WAIT):
-            time.sleep(1)
-            
-            url = page.url
-            
-            # 如果离开 two-factor 流程页面，认为通过
-            if "github.com/sessions/two-factor/" not in url:
-                self.log("两步验证通过！", "SUCCESS")
-                self.tg.send("✅ <b>两步验证通过</b>")
-                return True
-            
-            # 如果被刷回登录页，说明这次流程断了（不要硬等）
-            if "github.com/login" in url:
-                self.log("两步验证后回到了登录页，需重新登录", "ERROR")
-                return False
-            
-            # 每 10 秒打印一次，并补发一次截图（防止你没看到数字）
-            if i % 10 == 0 and i != 0:
-                self.log(f"  等待... ({i}/{TWO_FACTOR_WAIT}秒)")
-                shot = self.shot(page, f"两步验证_{i}s")
-                if shot:
-                    self.tg.photo(shot, f"两步验证页面（第{i}秒）")
-            
-            # 只在 30 秒、60 秒... 做一次轻刷新（可选，频率很低）
-            if i % 30 == 0 and i != 0:
-                try:
-                    page.reload(timeout=30000)
-                    page.wait_for_load_state('domcontentloaded', timeout=30000)
-                except:
-                    pass
-        
-        self.log("两步验证超时", "ERROR")
-        self.tg.send("❌ <b>两步验证超时</b>")
-        return False
-    
-    def handle_2fa_code_input(self, page):
-        """处理 TOTP 验证码输入（通过 Telegram 发送 /code 123456）"""
-        self.log("需要输入验证码", "WARN")
-        shot = self.shot(page, "两步验证_code")
-        
-        # 先尝试点击"Use an authentication app"或类似按钮（如果在 mobile 页面）
-        try:
-            more_options = [
-                'a:has-text("Use an authentication app")',
-                'a:has-text("Enter a code")',
-                'button:has-text("Use an authentication app")',
-                '[href*="two-factor/app"]'
-            ]
-            for sel in more_options:
-                try:
-                    el = page.locator(sel).first
-                    if el.is_visible(timeout=2000):
-                        el.click()
-                        time.sleep(2)
-                        page.wait_for_load_state('networkidle', timeout=15000)
-                        self.log("已切换到验证码输入页面", "SUCCESS")
-                        shot = self.shot(page, "两步验证_code_切换后")
-                        break
-                except:
-                    pass
-        except:
-            pass
-        if shot:
-            self.tg.photo(shot, "两步验证页面")
-        # 首选计算验证码
-        self.log("🔢 正在计算动态验证码 (TOTP)...")
-        # 使用密钥生成当前的 6 位验证码
-        totp = pyotp.TOTP(self.totp_secret)
-        code = None
-        
-        if self.totp_secret:
-            try:
-                code = totp.now()
-                self.log("已生成 TOTP 验证码", "SUCCESS")
-            except Exception:
-                code = None
-        
-        if not code:
-            self.log("需要手动输入验证码", "WARN")
-            self.tg.send(
-                f"🔐 <b>需要验证码登录</b>\n\n"
-                f"请发送：<code>/code 123456</code>\n"
-                f"等待 {TWO_FACTOR_WAIT} 秒"
-            )
-            code = self.tg.wait_code(timeout=TWO_FACTOR_WAIT)
-        
-        if not code:
-            self.log("验证码获取失败", "ERROR")
-            return False
-
-        # 不打印验证码明文，只提示收到
-        self.log(f"   获取到验证码: {code}，正在填入...", "SUCCESS")
-        
-        # 常见 OTP 输入框 selector（优先级排序）
-        selectors = [
-            'input[autocomplete="one-time-code"]',
-            'input[name="app_otp"]',
-            'input[name="otp"]',
-            'input#app_totp',
-            'input#otp',
-            'input[inputmode="numeric"]'
-        ]
-        
-        for sel in selectors:
-            try:
-                el = page.locator(sel).first
-                if el.is_visible(timeout=2000):
-                    el.fill(code)
-                    self.log(f"已填入验证码", "SUCCESS")
-                    time.sleep(1)
-                    
-                    # 优先点击 Verify 按钮，不行再 Enter
-                    submitted = False
-                    verify_btns = [
-                        'button:has-text("Verify")',
-                        'button[type="submit"]',
-                        'input[type="submit"]'
-                    ]
-                    for btn_sel in verify_btns:
-                        try:
-                            btn = page.locator(btn_sel).first
-                            if btn.is_visible(timeout=1000):
-                                btn.click()
-                                submitted = True
-                                self.log("已点击 Verify 按钮", "SUCCESS")
-                                break
-                        except:
-                            pass
-                    
-                    if not submitted:
-                        page.keyboard.press("Enter")
-                        self.log("已按 Enter 提交", "SUCCESS")
-                    
-                    time.sleep(3)
-                    page.wait_for_load_state('networkidle', timeout=60000)
-                    self.shot(page, "验证码提交后")
-                    
-                    # 检查是否通过
-                    if "github.com/sessions/two-factor/" not in page.url:
-                        self.log("验证码验证通过！", "SUCCESS")
-                        self.tg.send("✅ <b>验证码验证通过</b>")
-                        return True
-                    else:
-                        self.log("验证码可能错误", "ERROR")
-                        self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
-                        return False
-            except:
-                pass
-        
-        self.log("没找到验证码输入框", "ERROR")
-        self.tg.send("❌ <b>没找到验证码输入框</b>")
-        return False
-    
     def login_github(self, page, context):
-        """登录 GitHub"""
-        self.log("登录 GitHub...", "STEP")
-        self.shot(page, "github_登录页")
-        
-        try:
-            page.locator('input[name="login"]').fill(self.username)
-            page.locator('input[name="password"]').fill(self.password)
-            self.log("已输入凭据")
-        except Exception as e:
-            self.log(f"输入失败: {e}", "ERROR")
-            return False
-        
-        self.shot(page, "github_已填写")
-        
-        try:
-            page.locator('input[type="submit"], button[type="submit"]').first.click()
-        except:
-            pass
-        
-        time.sleep(3)
-        page.wait_for_load_state('networkidle', timeout=30000)
-        self.shot(page, "github_登录后")
-        
-        url = page.url
-        self.log(f"当前: {url}")
-        
-        # 设备验证
-        if 'verified-device' in url or 'device-verification' in url:
-            if not self.wait_device(page):
-                return False
-            time.sleep(2)
-            page.wait_for_load_state('networkidle', timeout=30000)
-            self.shot(page, "验证后")
-        
-        # 2FA
-        if 'two-factor' in page.url:
-            self.log("需要两步验证！", "WARN")
-            self.shot(page, "两步验证")
-            
-            # GitHub Mobile：等待你在手机上批准
-            if 'two-factor/mobile' in page.url:
-                if not self.wait_two_factor_mobile(page):
-                    return False
-                # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
-            
-            else:
-                # 其它两步验证方式（TOTP/恢复码等），尝试通过 Telegram 输入验证码
-                if not self.handle_2fa_code_input(page):
-                    return False
-                # 通过后等页面稳定
-                try:
-                    page.wait_for_load_state('networkidle', timeout=30000)
-                    time.sleep(2)
-                except:
-                    pass
-        
-        # 错误
-        try:
-            err = page.locator('.flash-error').first
-            if err.is_visible(timeout=2000):
-                self.log(f"错误: {err.inner_text()}", "ERROR")
-                return False
-        except:
-            pass
-        
-        return True
+        """登录 GitHub（交给共享的 GitHub 身份代理）"""
+        return self.github.login(page, context)
     
     def oauth(self, page):
         """处理 OAuth"""
@@ -621,29 +183,37 @@ class AutoLogin:
             self.log("处理 OAuth...", "STEP")
             self.shot(page, "oauth")
             self.click(page, ['button[name="authorize"]', 'button:has-text("Authorize")'], "授权")
-            time.sleep(3)
-            page.wait_for_load_state('networkidle', timeout=30000)
+            wait_url(page, lambda url: 'github.com/login/oauth/authorize' not in url, 30)
     
     def wait_redirect(self, page, wait=60):
-        """等待重定向并检测区域"""
+        """等待重定向并检测区域（导航事件驱动）"""
         self.log("等待重定向...", "STEP")
-        for i in range(wait):
+        deadline = time.time() + wait
+        
+        def arrived(url):
+            # 检查是否已跳转到 incudal.com
+            return 'incudal' in url and 'login' not in url.lower()
+        
+        while time.time() < deadline:
+            hit = wait_url(
+                page,
+                lambda url: arrived(url) or 'github.com/login/oauth/authorize' in url,
+                deadline - time.time(),
+                tick=10,
+                on_tick=lambda sec: self.log(f"  等待... ({sec}秒)")
+            )
+            if not hit:
+                break
+            
             url = page.url
             u = urlparse(url)
             if u.hostname and u.hostname.count('.') >= 3:
                 self.detected_region = u.hostname.split('.')[0]
-            # 检查是否已跳转到 incudal.com
-            if 'incudal' in url and 'login' not in url.lower():
+            if arrived(url):
                 self.log("重定向成功！", "SUCCESS")
-                
                 return True
             
-            if 'github.com/login/oauth/authorize' in url:
-                self.oauth(page)
-            
-            time.sleep(1)
-            if i % 10 == 0:
-                self.log(f"  等待... ({i}秒)")
+            self.oauth(page)
         
         self.log("重定向超时", "ERROR")
         return False
@@ -688,6 +258,8 @@ class AutoLogin:
         })
         if auth:
             s.headers["authorization"] = auth
+        mount_paced(s)
+        track_http(s, "incudal", self.username)
         for c in cookies or []:
             s.cookies.set(
                 c["name"],
@@ -714,6 +286,8 @@ class AutoLogin:
             timeout=TIMEOUT
         )
         self.log(f"↩️ HTTP {resp.status_code}")
+        if resp.status_code == 401:
+            raise SessionExpired("GET /api/checkin/status 401")
         data=self.safe_json(resp)
         # 示例用法
         code_data = None  # 🔹 先初始化
@@ -726,7 +300,7 @@ class AutoLogin:
         
         if code_data:
             self.log(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")  # 输出: CPU +50%
-            tg_lines.append(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")
+            self.tg_lines.append(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")
         return data
     
     def checkin_and_get_code(self, session):
@@ -748,7 +322,7 @@ class AutoLogin:
         
         if code_data:
             self.log(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")  # 输出: CPU +50%
-            tg_lines.append(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")
+            self.tg_lines.append(f"🟢获得兑换码： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")
         return code_data.get("redeemCode") 
     
     def decode_redeem(self,code_type, code_value):
@@ -766,6 +340,10 @@ class AutoLogin:
         return f"{info['name']} +{code_value}{info['unit']}"
 
     def redeem_instance(self, session, redeem_code, instance_id):
+        """
+        在 run_concurrent 的工作线程里执行，返回 (data, TG 行)
+        TG 行由调用方按实例顺序写入 self.tg_lines，不在线程里直接追加
+        """
         self.log(f"🎁 兑换实例 {instance_id}")
         resp = session.post(
             "https://incudal.com/api/checkin/redeem",
@@ -777,10 +355,10 @@ class AutoLogin:
         data = self.safe_json(resp)
         if "details" in data:
             data["message"] = data["details"]
-            return data
+            return data, []
         elif "error" in data:
             data["message"] = data["error"]
-            return data
+            return data, []
         else:
             data["message"] = f"Unexpected response: {data}"
         # 示例用法
@@ -794,101 +372,129 @@ class AutoLogin:
         
         if code_data:
 
-            self.log(f"🟢兑换结果： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")  # 输出: CPU +50%
-            tg_lines.append(f"🟢兑换结果： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}")
-            return code_data
-        return data
+            line = f"🟢兑换结果： {self.decode_redeem(code_data['codeType'], code_data['codeValue'])}"
+            self.log(line)  # 输出: CPU +50%
+            return code_data, [line]
+        return data, []
+
+    def load_user_session(self):
+        """读取已有 USER_SESSION，缺失或格式错误返回 None"""
+        # 本地状态库里可能有比 secret 更新的（上次回写失败时）
+        data = open_state().load("USER_SESSION")
+        if not isinstance(data, dict):
+            return None
+        return data if data.get("auth_token") else None
+
+    def checkin_flow(self, session, start_ts):
+        """
+        签到 + 兑换（浏览器登录和 token 直连共用），返回状态等级
+        结果记到 self.outcome，run() 结束时按它收尾 StepTimer
+        """
+        level = self.checkin_and_redeem(session, start_ts)
+        self.outcome = "fail" if level == STATUS_FAIL else "ok"
+        return level
+
+    def checkin_and_redeem(self, session, start_ts):
+        status = self.get_status(session)
+
+        checked_in = status.get("hasCheckedIn", False)
+        redeemed = status.get("hasRedeemed", False)
+
+        redeem_code = None
+        if status.get("todayCode"):
+            redeem_code = status["todayCode"].get("redeemCode")
+
+        self.tg_lines.append(f"📊 初始状态：签到={checked_in}，兑换={redeemed}")
+
+        if not checked_in:
+            print("\n🎁 去签到！")
+            redeem_code = self.checkin_and_get_code(session)
+
+        if redeemed:
+            print("\n🎁 已兑换！")
+            self.tg_lines.append("🎉 今日已完成兑换")
+            msgtemp = "\n".join(self.tg_lines)
+
+            self.tg.send(
+                f"Incudal 自动签到完成\n\n{msgtemp}\n\n状态:{STATUS_OK}\n{self.timing(start_ts)}"
+            )
+            return STATUS_OK
+
+        if redeem_code:
+            self.tg_lines.append("\n🎁 <b>实例兑换结果</b>")
+            success = 0
+            level = STATUS_OK
+
+            # 所有实例并发兑换，共用一个连接池，只在 429/5xx 时退避
+            results = run_concurrent(
+                lambda iid: self.redeem_instance(session, redeem_code, iid),
+                INSTANCE_IDS[self.username]
+            )
+            for iid, result in results:
+                if isinstance(result, Exception):
+                    self.tg_lines.append(f"- {iid}：失败")
+                    level = STATUS_FAIL
+                    continue
+                data, lines = result
+                self.tg_lines.extend(lines)
+                if data.get("success") is True:
+                    self.tg_lines.append(f"- {iid}：成功")
+                    success += 1
+                else:
+                    self.tg_lines.append(f"- {iid}：{data.get('message','本次失败')}")
+                    level = STATUS_PARTIAL
+
+            if success == 0:
+                level = STATUS_FAIL
+            elif success < len(INSTANCE_IDS[self.username]):
+                level = STATUS_PARTIAL
+
+            msgtemp = "\n".join(self.tg_lines)
+
+            self.tg.send(
+                f"Incudal 自动签到完成\n\n{msgtemp}\n\n状态:{level}\n{self.timing(start_ts)}"
+            )
+            return level
+
+        self.tg_lines.append(f"❌ 未知错误，查看日志！")
+        return STATUS_FAIL
 
     def pick_available_proxy(self, timeout=10):
         """
-        使用 requests 轮询代理
-        返回 (proxy_server | None, msg)
+        并发探测所有代理，按延迟排序
+        返回 (最快的 proxy_server | None, msg)，完整排名存在 self.proxy_ranking 供故障切换
         """
     
         if not self.server:
             self.log("未提供代理列表，使用直连", "INFO")
             return None, "未配置代理，跳过代理检测"
     
-        proxies_list = [p.strip() for p in self.server.split(",") if p.strip()]
-        self.log(f"🔁 开始轮询代理（共 {len(proxies_list)} 个）", "STEP")
-    
-        test_url = "https://myip.ipip.net"
-        headers = {
-            "User-Agent": "Mozilla/5.0"
-        }
-    
-        for idx, server in enumerate(proxies_list, 1):
-            # 自动补协议
-            if not server.startswith(("http://", "https://", "socks5://")):
-                server = f"http://{server}"
+        proxies_list = parse_proxies(self.server)
+        self.log(f"🔁 并发探测代理（共 {len(proxies_list)} 个）", "STEP")
     
-            proxy_cfg = {
-                "http": server,
-                "https": server,
-            }
-    
-            self.log(f"🌐 测试代理 {idx}/{len(proxies_list)}: {server}", "INFO")
-    
-            try:
-                resp = requests.get(
-                    test_url,
-                    proxies=proxy_cfg,
-                    headers=headers,
-                    timeout=timeout,
-                    verify=False,          # 防止代理 https 证书问题
-                    allow_redirects=True
-                )
-    
-                if resp.status_code == 200 and resp.text.strip():
-                    ip_text = resp.text.strip()
-                    self.log(f"代理可用: {ip_text}", "SUCCESS")
-                    return server, f"当前 IP : {ip_text}"
-    
-                self.log(f"⚠️ 响应异常: HTTP {resp.status_code}", "WARN")
+        self.proxy_ranking = rank_proxies(
+            proxies_list,
+            timeout=timeout,
+            log=lambda m: self.log(m, "INFO")
+        )
     
-            except RequestException as e:
-                self.log(f"❌ 代理失败: {repr(e)}", "WARN")
+        if self.proxy_ranking:
+            server, latency, ip_text = self.proxy_ranking[0]
+            self.log(f"代理可用: {server}（{latency * 1000:.0f}ms）{ip_text}", "SUCCESS")
+            return server, f"当前 IP : {ip_text}"
     
         self.log("🚫 所有代理均不可用，将使用直连", "WARN")
         return None, "🚫 所有代理均不可用，将使用直连"
         
-    def detect_proxy_available(self):
-        """
-        检测代理是否可用
-        成功返回 True，失败返回 False
-        """
-        if not self.server:
-            self.log("未配置代理，跳过代理检测", "INFO")
-            return False,"未配置代理，跳过代理检测"
-    
-        self.log("🔍 检测代理可用性...", "STEP")
-    
-        try:
-            with sync_playwright() as p:
-                browser = p.chromium.launch(
-                    headless=True,
-                    args=['--no-sandbox'],
-                    proxy={"server": self.server}
-                )
-                context = browser.new_context()
-                page = context.new_page()
-    
-                page.goto("https://myip.ipip.net", timeout=20000)
-                page.wait_for_load_state("domcontentloaded", timeout=20000)
-    
-                ip_text = page.text_content("body") or ""
-                self.log(f"🌐 当前 IP : {ip_text.strip()}", "SUCCESS")
-                
-    
-                browser.close()
-                return True,f"当前 IP : {ip_text.strip()}"
-    
-        except Exception as e:
-            self.log(f"代理不可用: {e}", "WARN")
-            return False,f"❌代理不可用: {e}"
-    
-        
     def run(self):
+        """StepTimer 只在这里收尾一次，总耗时和结果包含签到 / 兑换"""
+        self.outcome = "fail"
+        try:
+            self.login_and_checkin()
+        finally:
+            self.steps.finish(self.outcome)
+
+    def login_and_checkin(self):
         start_ts = time.time()
    
 
@@ -906,6 +512,25 @@ class AutoLogin:
             self.notify(False, "凭据未配置")
             sys.exit(1)
         
+        # 0. USER_SESSION 未到刷新窗口时直接走 API，不启动浏览器
+        user_data = self.load_user_session()
+        if user_data:
+            meta = inspect_session(user_data)
+            self.log(f"USER_SESSION: {describe(meta)}")
+            if not needs_refresh(meta):
+                self.log("USER_SESSION 有效，跳过浏览器登录", "SUCCESS")
+                try:
+                    session = self.build_session(user_data["auth_token"], user_data.get("cookies"))
+                    self.checkin_flow(session, start_ts)
+                    return
+                except SessionExpired as e:
+                    mark_invalid(user_data, str(e))
+                    self.log("USER_SESSION 已被服务端拒绝，改走浏览器登录", "WARN")
+                except Exception as e:
+                    self.log(f"API 直连失败: {e}，改走浏览器登录", "WARN")
+            else:
+                self.log("USER_SESSION 即将过期，重新登录刷新", "WARN")
+
         auth_token = None
 
         def on_request(req):
@@ -916,16 +541,17 @@ class AutoLogin:
                 self.log("🔑 捕获 Authorization")
             
         
-        with sync_playwright() as p:
+        with browser_scope() as launch:
             use_proxy = False
+            proxy_cfg = None
 
-            if self.server and use_proxy:
-                proxy_cfg,proxy_msg=self.pick_available_proxy()
+            if self.server:
+                proxy_cfg, proxy_msg = self.pick_available_proxy()
                 
                 if proxy_cfg:
                     use_proxy = True
                     self.log(proxy_msg, "SUCCESS")
-                    tg_lines.append(proxy_msg)
+                    self.tg_lines.append(proxy_msg)
                     
                 else:
                     self.log(f"❌ {proxy_msg}，已自动切换为直连", "WARN")
@@ -939,8 +565,11 @@ class AutoLogin:
             if use_proxy:
                 launch_args["proxy"] = {"server": proxy_cfg}
             
-            browser = p.chromium.launch(**launch_args)
-            context = browser.new_context(
+            # 出口 IP 检测与浏览器启动并行
+            egress = detect_egress_ip_async(proxy_cfg if use_proxy else None)
+            browser = launch(**launch_args)
+            context = self.github.new_context(
+                browser,
                 viewport={'width': 1920, 'height': 1080},
                 user_agent='Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
             )
@@ -949,29 +578,27 @@ class AutoLogin:
 
             try:
                 if not use_proxy:
-                    page.goto("https://myip.ipip.net", timeout=20000)
-                    page.wait_for_load_state("domcontentloaded", timeout=20000)
-        
-                    ip_text = page.text_content("body") or ""
-                    self.log(f"🌐 当前 IP: {ip_text.strip()}")
-                    tg_lines.append(f"🌐 当前 IP: {ip_text.strip()}")
-                # 预加载 Cookie
-                if self.gh_session:
+                    # 浏览器启动期间已在后台检测
                     try:
-                        context.add_cookies([
-                            {'name': 'user_session', 'value': self.gh_session, 'domain': 'github.com', 'path': '/'},
-                            {'name': 'logged_in', 'value': 'yes', 'domain': 'github.com', 'path': '/'}
-                        ])
-                        self.log("已加载 Session Cookie", "SUCCESS")
-                    except:
-                        self.log("加载 Cookie 失败", "WARN")
+                        ok, ip_text = egress.result(timeout=20)
+                    except Exception as e:
+                        ok, ip_text = False, repr(e)
+                    if ok:
+                        self.log(f"🌐 当前 IP: {ip_text}")
+                        self.tg_lines.append(f"🌐 当前 IP: {ip_text}")
+                    else:
+                        self.log(f"出口 IP 检测失败: {ip_text}", "WARN")
                 
                 # 1. 访问 Incudal 登录入口
                 page.on("request", on_request)
                 self.log("步骤1: 打开 Incudal 登录页", "STEP")
                 page.goto(SIGNIN_URL, timeout=60000)
-                ##page.wait_for_load_state('networkidle', timeout=30000)
-                time.sleep(2)
+                # 已登录会自动跳走；否则等 GitHub 按钮出现
+                wait_until(
+                    lambda: 'login' not in page.url.lower()
+                    or page.locator(GITHUB_BUTTON).first.is_visible(),
+                    10, page=page
+                )
                 self.shot(page, "Incudal")
                 
                 # 检查当前 URL，可能已经自动跳转到区域
@@ -982,9 +609,8 @@ class AutoLogin:
                     self.log("已登录！", "SUCCESS")
 
                     # 提取并保存新 Cookie
-                    new = self.get_session(context)
-                    if new:
-                        self.save_github_cookie(new)
+                    self.github.persist(context)
+                    self.outcome = "ok"
                     self.notify(True)
                     print("\n✅ 成功！\n")
                     return
@@ -1005,14 +631,19 @@ class AutoLogin:
                     else:
                         self.log(f"第 {attempt} 次尝试未找到 GitHub 按钮", "WARNING")
                         if attempt < MAX_RETRY:
-                            time.sleep(RETRY_DELAY)  # 等待一会儿再试
+                            wait_selector(page, GITHUB_BUTTON, RETRY_DELAY)  # 按钮出现就立即重试
                         else:
                             self.log("找不到 GitHub 按钮，重试次数已用完", "ERROR")
                             self.notify(False, "找不到 GitHub 按钮")
                             sys.exit(1)
                 
-                time.sleep(3)
-                page.wait_for_load_state('networkidle', timeout=30000)
+                # 跳到 GitHub（或已授权直接回到 Incudal）即可
+                wait_url(
+                    page,
+                    lambda url: 'github.com' in url or ('incudal' in url and 'login' not in url.lower()),
+                    30
+                )
+                settle(page)
                 self.shot(page, "点击后")
                 
                 url = page.url
@@ -1049,11 +680,7 @@ class AutoLogin:
                                
                 # 6. 提取并保存新 Cookie
                 self.log("步骤6: 更新 Cookie", "STEP")
-                new = self.get_session(context)
-                if new:
-                    self.save_github_cookie(new)
-                else:
-                    self.log("未获取到新 Cookie", "WARN")
+                self.github.persist(context)
                 
                 self.notify(True)
                 print("\n" + "="*50)
@@ -1074,67 +701,14 @@ class AutoLogin:
                 }
             
                 json_str = json.dumps(data, ensure_ascii=False)
+                meta = record_session(data)
+                open_state().put("incudal", default_account(), "session", data)
+                self.log(f"🔑 新 auth_token {describe(meta)}")
 
                 self.save_user_cookie(json_str)
                 
                 session = self.build_session(auth_token, cookies)
-                status = self.get_status(session)
-
-                checked_in = status.get("hasCheckedIn", False)
-                redeemed = status.get("hasRedeemed", False)
-            
-                redeem_code = None
-                if status.get("todayCode"):
-                    redeem_code = status["todayCode"].get("redeemCode")
-            
-                tg_lines.append(f"📊 初始状态：签到={checked_in}，兑换={redeemed}")
-            
-                if not checked_in:
-                    print("\n🎁 去签到！")
-                    redeem_code = self.checkin_and_get_code(session)
-            
-                if redeemed:
-                    print("\n🎁 已兑换！")
-                    tg_lines.append("🎉 今日已完成兑换")
-                    msgtemp = "\n".join(tg_lines)
-                    
-                    self.tg.send(
-                        f"Incudal 自动签到完成\n\n{msgtemp}\n\n状态:{STATUS_OK}\n耗时:{time.time() - start_ts:.1f}s"
-                    )
-                    return
-            
-                if redeem_code:
-                    tg_lines.append("\n🎁 <b>实例兑换结果</b>")
-                    success = 0
-                    level = STATUS_OK
-                
-                    for iid in INSTANCE_IDS[self.username]:
-                        try:
-                            data = self.redeem_instance(session, redeem_code, iid)
-                            if data.get("success") is True:
-                                tg_lines.append(f"- {iid}：成功")
-                                success += 1
-                            else:
-                                tg_lines.append(f"- {iid}：{data.get('message','本次失败')}")
-                                level = STATUS_PARTIAL
-                        except RequestException:
-                            tg_lines.append(f"- {iid}：失败")
-                            level = STATUS_FAIL
-                        time.sleep(DELAY)
-                
-                    if success == 0:
-                        level = STATUS_FAIL
-                    elif success < len(INSTANCE_IDS[self.username]):
-                        level = STATUS_PARTIAL
-                
-                    msgtemp = "\n".join(tg_lines)
-                        
-                    self.tg.send(
-                        f"Incudal 自动签到完成\n\n{msgtemp}\n\n状态:{level}\n耗时:{time.time() - start_ts:.1f}s"
-                    )
-                    return
-                    
-                tg_lines.append(f"❌ 未知错误，查看日志！")
+                self.checkin_flow(session, start_ts)
 
             
 
@@ -1146,9 +720,7 @@ class AutoLogin:
                 traceback.print_exc()
                 self.notify(False, str(e))
                 sys.exit(1)
-            finally:
-                browser.close()
 
 
 if __name__ == "__main__":
-    AutoLogin().run()
+    profiled(lambda: AutoLogin().run(), "incudal")
@@ -7,21 +7,58 @@ import logging
 import sys
 from datetime import datetime
 import re
+import hashlib
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests.adapters import HTTPAdapter
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.auth_token import guard_session, mark_invalid
+from engine import capacity
+from engine.state import open_state
+from engine.history import track_http
+from engine.proxy import proxy_session
+from engine.telegram_bot import Telegram
+from engine.profiling import profiled
+from engine import scope
 
 # ==================== 基础配置 ====================
 username = os.environ.get('GH_USERNAME')
 BASE_URL = "https://incudal.com"
 SSH_KEY_ID = {"greenwave1987":536,"jdtaxi":1015}
 
+# 常驻监视模式：WATCH_SECONDS > 0 时在这段时间内持续轮询 /api/packages
+WATCH_SECONDS = int(os.getenv("WATCH_SECONDS", "0"))
+WATCH_MIN_INTERVAL = float(os.getenv("WATCH_MIN_INTERVAL", "10"))   # 刚出现过容量时的轮询间隔
+WATCH_MAX_INTERVAL = float(os.getenv("WATCH_MAX_INTERVAL", "120"))  # 长时间没有容量时的上限
+CAPACITY_RECENT = 600  # 多少秒内出现过容量算"最近"
+JITTER = 0.2
+ERROR_BACKOFF = 1800   # 不可重试错误后，该套餐多久内不再尝试
+
+# 不可重试错误：(packageId, HTTP 状态码) 只通知一次；packageId -> 解禁时间
+_reported_errors = set()
+_backoff_until = {}
+_error_lock = threading.Lock()
+
 # ==================== 日志 ====================
 
+def _scope_filter(record):
+    """python -m engine run 同进程跑多个脚本时，每行带上脚本名"""
+    name = scope.current()
+    record.scope = f"[{name}] " if name else ""
+    return True
+
+
 def setup_logger(log_file="incudal_create.log"):
     logger = logging.getLogger("incudal")
     logger.setLevel(logging.INFO)
+    logger.addFilter(_scope_filter)
 
     fmt = logging.Formatter(
-        "%(asctime)s | %(levelname)s | %(message)s",
+        "%(asctime)s | %(levelname)s | %(scope)s%(message)s",
         datefmt="%Y-%m-%d %H:%M:%S"
     )
 
@@ -41,37 +78,20 @@ logger = setup_logger()
 
 # ==================== Telegram ====================
 
-TG_BOT_TOKEN = os.getenv("TG_BOT_TOKEN")
-TG_CHAT_ID = os.getenv("TG_CHAT_ID")
+_tg = Telegram()
 
 def tg_notify(text):
-    if not TG_BOT_TOKEN or not TG_CHAT_ID:
-        return
-    try:
-        requests.post(
-            f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage",
-            json={
-                "chat_id": TG_CHAT_ID,
-                "text": text,
-                "parse_mode": "HTML",
-                "disable_web_page_preview": True
-            },
-            timeout=10
-        )
-    except Exception:
-        pass
+    _tg.send(text)
 
 # ==================== Session 构建 ====================
 
 def build_session():
-    raw = os.getenv("USER_SESSION")
-    if not raw:
-        raise RuntimeError("❌ 未设置 USER_SESSION 环境变量")
-
     try:
-        data = json.loads(raw)
+        data = open_state().load("USER_SESSION")
     except json.JSONDecodeError as e:
         raise RuntimeError(f"❌ USER_SESSION 不是合法 JSON: {e}")
+    if not data:
+        raise RuntimeError("❌ 未设置 USER_SESSION 环境变量")
 
     auth_token = data.get("auth_token")
     cookies = data.get("cookies")
@@ -79,7 +99,13 @@ def build_session():
     if not auth_token or not cookies:
         raise RuntimeError("❌ USER_SESSION 必须包含 auth_token 和 cookies")
 
-    session = requests.Session()
+    ok, msg = guard_session(data)
+    if not ok:
+        raise RuntimeError(msg)
+
+    # INCUDAL_PROXY 配置时按排名走代理（失败自动切换），否则直连
+    session = proxy_session(os.getenv("INCUDAL_PROXY"), log=logger.info)
+    session.user_data = data  # 401 时据此标记失效
     session.headers.update({
         "accept": "application/json, text/plain, */*",
         "user-agent": "Mozilla/5.0 Chrome/143.0",
@@ -95,6 +121,11 @@ def build_session():
             domain=c.get("domain"),
             path=c.get("path", "/")
         )
+
+    # 并发抢创建时各套餐共用一个连接池（不走自动重试，503 由下面自己处理）
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16)
+    session.mount("https://", adapter)
+    track_http(session, "instances", username)
     return session
 
 # ==================== 工具函数 ====================
@@ -108,10 +139,54 @@ def random_instance_name(prefix="ss"):
 
 def get_packages(session):
     r = session.get(f"{BASE_URL}/api/packages", timeout=15)
+    if r.status_code == 401:
+        mark_invalid(session.user_data, "GET /api/packages 401")
     r.raise_for_status()
     return r.json().get("packages", [])
 
-def create_instance_with_retry(session, package, retries=3):
+def has_capacity(pkg):
+    """套餐里带库存字段时返回 True / False，没有相关字段返回 None（只能靠创建试探）"""
+    for f in ("available", "is_available", "isAvailable", "in_stock", "inStock"):
+        if f in pkg:
+            return bool(pkg[f])
+    for f in ("stock", "remaining", "available_count"):
+        if isinstance(pkg.get(f), (int, float)):
+            return pkg[f] > 0
+    for f in ("sold_out", "soldOut"):
+        if f in pkg:
+            return not pkg[f]
+    return None
+
+def poll_packages(session, state):
+    """
+    带 If-None-Match / If-Modified-Since 的条件请求
+    返回 (packages, 是否有变化)；304 时沿用上次结果
+    """
+    headers = {}
+    if state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    if state.get("last_modified"):
+        headers["If-Modified-Since"] = state["last_modified"]
+
+    r = session.get(f"{BASE_URL}/api/packages", headers=headers, timeout=15)
+    if r.status_code == 304:
+        return state["packages"], False
+    if r.status_code == 401:
+        mark_invalid(session.user_data, "GET /api/packages 401")
+    r.raise_for_status()
+
+    digest = hashlib.sha256(r.content).hexdigest()
+    changed = "digest" in state and digest != state["digest"]
+    state.update({
+        "etag": r.headers.get("ETag"),
+        "last_modified": r.headers.get("Last-Modified"),
+        "digest": digest,
+        "packages": r.json().get("packages", []),
+    })
+    return state["packages"], changed
+
+def create_instance_with_retry(session, package, retries=3, stop=None):
+    """stop：threading.Event，其它套餐抢到后置位，本套餐不再发新的请求"""
     pid = package["id"]
     cpu = package["cpu_max"]
     memory = package["memory_max"]
@@ -119,6 +194,10 @@ def create_instance_with_retry(session, package, retries=3):
     pname = package["name"]
 
     for attempt in range(1, retries + 1):
+        if stop is not None and stop.is_set():
+            logger.info(f"[PKG {pid}] 其它套餐已创建成功，取消")
+            return False
+
         name = random_instance_name()
         logger.info(f"[PKG {pid}] 第 {attempt}/{retries} 次尝试 | name={name}")
 
@@ -132,15 +211,38 @@ def create_instance_with_retry(session, package, retries=3):
             "sshKeyId": SSH_KEY_ID[username]
         }
 
-        r = session.post(
-            f"{BASE_URL}/api/instances",
-            json=payload,
-            timeout=20
-        )
+        start = time.monotonic()
+        try:
+            r = session.post(
+                f"{BASE_URL}/api/instances",
+                json=payload,
+                timeout=20
+            )
+        except requests.RequestException as e:
+            # 网络错误记为一次失败尝试，不中断监视
+            capacity.record_attempt(pid, "error", time.monotonic() - start)
+            logger.warning(f"[PKG {pid}] 请求异常: {e}")
+            if attempt < retries:
+                if stop is not None:
+                    stop.wait(1)
+                else:
+                    time.sleep(1)
+            continue
+        outcome = "error"
+        if r.status_code in (200, 201):
+            outcome = "ok"
+        elif r.status_code == 503:
+            try:
+                if r.json().get("code") == "HOST_RESOURCES_INSUFFICIENT":
+                    outcome = "full"
+            except Exception:
+                pass
+        capacity.record_attempt(pid, outcome, time.monotonic() - start, r.status_code)
 
         # 成功
         if r.status_code in (200, 201):
             logger.info(f"✅ 创建成功 | {name}")
+            open_state().append_ledger("incudal", username, "instance", name, "ok", {"package": pid})
             tg_notify(
                 f"🎉 <b>Incudal 创建成功</b>\n"
                 f"📦 套餐：{pname}\n"
@@ -149,48 +251,176 @@ def create_instance_with_retry(session, package, retries=3):
             )
             return True
 
-        # 可重试失败
-        if r.status_code == 503:
-            try:
-                data = r.json()
-                if data.get("code") == "HOST_RESOURCES_INSUFFICIENT":
-                    logger.warning(f"[PKG {pid}] 资源不足，换 name 重试")
-                    time.sleep(1)
-                    continue
-            except Exception:
-                pass
+        if r.status_code == 401:
+            mark_invalid(session.user_data, "POST /api/instances 401")
 
-        # 不可重试
+        # 可重试失败
+        if outcome == "full":
+            logger.warning(f"[PKG {pid}] 资源不足，换 name 重试")
+            if attempt == retries:
+                continue
+            if stop is not None:
+                stop.wait(1)
+            else:
+                time.sleep(1)
+            continue
+
+        # 不可重试：同一套餐同一种错误只通知一次，之后 ERROR_BACKOFF 内跳过该套餐
         logger.error(f"[PKG {pid}] 不可重试错误 {r.status_code}: {r.text}")
-        tg_notify(
-            f"❌ <b>Incudal 创建失败</b>\n"
-            f"📦 套餐：{pname}\n"
-            f"🆔 packageId：{pid}\n"
-            f"📄 HTTP：{r.status_code}"
-        )
+        with _error_lock:
+            first = (pid, r.status_code) not in _reported_errors
+            _reported_errors.add((pid, r.status_code))
+            _backoff_until[pid] = time.time() + ERROR_BACKOFF
+        if first:
+            tg_notify(
+                f"❌ <b>Incudal 创建失败</b>\n"
+                f"📦 套餐：{pname}\n"
+                f"🆔 packageId：{pid}\n"
+                f"📄 HTTP：{r.status_code}\n"
+                f"⏸ {ERROR_BACKOFF // 60} 分钟内不再尝试该套餐"
+            )
         return False
 
     logger.error(f"[PKG {pid}] 达到最大重试次数")
     return False
 
+def race_create(session, packages, retries=3):
+    """
+    所有候选套餐同时创建，第一个成功后其余停止发新请求
+    按历史估计的空位概率排序提交，长期满载的套餐只偶尔探测
+    返回成功的套餐 dict 或 None
+    """
+    now = time.time()
+    with _error_lock:
+        paused = [p for p in packages if _backoff_until.get(p["id"], 0) > now]
+    for pkg in paused:
+        logger.info(f"⏸ packageId={pkg['id']} 刚出现不可重试错误，暂停到 "
+                    f"{time.strftime('%H:%M:%S', time.localtime(_backoff_until[pkg['id']]))}")
+    packages = [p for p in packages if p not in paused]
+    selected = capacity.select(packages, log=logger.info)
+    if not selected:
+        if packages:
+            logger.info(f"🧊 {len(packages)} 个套餐都在长期满载的探测间隔内，本轮不创建")
+        return None
+    packages = selected
+
+    stop = threading.Event()
+    start = time.monotonic()
+    winner = None
+
+    pool = ThreadPoolExecutor(max_workers=len(packages))
+    futures = {
+        pool.submit(scope.wrap(create_instance_with_retry), session, pkg, retries, stop): pkg
+        for pkg in packages
+    }
+    for fut in as_completed(futures):
+        try:
+            ok = fut.result()
+        except Exception as e:
+            logger.error(f"[PKG {futures[fut]['id']}] 异常: {e}")
+            ok = False
+        if ok:
+            winner = futures[fut]
+            stop.set()
+            logger.info(
+                f"⏱ 首个成功用时 {time.monotonic() - start:.2f}s "
+                f"(packageId={winner['id']})"
+            )
+            break
+
+    # 未开始的直接取消；已发出的请求无法撤回，但不会再发下一次
+    pool.shutdown(wait=False, cancel_futures=True)
+    if winner is None:
+        logger.info(f"⏱ 全部套餐失败，用时 {time.monotonic() - start:.2f}s")
+    return winner
+
 # ==================== 主流程 ====================
 
+def eligible_packages(packages, verbose=True):
+    result = []
+    for pkg in packages:
+        if "美国" in pkg['name']:
+            result.append(pkg)
+        elif verbose:
+            logger.info(f"🚫 跳过 packageId={pkg['id']} ({pkg['name']})")
+    return result
+
+def watch(session, seconds):
+    """
+    常驻监视：同一个 session 持续轮询，发现可能有容量立即抢创建
+    - 库存字段为真的套餐立即抢
+    - 没有库存字段的套餐只在条件请求显示它有变化时抢，否则按 capacity.EXPLORE_INTERVAL 限频试探
+    最近出现过容量（库存字段为真 / 套餐列表变化）时按最小间隔轮询，否则逐步放慢，间隔带随机抖动
+    """
+    deadline = time.monotonic() + seconds
+    state = {}
+    seen = None  # packageId -> 上一次的套餐内容；第一次轮询只做基线
+    interval = WATCH_MIN_INTERVAL
+    last_capacity = 0.0
+    polls = 0
+
+    logger.info(f"👀 进入监视模式 {seconds}s（间隔 {WATCH_MIN_INTERVAL:.0f}-{WATCH_MAX_INTERVAL:.0f}s）")
+    while time.monotonic() < deadline:
+        polls += 1
+        try:
+            packages, changed = poll_packages(session, state)
+        except Exception as e:
+            logger.warning(f"获取 package 失败: {e}")
+            packages, changed = [], False
+
+        candidates = [
+            p for p in eligible_packages(packages, verbose=False)
+            if has_capacity(p) is not False
+        ]
+        if changed or any(has_capacity(p) for p in candidates):
+            last_capacity = time.monotonic()
+            logger.info(f"📈 第 {polls} 次轮询发现容量信号")
+
+        ready = [p for p in candidates if has_capacity(p)]
+        unknown = [p for p in candidates if has_capacity(p) is None]
+        if seen is not None:
+            # 304 时 packages 沿用上次结果，不会被当成变化
+            ready += [p for p in unknown if seen.get(p["id"]) != p]
+        ready += capacity.due([p for p in unknown if p not in ready])
+        seen = {p["id"]: p for p in packages}
+
+        if ready:
+            winner = race_create(session, ready, retries=1)
+            if winner:
+                logger.info(f"🎉 监视第 {polls} 次轮询创建成功（packageId={winner['id']}）")
+                return True
+
+        if time.monotonic() - last_capacity < CAPACITY_RECENT:
+            interval = WATCH_MIN_INTERVAL
+        else:
+            # 逐步放慢，但不超过历史概率给出的间隔
+            suggested = capacity.poll_interval(candidates, WATCH_MIN_INTERVAL, WATCH_MAX_INTERVAL)
+            interval = min(WATCH_MAX_INTERVAL, interval * 1.5, suggested)
+        wait = interval * random.uniform(1 - JITTER, 1 + JITTER)
+        time.sleep(max(0.0, min(wait, deadline - time.monotonic())))
+
+    logger.info(f"⏰ 监视结束，共轮询 {polls} 次")
+    return False
+
 def main():
     session = build_session()
+
+    if WATCH_SECONDS > 0:
+        if watch(session, WATCH_SECONDS):
+            logger.info("🎉 脚本结束（已成功创建实例）")
+            return
+        logger.error("🚫 监视期间所有 package 均创建失败")
+        return
+
     packages = get_packages(session)
 
     logger.info(f"获取到 {len(packages)} 个 package")
 
-    for pkg in packages:
-        if "美国" in pkg['name'] :
-            logger.info(f"➡️ 尝试 packageId={pkg['id']} ({pkg['name']})")
-            if create_instance_with_retry(session, pkg, retries=3):
-                logger.info("🎉 脚本结束（已成功创建实例）")
-        else:
-            logger.info(f"🚫 跳过 packageId={pkg['id']} ({pkg['name']})")
-            
-    
-            
+    candidates = eligible_packages(packages)
+    logger.info(f"➡️ 同时尝试 {len(candidates)} 个 package: {[p['id'] for p in candidates]}")
+    if race_create(session, candidates, retries=3):
+        logger.info("🎉 脚本结束（已成功创建实例）")
+        return
 
     logger.error("🚫 所有 package 均创建失败")
     current_hour = time.localtime().tm_hour
@@ -201,4 +431,4 @@ def main():
 # ==================== 入口 ====================
 
 if __name__ == "__main__":
-    main()
+    profiled(main, "instances")
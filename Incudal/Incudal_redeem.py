@@ -1,27 +1,60 @@
 import os
-import json
-import requests
+import sys
+import time
+import threading
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+from engine.auth_token import guard_session, mark_invalid
+from engine.http_pool import mount_paced, run_concurrent
+from engine.redeem_planner import redeem_with_plan, outcomes
+from engine.metrics import Histogram
+from engine.code_index import CodeIndex
+from engine.state import open_state
+from engine.history import track_http
+from engine.proxy import proxy_session
+from engine.profiling import profiled
+from engine import scope
 
 BASE_URL = "https://incudal.com"
 TIMEOUT = 15
 RESULT_FILE = os.path.join(os.getcwd(), "result.txt")
+INSTANCES_TTL = int(os.getenv("INSTANCES_TTL", "300"))          # 实例列表缓存秒数
+KEEPALIVE_INTERVAL = int(os.getenv("KEEPALIVE_INTERVAL", "30"))  # 保活请求间隔
+_write_lock = threading.Lock()
+
+# 实例列表缓存（后台刷新），以及 消息到达 -> 第一个兑换 POST 的延迟
+_instances = {"data": [], "at": 0.0}
+_instances_lock = threading.Lock()
+POST_LATENCY = Histogram("redeem_post_latency")
 
 def append_line(line):
-    with open(RESULT_FILE, "a", encoding="utf-8") as f:
-        f.write(line + "\n")
-    print(line, flush=True)
+    with _write_lock:
+        with open(RESULT_FILE, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+        print(scope.tag(line), flush=True)
+
+def load_user_session():
+    data = open_state().load("USER_SESSION")
+    if not data:
+        raise RuntimeError("❌ USER_SESSION 未设置")
+    return data
 
 def build_session():
-    raw = os.environ.get("USER_SESSION")
-    if not raw:
-        raise RuntimeError("❌ USER_SESSION 未设置")
-    data = json.loads(raw)
-    s = requests.Session()
+    data = load_user_session()
+    ok, msg = guard_session(data)
+    if not ok:
+        raise RuntimeError(msg)
+    # INCUDAL_PROXY 配置时按排名走代理（失败自动切换），否则直连
+    s = proxy_session(os.getenv("INCUDAL_PROXY"))
     s.headers.update({
         "authorization": data["auth_token"],
         "user-agent": "Mozilla/5.0",
         "accept": "application/json"
     })
+    mount_paced(s)
+    track_http(s, "redeem")
     for c in data.get("cookies", []):
         s.cookies.set(c["name"], c["value"], domain=c.get("domain"))
     return s
@@ -49,12 +82,49 @@ def decode_redeem(code_type, code_value):
 def get_instances(session):
     try:
         r = session.get(f"{BASE_URL}/api/instances", timeout=TIMEOUT)
+        if r.status_code == 401:
+            mark_invalid(load_user_session(), "GET /api/instances 401")
         r.raise_for_status()
         return r.json().get("instances", [])
     except Exception as e:
         append_line(f"❌ 获取实例失败: {e}")
         return []
 
+def cached_instances(session, ttl=INSTANCES_TTL):
+    """实例列表，缓存未过期直接返回（后台线程负责刷新）"""
+    with _instances_lock:
+        if _instances["data"] and time.time() - _instances["at"] < ttl:
+            return _instances["data"]
+    return refresh_instances(session)
+
+def refresh_instances(session):
+    instances = get_instances(session)
+    if instances:
+        with _instances_lock:
+            _instances["data"] = instances
+            _instances["at"] = time.time()
+    return instances or _instances["data"]
+
+def start_warmer(session, interval=KEEPALIVE_INTERVAL, ttl=INSTANCES_TTL):
+    """
+    daemon 线程：定期发轻量 HEAD 保持连接，实例列表过半个 TTL 就后台刷新
+    码到达时直接用热连接 + 缓存的实例发 POST
+    """
+    outcomes()  # 兑换历史提前读进内存，排序时不再查库
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                if time.time() - _instances["at"] > ttl / 2:
+                    refresh_instances(session)
+                else:
+                    session.head(BASE_URL, timeout=TIMEOUT)
+            except Exception as e:
+                print(f"⚠ 保活失败: {e}", flush=True)
+
+    threading.Thread(target=loop, daemon=True).start()
+
 def redeem(session, code, instance_id):
     try:
         append_line(f"🚀 开始兑换实例 {instance_id}：")
@@ -63,6 +133,8 @@ def redeem(session, code, instance_id):
             json={"redeemCode": code, "instanceId": instance_id},
             timeout=TIMEOUT
         )
+        if r.status_code == 401:
+            mark_invalid(load_user_session(), "POST /api/checkin/redeem 401")
         data = safe_json(r)
         print(data)
         code_data = data.get("todayCode") if isinstance(data.get("todayCode"), dict) else data
@@ -70,14 +142,49 @@ def redeem(session, code, instance_id):
         if r.status_code == 200 and code_data and "codeType" in code_data:
             result = f"✅ {instance_id}: {decode_redeem(code_data['codeType'], code_data['codeValue'])}"
             append_line(result)
-            return result
-        result = f"❌ {instance_id}: {data['error']}"
+            return True, result
+        error = data.get("error") or data.get("message") or f"HTTP {r.status_code}"
+        result = f"❌ {instance_id}: {error}"
         append_line(result)
-        return result
+        return False, result
     except Exception as e:
         result = f"❌ {instance_id}: 异常 {e}"
         append_line(result)
-        return result
+        return False, result
+
+def redeem_code(session, code, instances, arrived_at=None, index=None):
+    """
+    按计划把一个码兑换到最合适的实例，成功即停
+    arrived_at：消息到达时间戳，传入时记录到第一个 POST 发出的延迟
+    index：CodeIndex，传入时记录该码的结果
+    """
+    append_line(f"🎟 兑换码 {code} 开始")
+    sent = []
+
+    def attempt(c, i):
+        if arrived_at and not sent:
+            sent.append(i)
+            POST_LATENCY.observe(time.time() - arrived_at)
+        return redeem(session, c, i)
+
+    iid, attempts, dead = redeem_with_plan(code, instances, attempt)
+    if index is not None:
+        if iid is not None or dead:
+            index.record(code, iid is not None, instance=iid, error=dead)
+        else:
+            # 网络错误 / 实例问题，不代表码不能用：放回去，下次再遇到还能兑换
+            index.release(code)
+    open_state().append_ledger(
+        "incudal", None, "redeem", code, "fail" if iid is None else "ok",
+        {"instance": iid, "attempts": attempts},
+    )
+    if dead:
+        append_line(f"🛑 兑换码 {code} 已失效（请求 {attempts} 次）")
+    elif iid is None:
+        append_line(f"❌ 兑换码 {code} 未兑换成功（请求 {attempts} 次）")
+    else:
+        append_line(f"🎉 兑换码 {code} -> 实例 {iid}（请求 {attempts} 次）")
+    return iid
 
 def main():
     # 清空 result.txt
@@ -90,15 +197,26 @@ def main():
             append_line("❌ 未获取到兑换码，退出")
             return
 
-        instances = get_instances(session)
-        if not instances:
-            append_line("❌ 没有实例可兑换")
-            return
-
-        for code in codes:
-            append_line(f"🎟 兑换码 {code} 开始")
-            for ins in instances:
-                redeem(session, code, ins["id"])
+        # 处理过的码直接跳过，不发任何请求
+        index = CodeIndex()
+        fresh = []
+        for code in dict.fromkeys(codes):
+            if index.claim(code):
+                fresh.append(code)
+            else:
+                append_line(f"⏭ 兑换码 {code} {index.describe(code)}，跳过")
+        if not fresh:
+            append_line("ℹ️ 没有新的兑换码")
+        else:
+            instances = get_instances(session)
+            if not instances:
+                for code in fresh:
+                    index.release(code)
+                append_line("❌ 没有实例可兑换")
+                return
+
+            # 不同码并发；同一个码按计划依次尝试，成功即停
+            run_concurrent(lambda code: redeem_code(session, code, instances, index=index), fresh)
 
     except Exception as e:
         append_line(f"❌ 脚本异常: {e}")
@@ -106,4 +224,4 @@ def main():
     append_line("✅ 全部兑换完成")
 
 if __name__ == "__main__":
-    main()
+    profiled(main, "redeem")
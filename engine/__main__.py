@@ -0,0 +1,79 @@
+# engine/__main__.py
+# -*- coding: utf-8 -*-
+
+"""
+python -m engine run leaflow incudal clawcloud [--browsers N] [--profile]
+python -m engine state import|export SECRET_NAME
+python -m engine report [--days 7] [--baseline-days 28] [--provider NAME] [--notify] [--strict]
+"""
+
+import argparse
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+
+def main(argv=None):
+    from engine import runner
+    from engine.state import SECRET_FORMATS, open_state
+    from engine.profiling import profiled, enabled
+
+    parser = argparse.ArgumentParser(prog="python -m engine")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="同一进程内并发运行多个脚本")
+    p_run.add_argument("providers", nargs="+", choices=sorted(runner.PROVIDERS))
+    p_run.add_argument("--browsers", type=int, default=runner.BROWSERS, help="浏览器池大小")
+    p_run.add_argument("--profile", action="store_true", help="开启性能分析（也可设 ENGINE_PROFILE=1）")
+
+    p_state = sub.add_parser("state", help="本地状态库与 secret 格式互转")
+    p_state.add_argument("action", choices=["import", "export"])
+    p_state.add_argument("secret", choices=sorted(SECRET_FORMATS))
+    p_state.add_argument("--account", help="单账号 secret 的账号（默认 GH_USERNAME）")
+
+    p_report = sub.add_parser("report", help="按步骤汇总运行历史并标记回归")
+    p_report.add_argument("--days", type=float, default=7, help="统计最近多少天")
+    p_report.add_argument("--baseline-days", type=float, default=28, help="基线：再往前多少天")
+    p_report.add_argument("--provider", help="只看某个脚本")
+    p_report.add_argument("--threshold", type=float, default=1.3, help="变慢多少倍算回归")
+    p_report.add_argument("--notify", action="store_true", help="同时发送到 Telegram")
+    p_report.add_argument("--strict", action="store_true", help="有回归时退出码为 1")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        names = list(dict.fromkeys(args.providers))
+        ok = profiled(
+            lambda: runner.run(names, browsers=args.browsers),
+            "run_" + "_".join(names),
+            enable=args.profile or enabled([]),
+        )
+        return 0 if ok else 1
+    if args.command == "state":
+        store = open_state()
+        if args.action == "import":
+            # 环境变量优先，没有时从 stdin 读
+            raw = os.getenv(args.secret) or sys.stdin.read()
+            print(f"📥 导入 {store.import_secret(args.secret, raw, args.account)} 条", file=sys.stderr)
+        else:
+            text = store.export_secret(args.secret, args.account)
+            if text is None:
+                print(f"⚠ 本地没有 {args.secret}", file=sys.stderr)
+                return 1
+            print(text)
+        return 0
+    if args.command == "report":
+        from engine.report import build_report
+
+        text, flagged = build_report(args.days, args.baseline_days, args.provider, args.threshold)
+        print(text)
+        if args.notify:
+            from engine.notify import send_notify
+            send_notify("📈 运行历史", text)
+        return 1 if flagged and args.strict else 0
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
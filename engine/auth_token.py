@@ -0,0 +1,279 @@
+# engine/auth_token.py
+# -*- coding: utf-8 -*-
+
+"""
+Incudal auth_token 生命周期
+- auth_token 是 JWT 时解析 exp，否则退回登录态 cookie 的 expires（忽略 Cloudflare 等短期 cookie）
+- 提前判断是否过期 / 是否需要刷新（INCUDAL_REFRESH_MARGIN 秒）
+- 解析结果存到状态库 credentials（kind=token_meta），服务端返回 401 后标记失效，
+  之后所有脚本直接跳过，不再发注定失败的请求
+"""
+
+import os
+import json
+import time
+import calendar
+import base64
+import hashlib
+import requests
+
+from engine.state import open_state, default_account
+
+META_KIND = "token_meta"
+DECODE_VERSION = 2  # 解析规则变了就重新解析缓存里的旧结果
+REFRESH_MARGIN = int(os.getenv("INCUDAL_REFRESH_MARGIN", "21600"))  # 默认提前 6 小时刷新
+REFRESH_COOLDOWN = 3600  # 同一个 token 一小时内只触发一次刷新
+REFRESH_WORKFLOW = os.getenv("INCUDAL_REFRESH_WORKFLOW", "Incudal-checkin.yml")
+ACTIVE_RUN_STATES = {"queued", "in_progress", "waiting", "pending", "requested"}
+
+
+# ==================================================
+# 解析
+# ==================================================
+
+def fingerprint(token):
+    return hashlib.sha256((token or "").encode()).hexdigest()[:16]
+
+
+def decode_jwt_exp(token):
+    """JWT 返回 exp（秒），不是 JWT 返回 None"""
+    if not token:
+        return None
+    if token.lower().startswith("bearer "):
+        token = token[7:]
+    parts = token.strip().split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        payload = parts[1] + "=" * (-len(parts[1]) % 4)
+        claims = json.loads(base64.urlsafe_b64decode(payload))
+        exp = claims.get("exp")
+        return int(exp) if exp else None
+    except Exception:
+        return None
+
+
+# 只有这些名字的 cookie 才代表登录态；__cf_bm 之类的风控 cookie 只活 30 分钟，和登录无关
+AUTH_COOKIE_HINTS = ("auth", "token", "session", "sid", "jwt")
+IGNORED_COOKIE_PREFIXES = ("__cf", "cf_", "_cf", "__cflb", "_ga", "_gid")
+
+
+def _is_auth_cookie(name):
+    name = (name or "").lower()
+    if name.startswith(IGNORED_COOKIE_PREFIXES):
+        return False
+    return any(hint in name for hint in AUTH_COOKIE_HINTS)
+
+
+def cookies_expiry(cookies, domain="incudal"):
+    """
+    登录态 cookie 中最早的 expires（会话 cookie 为 -1，忽略）
+    没有可用的登录态 cookie 返回 None（过期时间未知，不当作快过期）
+    """
+    stamps = [
+        c.get("expires") for c in cookies or []
+        if domain in (c.get("domain") or "")
+        and _is_auth_cookie(c.get("name"))
+        and isinstance(c.get("expires"), (int, float))
+        and c.get("expires") > 0
+    ]
+    return int(min(stamps)) if stamps else None
+
+
+# ==================================================
+# 缓存
+# ==================================================
+
+def _load():
+    """fingerprint -> 元数据"""
+    return open_state().get("incudal", default_account(), META_KIND, {}) or {}
+
+
+def _save(cache):
+    open_state().put("incudal", default_account(), META_KIND, cache)
+
+
+def _decode(data):
+    token_exp = decode_jwt_exp(data.get("auth_token"))
+    cookie_exp = cookies_expiry(data.get("cookies"))
+    return {
+        "fingerprint": fingerprint(data.get("auth_token")),
+        "token_exp": token_exp,
+        "cookie_exp": cookie_exp,
+        "expires_at": token_exp or cookie_exp,
+        "invalid": False,
+        "checked_at": int(time.time()),
+        "version": DECODE_VERSION,
+    }
+
+
+def inspect_session(data):
+    """返回 USER_SESSION 的元数据（优先读缓存）"""
+    key = fingerprint(data.get("auth_token"))
+    cache = _load()
+    meta = cache.get(key)
+    if meta is None or meta.get("version") != DECODE_VERSION:
+        fresh = _decode(data)
+        if meta and meta.get("invalid"):
+            # 服务端的失效标记和解析规则无关，保留
+            fresh.update(invalid=True, invalid_reason=meta.get("invalid_reason"))
+        meta = fresh
+        cache[key] = meta
+        _save(cache)
+    return meta
+
+
+def record_session(data):
+    """新 token 落盘（登录成功后调用），覆盖旧的失效标记"""
+    key = fingerprint(data.get("auth_token"))
+    cache = _load()
+    meta = _decode(data)
+    cache[key] = meta
+    _save(cache)
+    return meta
+
+
+def mark_invalid(data, reason=""):
+    """服务端拒绝（401）后标记失效"""
+    key = fingerprint(data.get("auth_token"))
+    cache = _load()
+    meta = cache.get(key) or _decode(data)
+    meta["invalid"] = True
+    meta["invalid_reason"] = reason
+    meta["checked_at"] = int(time.time())
+    cache[key] = meta
+    _save(cache)
+    print(f"🚫 [Token] 已标记失效: {reason}")
+
+
+# ==================================================
+# 判断
+# ==================================================
+
+def remaining(meta, now=None):
+    """剩余秒数，未知过期时间返回 None"""
+    if not meta.get("expires_at"):
+        return None
+    return meta["expires_at"] - (now or time.time())
+
+
+def is_expired(meta, now=None):
+    if meta.get("invalid"):
+        return True
+    left = remaining(meta, now)
+    return left is not None and left <= 0
+
+
+def needs_refresh(meta, margin=REFRESH_MARGIN, now=None):
+    if is_expired(meta, now):
+        return True
+    left = remaining(meta, now)
+    return left is not None and left < margin
+
+
+def describe(meta):
+    if meta.get("invalid"):
+        return f"已失效（{meta.get('invalid_reason') or '服务端拒绝'}）"
+    left = remaining(meta)
+    if left is None:
+        return "过期时间未知"
+    if left <= 0:
+        return "已过期"
+    expires = time.strftime("%Y-%m-%d %H:%M", time.localtime(meta["expires_at"]))
+    return f"剩余 {left / 3600:.1f} 小时（{expires} 过期）"
+
+
+# ==================================================
+# 主动刷新
+# ==================================================
+
+def _recent_run(url, headers):
+    """
+    刷新 workflow 最近一次运行还没结束、或在冷却期内开始过，返回说明；否则 / 查询失败返回 None
+    监听、创建、兑换各自的 workflow 可能同时发现 token 快过期，以 GitHub 上的运行记录为准去重
+    """
+    try:
+        r = requests.get(f"{url}/runs", headers=headers, params={"per_page": 1}, timeout=15)
+        runs = r.json().get("workflow_runs") or [] if r.ok else []
+    except Exception as e:
+        print(f"⚠ [Token] 查询 {REFRESH_WORKFLOW} 运行记录失败: {e}")
+        return None
+    if not runs:
+        return None
+    run = runs[0]
+    if run.get("status") in ACTIVE_RUN_STATES:
+        return f"#{run.get('run_number')} 正在运行"
+    try:
+        age = time.time() - calendar.timegm(time.strptime(run["created_at"], "%Y-%m-%dT%H:%M:%SZ"))
+    except (KeyError, TypeError, ValueError):
+        return None
+    if age < REFRESH_COOLDOWN:
+        return f"#{run.get('run_number')} {age / 60:.0f} 分钟前刚运行过"
+    return None
+
+
+def request_refresh(meta, reason):
+    """触发 Incudal 登录 workflow 提前刷新 USER_SESSION"""
+    repo = os.getenv("GITHUB_REPOSITORY")
+    token = os.getenv("REPO_TOKEN")
+    if not repo or not token:
+        print("⚠ [Token] 未配置 GITHUB_REPOSITORY / REPO_TOKEN，无法触发刷新")
+        return False
+
+    # 冷却以状态库里的最新记录为准（调用方的 meta 可能是更早读到的）
+    now = time.time()
+    latest = _load().get(meta.get("fingerprint")) or meta
+    if now - latest.get("refresh_requested_at", 0) < REFRESH_COOLDOWN:
+        print("ℹ️ [Token] 近期已触发过刷新，跳过")
+        return False
+
+    url = f"https://api.github.com/repos/{repo}/actions/workflows/{REFRESH_WORKFLOW}"
+    headers = {
+        "Authorization": f"token {token}",
+        "Accept": "application/vnd.github.v3+json"
+    }
+    busy = _recent_run(url, headers)
+    if busy:
+        print(f"ℹ️ [Token] {REFRESH_WORKFLOW} {busy}，跳过刷新")
+        return False
+
+    print(f"🔄 [Token] 触发 {REFRESH_WORKFLOW} 刷新: {reason}")
+    try:
+        r = requests.post(
+            f"{url}/dispatches",
+            headers=headers,
+            json={"ref": os.getenv("GITHUB_REF_NAME") or "main"},
+            timeout=30
+        )
+        print(f"⬅️ [Token] dispatch HTTP {r.status_code}")
+    except Exception as e:
+        print(f"⚠ [Token] 触发刷新失败: {e}")
+        return False
+
+    if r.status_code != 204:
+        return False
+
+    cache = _load()
+    if meta.get("fingerprint") in cache:
+        cache[meta["fingerprint"]]["refresh_requested_at"] = int(now)
+        _save(cache)
+    return True
+
+
+def guard_session(data, margin=REFRESH_MARGIN):
+    """
+    请求前检查 USER_SESSION
+    返回 (可用, 说明)；快过期时顺带触发刷新，但本次仍可用
+    """
+    meta = inspect_session(data)
+    msg = describe(meta)
+    print(f"🔑 [Token] auth_token {msg}")
+
+    if is_expired(meta):
+        request_refresh(meta, msg)
+        return False, f"❌ USER_SESSION {msg}，跳过请求"
+
+    if needs_refresh(meta, margin):
+        request_refresh(meta, msg)
+
+    return True, msg
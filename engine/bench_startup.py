@@ -0,0 +1,146 @@
+# engine/bench_startup.py
+# -*- coding: utf-8 -*-
+
+"""
+入口脚本启动耗时基准
+  python -m engine.bench_startup [轮数]
+每个入口分别在新进程里测：
+- import：`python -X importtime` 下入口模块的累计导入耗时，以及是否在导入阶段加载了重依赖
+- 首请求：从启动进程到本地 HTTP 服务收到第一个请求（导入入口 + requests 发出请求）
+多轮取最小值；超出预算或导入阶段加载了 playwright / pyotp / nacl / telethon 时退出码为 1
+预算：STARTUP_BUDGET_MS（导入，默认 400）、FIRST_REQUEST_BUDGET_MS（首请求，默认 1500），
+默认值按 GitHub 托管 runner 定，CI 直接用默认值；BUDGETS 里按入口单独覆盖
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "400"))
+FIRST_REQUEST_BUDGET_MS = float(os.getenv("FIRST_REQUEST_BUDGET_MS", "1500"))
+
+# 导入阶段不应出现的重依赖（只在真正用到时加载）
+LAZY = ("playwright", "pyotp", "nacl", "telethon")
+
+# 名称 -> (目录, 模块)
+ENTRY_POINTS = {
+    "leaflow": ("leaflow", "Leaflow_checkin"),
+    "incudal": ("Incudal", "Incudal_checkin"),
+    "clawcloud": ("ClawCloud", "ClawCloud_alive"),
+    "github": ("", "update_github_session"),
+    "instances": ("Incudal", "Incudal_instances"),
+    "redeem": ("Incudal", "Incudal_redeem"),
+    "runner": ("", "engine.runner"),
+}
+
+# 名称 -> (导入预算 ms, 首请求预算 ms)，没写的用默认值
+BUDGETS = {}
+
+
+def _snippet(folder, module, url=None):
+    code = (
+        "import sys; "
+        f"sys.path[:0] = [{os.path.join(BASE_DIR, folder)!r}, {BASE_DIR!r}]; "
+        f"import {module}"
+    )
+    if url:
+        code += f"; import requests; requests.get({url!r}, timeout=10)"
+    return code
+
+
+def measure_import(folder, module, cwd):
+    """返回 (累计导入 ms, 导入阶段加载的重依赖)"""
+    r = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _snippet(folder, module)],
+        cwd=cwd, capture_output=True, text=True, timeout=120,
+    )
+    if r.returncode != 0:
+        raise RuntimeError(r.stderr.strip().splitlines()[-1] if r.stderr.strip() else f"exit {r.returncode}")
+
+    total_us = 0
+    heavy = set()
+    for line in r.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        if name == module:
+            total_us = int(parts[1])
+        root = name.split(".")[0]
+        if root in LAZY:
+            heavy.add(root)
+    return total_us / 1000, sorted(heavy)
+
+
+class _FirstHit(BaseHTTPRequestHandler):
+    arrivals = []
+
+    def do_GET(self):
+        self.arrivals.append(time.monotonic())
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def measure_first_request(folder, module, cwd, url):
+    _FirstHit.arrivals.clear()
+    start = time.monotonic()
+    r = subprocess.run(
+        [sys.executable, "-c", _snippet(folder, module, url)],
+        cwd=cwd, capture_output=True, text=True, timeout=120,
+    )
+    if r.returncode != 0 or not _FirstHit.arrivals:
+        raise RuntimeError(r.stderr.strip().splitlines()[-1] if r.stderr.strip() else "未收到请求")
+    return (_FirstHit.arrivals[0] - start) * 1000
+
+
+def main(rounds=3):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _FirstHit)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    failed = False
+    print(f"⏱ [Startup] {rounds} 轮取最小值，导入预算 {IMPORT_BUDGET_MS:.0f}ms，首请求预算 {FIRST_REQUEST_BUDGET_MS:.0f}ms")
+    print(f"{'入口':<10} {'导入':>8} {'首请求':>8}  结果")
+
+    # 入口脚本会在当前目录写日志 / 结果文件，放到临时目录里跑
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, (folder, module) in ENTRY_POINTS.items():
+            import_budget, request_budget = BUDGETS.get(name, (IMPORT_BUDGET_MS, FIRST_REQUEST_BUDGET_MS))
+            try:
+                runs = [measure_import(folder, module, cwd) for _ in range(rounds)]
+                import_ms = min(ms for ms, _ in runs)
+                heavy = sorted({h for _, hs in runs for h in hs})
+                first_ms = min(measure_first_request(folder, module, cwd, url) for _ in range(rounds))
+            except Exception as e:
+                failed = True
+                print(f"{name:<10} {'-':>8} {'-':>8}  ❌ {e}")
+                continue
+
+            problems = []
+            if import_ms > import_budget:
+                problems.append(f"导入超预算 {import_budget:.0f}ms")
+            if first_ms > request_budget:
+                problems.append(f"首请求超预算 {request_budget:.0f}ms")
+            if heavy:
+                problems.append("导入阶段加载了 " + ", ".join(heavy))
+            failed = failed or bool(problems)
+            status = "❌ " + "；".join(problems) if problems else "✅"
+            print(f"{name:<10} {import_ms:7.0f}ms {first_ms:7.0f}ms  {status}")
+
+    server.shutdown()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 3))
@@ -0,0 +1,159 @@
+# engine/bench_waits.py
+# -*- coding: utf-8 -*-
+
+"""
+本地模拟登录流程，对比固定 sleep 和条件等待的耗时
+  python -m engine.bench_waits [轮数]
+流程：登录页(GitHub 按钮) -> GitHub 登录表单 -> /session 302 -> OAuth 授权页 -> 回调 -> 控制台
+页面里挂一个持续轮询的请求，模拟 networkidle 很难达成的真实站点
+"""
+
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from playwright.sync_api import sync_playwright
+
+from engine.waits import wait_url, wait_until, settle
+
+GITHUB_BUTTON = 'button:has-text("GitHub"), a:has-text("GitHub")'
+
+# 页面里每 700ms 发一次请求（真实站点的埋点 / 轮询），networkidle 要等 500ms 空闲才能达成
+POLLER = "<script>setInterval(() => fetch('/ping'), 700)</script>"
+
+PAGES = {
+    "/signin": f'<a href="/gh/login">Continue with GitHub</a>{POLLER}',
+    "/gh/login": (
+        '<form method="post" action="/gh/session">'
+        '<input name="login"><input name="password" type="password">'
+        '<input type="submit" value="Sign in"></form>'
+    ),
+    "/gh/oauth/authorize": (
+        '<form method="post" action="/callback">'
+        '<button name="authorize">Authorize</button></form>'
+    ),
+    "/console": f"<h1>console</h1>{POLLER}",
+}
+
+REDIRECTS = {
+    "/gh/session": "/gh/oauth/authorize",
+    "/callback": "/console",
+}
+
+
+class Handler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        path = self.path.split("?")[0]
+        if path in REDIRECTS:
+            time.sleep(0.2)  # 模拟服务端处理
+            self.send_response(302)
+            self.send_header("Location", REDIRECTS[path])
+            self.end_headers()
+            return
+        body = PAGES.get(path, "ok").encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = _reply
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._reply()
+
+
+def flow_sleep(page, base):
+    """旧写法：固定 sleep + networkidle"""
+    page.goto(f"{base}/signin")
+    try:
+        page.wait_for_load_state("networkidle", timeout=5000)
+    except Exception:
+        pass
+    time.sleep(2)
+    page.locator(GITHUB_BUTTON).first.click()
+    time.sleep(3)
+    try:
+        page.wait_for_load_state("networkidle", timeout=5000)
+    except Exception:
+        pass
+
+    page.fill('input[name="login"]', "user")
+    page.fill('input[name="password"]', "pass")
+    page.click('input[type="submit"]')
+    time.sleep(3)
+    try:
+        page.wait_for_load_state("networkidle", timeout=5000)
+    except Exception:
+        pass
+
+    page.click('button[name="authorize"]')
+    time.sleep(3)
+    try:
+        page.wait_for_load_state("networkidle", timeout=5000)
+    except Exception:
+        pass
+    return "/console" in page.url
+
+
+def flow_waits(page, base):
+    """新写法：engine.waits 条件等待"""
+    page.goto(f"{base}/signin")
+    wait_until(lambda: page.locator(GITHUB_BUTTON).first.is_visible(), 10, page=page)
+    page.locator(GITHUB_BUTTON).first.click()
+    wait_url(page, lambda url: "/gh/" in url, 30)
+    settle(page)
+
+    page.fill('input[name="login"]', "user")
+    page.fill('input[name="password"]', "pass")
+    page.click('input[type="submit"]')
+    wait_url(page, lambda url: not url.endswith(("/gh/login", "/gh/session")), 30)
+    settle(page)
+
+    page.click('button[name="authorize"]')
+    wait_url(page, lambda url: "/oauth/authorize" not in url, 30)
+    return "/console" in page.url
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    print(f"🧪 本地模拟站点 {base}，每种写法 {rounds} 轮")
+
+    results = {}
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        for name, flow in (("sleep", flow_sleep), ("waits", flow_waits)):
+            costs = []
+            for _ in range(rounds):
+                context = browser.new_context()
+                page = context.new_page()
+                start = time.perf_counter()
+                ok = flow(page, base)
+                costs.append(time.perf_counter() - start)
+                context.close()
+                if not ok:
+                    print(f"⚠ {name} 流程未到达控制台")
+            results[name] = costs
+        browser.close()
+    server.shutdown()
+
+    for name, costs in results.items():
+        avg = sum(costs) / len(costs)
+        print(f"⏱ {name:<6} 平均 {avg:.2f}s  最小 {min(costs):.2f}s  最大 {max(costs):.2f}s")
+    before = sum(results["sleep"]) / rounds
+    after = sum(results["waits"]) / rounds
+    print(f"📉 节省 {before - after:.2f}s / 轮（{(1 - after / before) * 100:.0f}%）")
+
+
+if __name__ == "__main__":
+    main()
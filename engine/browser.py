@@ -0,0 +1,122 @@
+# engine/browser.py
+# -*- coding: utf-8 -*-
+
+"""
+浏览器池
+- Playwright 同步 API 的对象只能在创建它的线程里用，所以池 = 固定几个工作线程，
+  每个线程持有自己的 Playwright 驱动 + Chromium，按启动参数缓存复用
+- 脚本里统一写 `with browser_scope() as launch: browser = launch(**launch_args)`
+  单独运行：照旧启动 / 关闭；在池的线程里运行：复用已启动的浏览器，退出时只关 context
+"""
+
+import queue
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+_local = threading.local()  # 池线程上：playwright / browsers（启动参数 -> Browser）
+
+
+def _key(launch_args):
+    return repr(sorted(launch_args.items()))
+
+
+@contextmanager
+def browser_scope():
+    """yield launch(**launch_args) -> Browser"""
+    if getattr(_local, "pooled", False):
+        used = []
+
+        def launch(**launch_args):
+            key = _key(launch_args)
+            browser = _local.browsers.get(key)
+            if browser is None or not browser.is_connected():
+                if _local.playwright is None:
+                    from playwright.sync_api import sync_playwright
+                    _local.playwright = sync_playwright().start()
+                print("🌐 [Browser] 池内启动 Chromium")
+                browser = _local.playwright.chromium.launch(**launch_args)
+                _local.browsers[key] = browser
+            else:
+                print("♻️ [Browser] 复用池内 Chromium")
+            used.append(browser)
+            return browser
+
+        try:
+            yield launch
+        finally:
+            # 浏览器留给下一个任务，只清掉本次打开的 context
+            for browser in used:
+                for context in list(browser.contexts):
+                    try:
+                        context.close()
+                    except Exception:
+                        pass
+        return
+
+    from playwright.sync_api import sync_playwright
+    with sync_playwright() as p:
+        launched = []
+
+        def launch(**launch_args):
+            browser = p.chromium.launch(**launch_args)
+            launched.append(browser)
+            return browser
+
+        try:
+            yield launch
+        finally:
+            for browser in launched:
+                try:
+                    browser.close()
+                except Exception:
+                    pass
+
+
+class BrowserPool:
+    """size 个浏览器线程；submit(fn) 返回 Future，fn 里的 browser_scope() 走池"""
+
+    def __init__(self, size=2):
+        self.tasks = queue.Queue()
+        self.threads = [
+            threading.Thread(target=self._worker, name=f"browser-{i}", daemon=True)
+            for i in range(max(1, size))
+        ]
+        for t in self.threads:
+            t.start()
+
+    def _worker(self):
+        _local.pooled = True
+        _local.playwright = None
+        _local.browsers = {}
+        try:
+            while True:
+                item = self.tasks.get()
+                if item is None:
+                    break
+                fn, args, kwargs, future = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:  # 脚本里的 sys.exit 也要带回来
+                    future.set_exception(e)
+        finally:
+            for browser in _local.browsers.values():
+                try:
+                    browser.close()
+                except Exception:
+                    pass
+            if _local.playwright is not None:
+                _local.playwright.stop()
+
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        self.tasks.put((fn, args, kwargs, future))
+        return future
+
+    def close(self):
+        for _ in self.threads:
+            self.tasks.put(None)
+        for t in self.threads:
+            t.join()
@@ -0,0 +1,44 @@
+# engine/cache.py
+# -*- coding: utf-8 -*-
+
+"""
+本地缓存目录（JSON）
+- 默认放在仓库根目录 .cache/，可用 ENGINE_CACHE_DIR 覆盖
+- 写入走临时文件 + os.replace，中途崩溃不会留下半截文件
+"""
+
+import os
+import json
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.getenv("ENGINE_CACHE_DIR") or os.path.join(BASE_DIR, ".cache")
+
+
+def cache_path(name):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return os.path.join(CACHE_DIR, name)
+
+
+def load_json(name, default=None):
+    path = cache_path(name)
+    if not os.path.exists(path):
+        return default
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"⚠ [Cache] 读取 {name} 失败: {e}")
+        return default
+
+
+def save_json(name, data):
+    path = cache_path(name)
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+        return True
+    except Exception as e:
+        print(f"⚠ [Cache] 写入 {name} 失败: {e}")
+        return False
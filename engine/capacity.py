@@ -0,0 +1,135 @@
+# engine/capacity.py
+# -*- coding: utf-8 -*-
+
+"""
+套餐容量预测
+- 每次创建请求（套餐 id、小时、结果、耗时）追加到状态库 ledger（kind=create_attempt）
+- 按时间衰减的成功率 + 同一时段的成功率估计「现在有空位」的概率
+- 连续几天一直满的套餐降级：只偶尔探一次，不再每轮都打
+- 概率越高轮询越快，反之放慢
+"""
+
+import time
+
+from engine.state import open_state
+
+LEDGER_KIND = "create_attempt"
+MAX_RECORDS = 500           # 每个套餐参与估计的最近记录数
+HISTORY_DAYS = 30           # 只读最近这么多天（更早的记录权重已不到 0.1%）
+HALF_LIFE = 3 * 86400       # 记录权重半衰期
+PRIOR_OK, PRIOR_FAIL = 1, 4 # 先验：没有数据时约 20%
+HOUR_WINDOW = 1             # 同时段 = 前后 1 小时
+STALE_DAYS = 2              # 这么多天没成功过……
+STALE_MIN_FULL = 20         # ……且期间至少满了这么多次，判为长期满
+EXPLORE_INTERVAL = 3 * 3600 # 长期满的套餐每隔多久探一次
+
+
+def _load(now=None):
+    """packageId -> 最近的记录（按时间先后）"""
+    since = (now or time.time()) - HISTORY_DAYS * 86400
+    history = {}
+    for row in open_state().ledger("incudal", kind=LEDGER_KIND, since=since):
+        detail = row["detail"] or {}
+        history.setdefault(row["key"], []).append({
+            "ts": int(row["ts"]),
+            "hour": detail.get("hour"),
+            "outcome": row["status"],
+            "latency": detail.get("latency"),
+            "status": detail.get("status"),
+        })
+    for recs in history.values():
+        del recs[:-MAX_RECORDS]
+    return history
+
+
+def record_attempt(package_id, outcome, latency, status=None):
+    """outcome: ok / full（资源不足）/ error"""
+    open_state().append_ledger(
+        "incudal", None, LEDGER_KIND, str(package_id), outcome,
+        {
+            "hour": time.localtime().tm_hour,
+            "latency": round(latency, 3),
+            "status": status,
+        },
+    )
+
+
+# ==================================================
+# 估计
+# ==================================================
+
+def _hour_near(a, b):
+    d = abs(a - b) % 24
+    return min(d, 24 - d) <= HOUR_WINDOW
+
+
+def probability(recs, now=None):
+    """当前时段有空位的估计概率"""
+    now = now or time.time()
+    hour = time.localtime(now).tm_hour
+    ok = n = h_ok = h_n = 0.0
+    for r in recs:
+        if r["outcome"] == "error":
+            continue
+        w = 0.5 ** ((now - r["ts"]) / HALF_LIFE)
+        hit = w if r["outcome"] == "ok" else 0.0
+        ok += hit
+        n += w
+        if _hour_near(r["hour"], hour):
+            h_ok += hit
+            h_n += w
+    base = (ok + PRIOR_OK) / (n + PRIOR_OK + PRIOR_FAIL)
+    # 同时段样本少时向整体成功率收缩
+    return (h_ok + base * 2) / (h_n + 2)
+
+
+def is_stale(recs, now=None):
+    now = now or time.time()
+    since = now - STALE_DAYS * 86400
+    recent = [r for r in recs if r["ts"] >= since]
+    if any(r["outcome"] == "ok" for r in recent):
+        return False
+    return sum(1 for r in recent if r["outcome"] == "full") >= STALE_MIN_FULL
+
+
+def select(packages, log=print):
+    """
+    返回按概率从高到低排好的套餐；长期满的套餐在探测间隔内跳过
+    全部被跳过时返回空列表：每个长期满的套餐每 EXPLORE_INTERVAL 只探一次，不会完全停摆
+    """
+    now = time.time()
+    history = _load(now)
+    scored = []
+    for pkg in packages:
+        recs = history.get(str(pkg["id"]), [])
+        p = probability(recs, now)
+        if is_stale(recs, now) and now - max(r["ts"] for r in recs) < EXPLORE_INTERVAL:
+            log(f"🧊 [Capacity] packageId={pkg['id']} 连续 {STALE_DAYS} 天满载，本轮跳过")
+            continue
+        scored.append((p, pkg))
+
+    scored.sort(key=lambda x: -x[0])
+    return [pkg for _, pkg in scored]
+
+
+def due(packages, interval=EXPLORE_INTERVAL):
+    """
+    距离上次创建请求已超过 interval 的套餐（从没试过的也算）
+    给没有库存字段、只能靠创建试探的套餐限频
+    """
+    now = time.time()
+    history = _load(now)
+    return [
+        pkg for pkg in packages
+        if now - max((r["ts"] for r in history.get(str(pkg["id"]), [])), default=0) >= interval
+    ]
+
+
+def poll_interval(packages, min_interval, max_interval):
+    """最有希望的套餐概率越高，轮询越快"""
+    if not packages:
+        return max_interval
+    now = time.time()
+    history = _load(now)
+    best = max(probability(history.get(str(pkg["id"]), []), now) for pkg in packages)
+    return min_interval + (max_interval - min_interval) * (1 - best) ** 2
@@ -0,0 +1,91 @@
+# engine/code_index.py
+# -*- coding: utf-8 -*-
+
+"""
+兑换码去重索引
+- 精确存储：状态库 ledger（kind=code）按码追加状态变化，加载时取每个码的最后一条
+  得到 code -> 状态（pending / ok / dead）、实例、时间
+- claim() 在任何网络请求之前调用，已兑换 / 已失效 / 正在兑换的码直接跳过
+- 只有服务端明确说码不可用（CODE_DEAD_PATTERNS）才记 dead；网络错误、超时调用方 release()，下次还能兑换
+- 进程崩溃留下的 pending 超过 PENDING_TTL 后允许重试
+"""
+
+import time
+import threading
+
+from engine.state import open_state
+
+LEDGER_KIND = "code"
+RELEASED = "released"
+PENDING_TTL = 600
+
+# 早期把网络错误也记成 fail，不能据此永久跳过，加载时当作没处理过
+RETRYABLE = {RELEASED, "fail"}
+
+
+class CodeIndex:
+
+    def __init__(self, kind=LEDGER_KIND):
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.codes = self._load()
+
+    def _load(self):
+        codes = {}
+        for row in open_state().ledger("incudal", kind=self.kind):
+            if row["status"] in RETRYABLE:
+                codes.pop(row["key"], None)
+            else:
+                codes[row["key"]] = dict(row["detail"] or {}, status=row["status"])
+        return codes
+
+    def _save(self, code):
+        """只追加这一个码的新状态，不重写整个索引"""
+        rec = dict(self.codes.get(code) or {"status": RELEASED})
+        status = rec.pop("status")
+        open_state().append_ledger("incudal", None, self.kind, code, status, rec or None)
+
+    def get(self, code):
+        return self.codes.get(code)
+
+    def claim(self, code):
+        """没处理过返回 True 并标记 pending；否则返回 False（调用方跳过）"""
+        with self.lock:
+            rec = self.get(code)
+            if rec and not (
+                rec["status"] == "pending"
+                and time.time() - rec["updated_at"] > PENDING_TTL
+            ):
+                return False
+            now = int(time.time())
+            self.codes[code] = {
+                "status": "pending",
+                "first_seen": (rec or {}).get("first_seen", now),
+                "updated_at": now,
+            }
+            self._save(code)
+            return True
+
+    def record(self, code, ok, instance=None, error=None):
+        """ok=False 只用于码确定失效（之后永久跳过）；暂时性失败用 release()"""
+        with self.lock:
+            rec = self.codes.setdefault(code, {"first_seen": int(time.time())})
+            rec["status"] = "ok" if ok else "dead"
+            rec["updated_at"] = int(time.time())
+            if instance is not None:
+                rec["instance"] = instance
+            if error:
+                rec["error"] = error
+            self._save(code)
+
+    def release(self, code):
+        """本次没能处理（非码本身的问题），删掉 pending，允许再次 claim"""
+        with self.lock:
+            rec = self.codes.get(code)
+            if rec and rec.get("status") == "pending":
+                del self.codes[code]
+                self._save(code)
+
+    def describe(self, code):
+        rec = self.codes.get(code) or {}
+        return {"ok": "已兑换", "dead": "已失效", "pending": "兑换中"}.get(rec.get("status"), "未知")
@@ -0,0 +1,427 @@
+# engine/github_identity.py
+# -*- coding: utf-8 -*-
+
+"""
+GitHub 身份代理（所有走 GitHub OAuth 的站点共用）
+- 校验：GH_SESSION 先走纯 HTTP 校验，结果本次运行内缓存
+- 上下文：new_context() 返回已注入 GitHub 登录 cookie 的 Playwright context
+- 登录：密码 + 设备验证 + 两步验证（GitHub Mobile / TOTP / Telegram /code），
+  一次运行只登录一次，之后其它站点直接复用新 session
+- 持久化：新 session 与已保存的不同才回写 GH_SESSION，避免多处互相覆盖
+"""
+
+import os
+import re
+import time
+import threading
+
+from engine.state import open_state, default_account
+from engine.history import step
+from engine.telegram_bot import Telegram
+from engine.github_session import validate_session, session_cookies, mark_valid
+from engine.locate import race
+from engine.waits import wait_url, wait_until, wait_selector, settle
+
+DEVICE_VERIFY_WAIT = int(os.getenv("DEVICE_VERIFY_WAIT", "30"))  # 设备验证 默认等 30 秒
+TWO_FACTOR_WAIT = int(os.getenv("TWO_FACTOR_WAIT", "120"))       # 2FA验证 默认等 120 秒
+
+LOGIN_PAGE = re.compile(r"github\.com/(login|session)/?(\?|$)")
+OTP_INPUTS = 'input[autocomplete="one-time-code"], input[name="app_otp"], input#app_totp, input[name="otp"], input#otp'
+
+# 同一进程内的所有实例共享：用户名 -> 本次运行登录得到的新 session
+_refreshed = {}
+_login_lock = threading.RLock()
+
+
+def _print_log(msg, level="INFO"):
+    icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "STEP": "🔹"}
+    print(f"{icons.get(level, '•')} {msg}", flush=True)
+
+
+def _default_shot(page, name):
+    path = f"{name}.png"
+    try:
+        page.screenshot(path=path)
+    except Exception:
+        pass
+    return path
+
+
+def _default_save_secret(name, value):
+    from engine.secret_writer import write_secret
+    return write_secret(name, value)
+
+
+class GitHubIdentity:
+    """
+    tg: 有 send / photo / wait_code 的对象；log(msg, level)；shot(page, name) -> 路径
+    save_secret(name, value) -> bool（None 表示已被其它运行更新，未写入）
+    """
+
+    def __init__(self, username=None, password=None, totp_secret=None, user_session=None,
+                 tg=None, log=None, shot=None, save_secret=None):
+        self.username = username or os.getenv("GH_USERNAME")
+        self.password = password or os.getenv("GH_PASSWORD")
+        self.totp_secret = totp_secret or os.getenv("GH_2FA_SECRET")
+        self.account = self.username or default_account()
+        if user_session is None:
+            # 本地状态库优先（GH_SESSION 有更新时会先导入）
+            user_session = open_state().load("GH_SESSION", self.account) or ""
+        self.user_session = user_session.strip()
+        self.initial_session = self.user_session
+        self.tg = tg or Telegram()
+        self.log = log or _print_log
+        self.shot = shot or _default_shot
+        self.save_secret = save_secret or _default_save_secret
+
+    # ==================================================
+    # 校验 / 上下文
+    # ==================================================
+
+    def validate(self):
+        """True 有效 / False 失效 / None 无法判断（本次运行缓存）"""
+        if not self.user_session:
+            return False
+        valid, detail = validate_session(self.user_session)
+        self.log(f"GH_SESSION 校验: {detail}")
+        return valid
+
+    def new_context(self, browser, **kwargs):
+        """返回注入了 GitHub 登录 cookie 的 context（已知失效时不注入）"""
+        # 其它站点本次运行已经登录过，直接用新 session
+        if _refreshed.get(self.username):
+            self.user_session = _refreshed[self.username]
+        context = browser.new_context(**kwargs)
+        if self.user_session and self.validate() is not False:
+            try:
+                context.add_cookies(session_cookies(self.user_session))
+                self.log("已加载 Session Cookie", "SUCCESS")
+            except Exception:
+                self.log("加载 Cookie 失败", "WARN")
+        return context
+
+    @staticmethod
+    def context_session(context):
+        try:
+            for c in context.cookies():
+                if c['name'] == 'user_session' and 'github' in c.get('domain', ''):
+                    return c['value']
+        except Exception:
+            pass
+        return None
+
+    # ==================================================
+    # 登录
+    # ==================================================
+
+    def login(self, page, context):
+        """在 GitHub 登录页上完成登录；本次运行已登录过则直接换上新 cookie"""
+        with _login_lock:
+            refreshed = _refreshed.get(self.username)
+            if refreshed and self.context_session(context) != refreshed:
+                self.log("复用本次运行已登录的 GitHub 会话", "STEP")
+                context.add_cookies(session_cookies(refreshed))
+                page.reload()
+                if wait_url(page, lambda url: not LOGIN_PAGE.search(url), 15):
+                    return True
+                self.log("复用失败，重新登录", "WARN")
+
+            with step("github", "login", self.account) as s:
+                ok = self._login(page)
+                s.outcome = "ok" if ok else "fail"
+            if not ok:
+                return False
+
+            new = self.context_session(context)
+            if new:
+                self.user_session = _refreshed[self.username] = new
+                mark_valid(new)
+            return True
+
+    def _login(self, page):
+        self.log("登录 GitHub...", "STEP")
+        self.shot(page, "github_登录页")
+
+        try:
+            page.locator('input[name="login"]').fill(self.username)
+            page.locator('input[name="password"]').fill(self.password)
+            self.log("已输入凭据")
+        except Exception as e:
+            self.log(f"输入失败: {e}", "ERROR")
+            return False
+
+        self.shot(page, "github_已填写")
+
+        try:
+            page.locator('input[type="submit"], button[type="submit"]').first.click()
+        except Exception:
+            pass
+
+        # 等离开 /login、/session 表单页，或出现错误提示
+        wait_until(
+            lambda: not LOGIN_PAGE.search(page.url)
+            or page.locator('.flash-error').first.is_visible(),
+            30, page=page
+        )
+        settle(page)
+        self.shot(page, "github_登录后")
+
+        url = page.url
+        self.log(f"当前: {url}")
+
+        # 设备验证
+        if 'verified-device' in url or 'device-verification' in url:
+            if not self.wait_device(page):
+                return False
+            settle(page)
+            self.shot(page, "验证后")
+
+        # 2FA
+        if 'two-factor' in page.url:
+            self.log("需要两步验证！", "WARN")
+            self.shot(page, "两步验证")
+
+            # GitHub Mobile：等待你在手机上批准
+            if 'two-factor/mobile' in page.url:
+                if not self.wait_two_factor_mobile(page):
+                    return False
+            # 其它两步验证方式（TOTP/恢复码等）
+            elif not self.handle_2fa_code_input(page):
+                return False
+            # 通过后等页面稳定
+            settle(page)
+
+        # 错误
+        try:
+            err = page.locator('.flash-error').first
+            if err.is_visible(timeout=2000):
+                self.log(f"错误: {err.inner_text()}", "ERROR")
+                return False
+        except Exception:
+            pass
+
+        return True
+
+    def wait_device(self, page):
+        """等待设备验证（导航事件驱动，批准后立即返回，不 reload）"""
+        self.log(f"需要设备验证，等待 {DEVICE_VERIFY_WAIT} 秒...", "WARN")
+        shot = self.shot(page, "设备验证")
+
+        self.tg.send(f"""⚠️ <b>需要设备验证</b>
+
+请在 {DEVICE_VERIFY_WAIT} 秒内批准：
+1️⃣ 检查邮箱点击链接
+2️⃣ 或在 GitHub App 批准""")
+        if shot:
+            self.tg.photo(shot, "设备验证页面")
+
+        passed = wait_url(
+            page,
+            lambda url: 'verified-device' not in url and 'device-verification' not in url,
+            DEVICE_VERIFY_WAIT,
+            tick=5,
+            on_tick=lambda sec: self.log(f"  等待... ({sec}/{DEVICE_VERIFY_WAIT}秒)")
+        )
+        if passed:
+            self.log("设备验证通过！", "SUCCESS")
+            self.tg.send("✅ <b>设备验证通过</b>")
+            return True
+
+        self.log("设备验证超时", "ERROR")
+        self.tg.send("❌ <b>设备验证超时</b>")
+        return False
+
+    def wait_two_factor_mobile(self, page):
+        """等待 GitHub Mobile 两步验证批准（导航事件驱动，不 reload）"""
+        self.log(f"需要两步验证（GitHub Mobile），等待 {TWO_FACTOR_WAIT} 秒...", "WARN")
+
+        # 先截图并立刻发出去（让你看到数字）
+        shot = self.shot(page, "two_factor_mobile_init")
+        self.tg.send(
+            f"⚠️ <b>需要两步验证（GitHub Mobile）</b>\n\n"
+            f"请在手机 GitHub App 中批准本次登录\n"
+            f"⏳ 等待时间：{TWO_FACTOR_WAIT} 秒"
+        )
+        if shot:
+            self.tg.photo(shot, "两步验证页面（首次）")
+
+        # 每 10 秒补一张截图（不触发任何请求，防止你没看到数字）
+        def on_tick(sec):
+            self.log(f"  等待中... ({sec}/{TWO_FACTOR_WAIT} 秒)")
+            shot = self.shot(page, f"two_factor_mobile_{sec}s")
+            if shot:
+                self.tg.photo(shot, f"两步验证页面（{sec}s）")
+
+        # 不 reload，只等导航事件：离开 two-factor 流程立即返回
+        left = wait_url(
+            page,
+            lambda url: "github.com/sessions/two-factor/" not in url,
+            TWO_FACTOR_WAIT,
+            tick=10,
+            on_tick=on_tick
+        )
+
+        if not left:
+            self.log("两步验证超时", "ERROR")
+            self.tg.send("❌ <b>两步验证超时</b>")
+            return False
+
+        # ❌ 被 GitHub 打回登录页（OAuth 授权页不算）
+        if re.search(r"github\.com/login/?(\?|$)", page.url):
+            self.log("两步验证失败，被返回登录页", "ERROR")
+            self.tg.send("❌ <b>两步验证失败，需要重新登录</b>")
+            return False
+
+        self.log("两步验证通过！", "SUCCESS")
+        self.tg.send("✅ <b>两步验证通过</b>")
+        return True
+
+    def handle_2fa_code_input(self, page):
+        """处理 TOTP 验证码输入（优先用密钥计算，否则通过 Telegram 发送 /code 123456）"""
+        self.log("需要输入验证码", "WARN")
+        shot = self.shot(page, "两步验证_code")
+
+        # 先尝试点击"Use an authentication app"或类似按钮（如果在 mobile 页面）
+        try:
+            more_options = [
+                'a:has-text("Use an authentication app")',
+                'a:has-text("Enter a code")',
+                'button:has-text("Use an authentication app")',
+                '[href*="two-factor/app"]'
+            ]
+            el, _ = race(page, more_options, "2fa:more_options", 2, log=self.log)
+            if el:
+                el.click()
+                # 等 OTP 输入框出现即可
+                wait_selector(page, OTP_INPUTS, 15)
+                self.log("已切换到验证码输入页面", "SUCCESS")
+                shot = self.shot(page, "两步验证_code_切换后")
+        except Exception:
+            pass
+        if shot:
+            self.tg.photo(shot, "两步验证页面")
+
+        code = None
+        if self.totp_secret:
+            self.log("🔢 正在计算动态验证码 (TOTP)...")
+            try:
+                import pyotp
+                code = pyotp.TOTP(self.totp_secret).now()
+                self.log("已生成 TOTP 验证码", "SUCCESS")
+            except Exception:
+                code = None
+
+        if not code:
+            self.log("需要手动输入验证码", "WARN")
+            # 从发提示前开始算，提示发出后很快回复的 /code 也能收到
+            asked_at = time.time()
+            self.tg.send(
+                f"🔐 <b>需要验证码登录</b>\n\n"
+                f"请发送：<code>/code 123456</code>\n"
+                f"等待 {TWO_FACTOR_WAIT} 秒"
+            )
+            code = self.tg.wait_code(timeout=TWO_FACTOR_WAIT, since=asked_at)
+
+        if not code:
+            self.log("验证码获取失败", "ERROR")
+            return False
+
+        # 不打印验证码明文，只提示收到
+        self.log("   获取到验证码，正在填入...", "SUCCESS")
+
+        # 常见 OTP 输入框 selector（优先级排序）
+        selectors = [
+            'input[autocomplete="one-time-code"]',
+            'input[name="app_otp"]',
+            'input[name="otp"]',
+            'input#app_totp',
+            'input#otp',
+            'input[inputmode="numeric"]'
+        ]
+
+        el, _ = race(page, selectors, "2fa:otp", 5, log=self.log)
+        if el:
+            try:
+                el.fill(code)
+                self.log("已填入验证码", "SUCCESS")
+
+                # 优先点击 Verify 按钮，不行再 Enter
+                verify_btns = [
+                    'button:has-text("Verify")',
+                    'button[type="submit"]',
+                    'input[type="submit"]'
+                ]
+                btn, _ = race(page, verify_btns, "2fa:verify", 1, log=self.log)
+                if btn:
+                    btn.click()
+                    self.log("已点击 Verify 按钮", "SUCCESS")
+                else:
+                    page.keyboard.press("Enter")
+                    self.log("已按 Enter 提交", "SUCCESS")
+
+                # 离开 two-factor 即通过，出现错误提示立即停止等待
+                wait_until(
+                    lambda: "github.com/sessions/two-factor/" not in page.url
+                    or page.locator('.flash-error').first.is_visible(),
+                    60, page=page
+                )
+                settle(page)
+                self.shot(page, "验证码提交后")
+
+                # 检查是否通过
+                if "github.com/sessions/two-factor/" not in page.url:
+                    self.log("验证码验证通过！", "SUCCESS")
+                    self.tg.send("✅ <b>验证码验证通过</b>")
+                    return True
+                self.log("验证码可能错误", "ERROR")
+                self.tg.send("❌ <b>验证码可能错误，请检查后重试</b>")
+                return False
+            except Exception as e:
+                self.log(f"填写验证码异常: {e}", "ERROR")
+
+        self.log("没找到验证码输入框", "ERROR")
+        self.tg.send("❌ <b>没找到验证码输入框</b>")
+        return False
+
+    # ==================================================
+    # 持久化
+    # ==================================================
+
+    def persist(self, context=None):
+        """
+        把当前 GitHub session 回写到 GH_SESSION
+        与启动时的值、以及上次回写的值相同时跳过，避免多个 workflow 反复覆盖
+        """
+        with _login_lock:
+            value = (self.context_session(context) if context else None) or self.user_session
+            if not value:
+                self.log("未获取到新 Cookie", "WARN")
+                return False
+
+            store = open_state()
+            store.put("github", self.account, "session", value)
+            if value == self.initial_session or not store.dirty("GH_SESSION", self.account):
+                self.log("GH_SESSION 未变化，无需回写")
+                return True
+
+            self.log(f"新 Cookie: {value[:15]}...{value[-8:]}", "SUCCESS")
+            saved = self.save_secret('GH_SESSION', value)
+            if saved is None:
+                # 别的 workflow 已经回写了更新的 session，两边都有效，不覆盖
+                self.log("GH_SESSION 已被其它运行更新，跳过回写")
+                return True
+            if saved:
+                self.log("已自动更新 GH_SESSION", "SUCCESS")
+                self.tg.send("🔑 <b>Cookie 已自动更新</b>\n\nGH_SESSION 已保存")
+                store.mark_exported("GH_SESSION", self.account)
+                self.initial_session = value
+                return True
+
+            # 通过 Telegram 发送
+            self.tg.send(f"""🔑 <b>新 Cookie</b>
+
+请更新 Secret <b>GH_SESSION</b>:
+<code>{value}</code>""")
+            self.log("已通过 Telegram 发送 Cookie", "SUCCESS")
+            return False
+
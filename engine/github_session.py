@@ -0,0 +1,79 @@
+# engine/github_session.py
+# -*- coding: utf-8 -*-
+
+"""
+GitHub 登录态（user_session）校验
+- 纯 HTTP：带 user_session / logged_in cookie 请求需要登录的页面，不跟随重定向
+- 200 = 有效；重定向到 /login = 失效；其它（网络错误、限流等）= 未知，交给浏览器确认
+- 结果在本次运行内缓存，多处调用只发一次请求
+"""
+
+import hashlib
+
+import requests
+
+from engine.history import record
+
+CHECK_URL = "https://github.com/settings/profile"
+HEADERS = {"User-Agent": "Mozilla/5.0 Chrome/143.0"}
+
+_results = {}  # fingerprint(user_session) -> (valid, detail)
+
+
+def fingerprint(user_session):
+    return hashlib.sha256((user_session or "").encode()).hexdigest()[:16]
+
+
+def mark_valid(user_session):
+    """刚登录拿到的 session，本次运行内不必再校验"""
+    _results[fingerprint(user_session)] = (True, "本次运行登录获得")
+
+
+def session_cookies(user_session):
+    """注入浏览器用的 GitHub 登录 cookie（Playwright add_cookies 格式）"""
+    return [
+        {"name": "user_session", "value": user_session, "domain": "github.com", "path": "/"},
+        {"name": "logged_in", "value": "yes", "domain": "github.com", "path": "/"},
+    ]
+
+
+def validate_session(user_session, timeout=10):
+    """
+    返回 (valid, 说明)
+    valid: True 有效 / False 失效 / None 无法判断
+    """
+    if not user_session:
+        return False, "未提供 user_session"
+
+    key = fingerprint(user_session)
+    if key in _results:
+        return _results[key]
+
+    try:
+        r = requests.get(
+            CHECK_URL,
+            headers=HEADERS,
+            cookies={
+                "user_session": user_session,
+                "__Host-user_session_same_site": user_session,
+                "logged_in": "yes",
+            },
+            allow_redirects=False,
+            timeout=timeout,
+        )
+    except Exception as e:
+        return None, f"请求异常: {e}"
+
+    location = r.headers.get("Location", "")
+    outcome = {200: "ok"}.get(r.status_code, "fail" if "/login" in location else "unknown")
+    record("github", "validate", r.elapsed.total_seconds(), r.status_code, outcome)
+    if r.status_code == 200:
+        result = (True, f"HTTP 200（{r.elapsed.total_seconds() * 1000:.0f}ms）")
+    elif r.is_redirect and "/login" in location:
+        result = (False, f"HTTP {r.status_code} -> {location}")
+    else:
+        # 限流 / 5xx / 其它重定向不下结论，也不缓存
+        return None, f"HTTP {r.status_code} {location}".strip()
+
+    _results[key] = result
+    return result
@@ -0,0 +1,107 @@
+# engine/history.py
+# -*- coding: utf-8 -*-
+
+"""
+运行历史（时间序列）
+- 每个步骤的耗时 / HTTP 状态码 / 结果追加到状态库 metrics 表（只追加，不改不删）
+- step()      计时一个代码块，异常记为 fail 并继续抛出
+- record()    直接记一条
+- track_http() 给 requests.Session 挂响应钩子，每个请求按「方法 + 路径模板」记一条
+- StepTimer   跟着脚本的「步骤」日志分段计时：mark() 结束上一段、开始下一段，finish() 收尾并记总耗时
+- RUN_ID 区分同一次运行的记录（Actions 里用 GITHUB_RUN_ID）
+汇总见 engine.report（python -m engine report）
+"""
+
+import os
+import re
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from engine.state import open_state
+
+RUN_ID = os.getenv("GITHUB_RUN_ID") or str(int(time.time()))
+
+_ID = re.compile(r"/\d+(?=/|$)")
+
+
+def record(provider, step, seconds=None, status=None, outcome="ok", account=None):
+    try:
+        open_state().record_metric(provider, step, seconds, status, outcome, account, RUN_ID)
+    except Exception as e:
+        # 记录失败不能影响主流程
+        print(f"⚠ [History] 记录 {provider}/{step} 失败: {e}")
+
+
+class _Step:
+    status = None
+    outcome = "ok"
+
+
+@contextmanager
+def step(provider, name, account=None):
+    """with step("incudal", "checkin") as s: ...; 可设置 s.status / s.outcome"""
+    s = _Step()
+    start = time.monotonic()
+    try:
+        yield s
+    except BaseException:
+        s.outcome = "fail"
+        raise
+    finally:
+        record(provider, name, time.monotonic() - start, s.status, s.outcome, account)
+
+
+class StepTimer:
+
+    def __init__(self, provider, account=None):
+        self.provider = provider
+        self.account = account
+        self.started = time.monotonic()
+        self.current = None  # (名称, 开始时间)
+        self.done = False
+
+    @staticmethod
+    def _name(msg):
+        # "步骤2: 点击 GitHub（最大重试3次…）" -> "步骤2: 点击 GitHub"
+        return re.split(r"[（(]", msg, 1)[0].strip(" .…") or msg
+
+    def mark(self, msg):
+        if self.done:
+            return
+        now = time.monotonic()
+        if self.current:
+            record(self.provider, self.current[0], now - self.current[1], account=self.account)
+        self.current = (self._name(msg), now)
+
+    def finish(self, outcome="ok"):
+        """最后一段和总耗时按 outcome 记录；只生效一次"""
+        if self.done:
+            return
+        self.done = True
+        now = time.monotonic()
+        if self.current:
+            record(self.provider, self.current[0], now - self.current[1], outcome=outcome, account=self.account)
+        record(self.provider, "total", now - self.started, outcome=outcome, account=self.account)
+
+
+def http_step(method, url):
+    """GET /api/instances/123/redeem -> GET /api/instances/{id}/redeem"""
+    return f"{method} {_ID.sub('/{id}', urlparse(url).path or '/')}"
+
+
+def track_http(session, provider, account=None):
+    """每个响应记一条：耗时取 r.elapsed（首字节），4xx / 5xx 记为 fail"""
+
+    def hook(r, *args, **kwargs):
+        record(
+            provider,
+            http_step(r.request.method, r.request.url),
+            r.elapsed.total_seconds(),
+            r.status_code,
+            "ok" if r.status_code < 400 else "fail",
+            account,
+        )
+
+    session.hooks["response"].append(hook)
+    return session
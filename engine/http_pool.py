@@ -0,0 +1,164 @@
+# engine/http_pool.py
+# -*- coding: utf-8 -*-
+
+"""
+连接池 + 自适应限速
+- 一个 requests.Session 挂上 PacedAdapter，多线程共用同一个连接池
+- 平时不 sleep；只有服务端返回 429 / 5xx 时整体退避，之后逐步恢复
+- 只重试幂等请求；POST 只在 429 + Retry-After 或连接未建立时重发
+- run_concurrent 并发执行任务，结果按输入顺序返回
+- run_background 在 daemon 线程里跑一个任务，返回 Future
+- 两者都把调用方的 scope（当前脚本名）带进工作线程
+- shared_session 进程内共用的无状态 Session（通知 / Secret 回写），多个脚本同进程运行时复用连接
+"""
+
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from engine import scope
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE", "OPTIONS"}
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+class AdaptivePacer:
+    """所有请求共享的退避状态"""
+
+    def __init__(self, min_delay=0.0, max_delay=30.0, factor=2.0):
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.delay = min_delay
+        self.next_at = 0.0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            start = max(now, self.next_at)
+            self.next_at = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def observe(self, status, retry_after=None):
+        with self.lock:
+            if status in RETRY_STATUS:
+                grown = max(self.delay * self.factor, 0.5)
+                self.delay = min(self.max_delay, max(grown, retry_after or 0))
+                self.next_at = time.monotonic() + self.delay
+                print(f"🐢 [Pacer] HTTP {status}，退避 {self.delay:.1f}s")
+            elif self.delay > self.min_delay:
+                self.delay = max(self.min_delay, self.delay / self.factor)
+                if self.delay < 0.05:
+                    self.delay = self.min_delay
+
+
+def _retry_after(resp):
+    value = resp.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _retryable(method, status, retry_after):
+    """
+    幂等方法 429 / 5xx 都重试；POST 等非幂等请求只在服务端明确要求（429 + Retry-After）时重试，
+    5xx 时服务端可能已经处理过（重复兑换 / 签到）
+    """
+    if status not in RETRY_STATUS:
+        return False
+    if method.upper() in IDEMPOTENT_METHODS:
+        return True
+    return status == 429 and retry_after is not None
+
+
+class PacedAdapter(HTTPAdapter):
+    """
+    发送前排队，429 / 5xx 时按 pacer 退避（所有方法），只有可以安全重发的请求才重试
+    连接没建立起来（请求还没发出去）时由 urllib3 重连，任何方法都安全
+    """
+
+    def __init__(self, pacer, retries=3, **kwargs):
+        self.pacer = pacer
+        self.retries = retries
+        kwargs.setdefault("max_retries", Retry(total=None, connect=retries, read=0, status=0, other=0, redirect=False))
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        for attempt in range(self.retries + 1):
+            self.pacer.wait()
+            resp = super().send(request, **kwargs)
+            retry_after = _retry_after(resp)
+            self.pacer.observe(resp.status_code, retry_after)
+            if attempt == self.retries or not _retryable(request.method, resp.status_code, retry_after):
+                return resp
+            print(f"🔁 [Pacer] {request.method} {request.url} 第 {attempt + 1} 次重试")
+            resp.close()
+        return resp
+
+
+def mount_paced(session, pool_size=10, retries=3, pacer=None):
+    """给 session 挂上共享连接池和自适应限速，返回 pacer"""
+    pacer = pacer or AdaptivePacer()
+    adapter = PacedAdapter(
+        pacer,
+        retries=retries,
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return pacer
+
+
+def run_concurrent(fn, items, workers=8):
+    """并发执行 fn(item)，按 items 顺序返回 [(item, result | Exception)]"""
+    items = list(items)
+    if not items:
+        return []
+    fn = scope.wrap(fn)
+
+    def call(item):
+        try:
+            return fn(item)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(zip(items, pool.map(call, items)))
+
+
+def run_background(fn, *args, **kwargs):
+    """daemon 线程执行 fn，返回 Future（不阻塞进程退出）"""
+    future = Future()
+    fn = scope.wrap(fn)
+
+    def worker():
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=worker, daemon=True).start()
+    return future
+
+
+def shared_session(pool_size=16):
+    """进程内共用的 Session（只放不带登录态的请求，如 Telegram / GitHub API）"""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _shared.mount("https://", adapter)
+            _shared.mount("http://", adapter)
+        return _shared
@@ -0,0 +1,105 @@
+# engine/locate.py
+# -*- coding: utf-8 -*-
+
+"""
+选择器竞速
+- 候选选择器合成一个 locator 同时等待，谁先可见用谁，不再逐个 is_visible 超时
+- 胜出的选择器按「流程 + 页面」记到 .cache/selector_cache.json，下次排在最前
+- 每次解析耗时按脚本记在 TIMINGS，summary() 给出汇总，附在运行报告里
+"""
+
+import time
+import threading
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from engine.cache import load_json, save_json
+from engine.waits import playwright_timeout
+from engine import scope
+
+CACHE_NAME = "selector_cache.json"
+
+# 脚本名（engine run 下，单独运行时为 ""）-> [(flow, selector | None, 秒)]
+TIMINGS = defaultdict(list)
+
+_lock = threading.Lock()
+
+
+def page_key(page):
+    """域名 + 第一级路径，例：github.com/sessions"""
+    try:
+        u = urlparse(page.url)
+    except Exception:
+        return "?"
+    first = (u.path or "/").strip("/").split("/")[0]
+    return f"{u.hostname or '?'}/{first}"
+
+
+def _ordered(selectors, cached):
+    if cached in selectors:
+        return [cached] + [s for s in selectors if s != cached]
+    return list(selectors)
+
+
+def remember(key, selector, cost):
+    with _lock:
+        cache = load_json(CACHE_NAME, {}) or {}
+        rec = cache.get(key) or {}
+        if rec.get("selector") != selector:
+            rec = {"selector": selector, "hits": 0}
+        rec["hits"] += 1
+        rec["last_ms"] = round(cost * 1000)
+        rec["updated_at"] = int(time.time())
+        cache[key] = rec
+        save_json(CACHE_NAME, cache)
+
+
+def race(page, selectors, flow, timeout=5, log=print):
+    """
+    同时等待所有候选选择器，返回 (第一个可见的 locator, 选择器)，超时返回 (None, None)
+    flow 用来区分同一页面上的不同用途（GitHub 按钮 / OTP 输入框 ...）
+    """
+    key = f"{flow}@{page_key(page)}"
+    cache = load_json(CACHE_NAME, {}) or {}
+    ordered = _ordered(selectors, (cache.get(key) or {}).get("selector"))
+
+    start = time.monotonic()
+    winner = None
+    try:
+        combined = page.locator(", ".join(ordered) + " >> visible=true").first
+        combined.wait_for(state="visible", timeout=timeout * 1000)
+        # 多个同时可见时按优先级（缓存命中的在最前）取
+        for s in ordered:
+            if page.locator(s).first.is_visible():
+                winner = s
+                break
+    except playwright_timeout():
+        pass
+    except Exception as e:
+        log(f"⚠ [Locate] {flow} 解析异常: {e}")
+
+    cost = time.monotonic() - start
+    with _lock:
+        TIMINGS[scope.current()].append((flow, winner, cost))
+
+    if not winner:
+        log(f"🔍 [Locate] {flow} 未找到（{cost:.2f}s）")
+        return None, None
+
+    log(f"🔍 [Locate] {flow} -> {winner}（{cost * 1000:.0f}ms）")
+    remember(key, winner, cost)
+    return page.locator(winner).first, winner
+
+
+def summary(provider=None):
+    """选择器解析耗时汇总（默认当前脚本的），没有记录返回空串"""
+    with _lock:
+        timings = list(TIMINGS.get(scope.current() if provider is None else provider, ()))
+    if not timings:
+        return ""
+    total = sum(cost for _, _, cost in timings)
+    parts = [
+        f"{flow} {cost:.2f}s" + ("" if sel else "(未找到)")
+        for flow, sel, cost in timings
+    ]
+    return f"选择器解析 {total:.2f}s：" + "，".join(parts)
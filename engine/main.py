@@ -1,12 +1,8 @@
 # -*- coding: utf-8 -*-
 import re
-import os
-import base64
 import requests
-from nacl import public, encoding
 
-REPO = os.getenv("GITHUB_REPOSITORY")
-REPO_TOKEN = os.getenv("REPO_TOKEN")
+from engine.secret_writer import write_secret
 
 # ==================================================
 # GitHub Secret 回写
@@ -19,44 +15,7 @@ class SecretUpdater:
 
     def update(self, value):
         print("📝 准备回写 GitHub Secret")
-
-        if not REPO or not REPO_TOKEN:
-            print("⚠ 未配置 GITHUB_REPOSITORY / REPO_TOKEN，跳过")
-            return
-
-        headers = {
-            "Authorization": f"token {REPO_TOKEN}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-
-        print(f"🌐 获取公钥: {REPO}")
-        r = requests.get(
-            f"https://api.github.com/repos/{REPO}/actions/secrets/public-key",
-            headers=headers,
-            timeout=30
-        )
-
-        print(f"⬅️ 公钥接口返回 {r.status_code}")
-        r.raise_for_status()
-
-        key = r.json()
-
-        print("🔑 开始加密 Secret")
-        pk = public.PublicKey(key["key"].encode(), encoding.Base64Encoder())
-        encrypted = public.SealedBox(pk).encrypt(value.encode())
-
-        print(f"📤 提交 Secret: {self.name}")
-        r = requests.put(
-            f"https://api.github.com/repos/{REPO}/actions/secrets/{self.name}",
-            headers=headers,
-            json={
-                "encrypted_value": base64.b64encode(encrypted).decode(),
-                "key_id": key["key_id"]
-            },
-            timeout=30
-        )
-
-        print(f"✅ 回写完成，HTTP {r.status_code}")
+        return write_secret(self.name, value)
 
 
 # ==================================================
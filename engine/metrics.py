@@ -0,0 +1,74 @@
+# engine/metrics.py
+# -*- coding: utf-8 -*-
+
+"""
+延迟直方图
+- 固定毫秒分桶，线程安全
+- render() 输出文本直方图 + p50 / p95 / max，可直接打印或发 TG
+- save() 累积到 .cache/<name>.json，跨运行合并观察
+"""
+
+import bisect
+import threading
+
+from engine.cache import load_json, save_json
+
+DEFAULT_BUCKETS_MS = (50, 100, 200, 500, 1000, 2000, 5000, 10000)
+
+
+def percentile(values, p):
+    """最近秩百分位，空序列返回 None"""
+    data = sorted(values)
+    if not data:
+        return None
+    return data[min(len(data) - 1, int(round(p / 100 * (len(data) - 1))))]
+
+
+class Histogram:
+
+    def __init__(self, name, buckets_ms=DEFAULT_BUCKETS_MS):
+        self.name = name
+        self.buckets = list(buckets_ms)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是溢出桶
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        with self.lock:
+            self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.samples.append(ms)
+
+    def percentile(self, p):
+        with self.lock:
+            data = list(self.samples)
+        return percentile(data, p)
+
+    def render(self, width=20):
+        with self.lock:
+            counts = list(self.counts)
+            total = len(self.samples)
+            peak = max(self.samples) if self.samples else 0
+        if not total:
+            return f"📊 {self.name}: 暂无数据"
+
+        lines = [
+            f"📊 {self.name}: n={total} p50={self.percentile(50):.0f}ms "
+            f"p95={self.percentile(95):.0f}ms max={peak:.0f}ms"
+        ]
+        top = max(counts)
+        labels = [f"≤{b}ms" for b in self.buckets] + [f">{self.buckets[-1]}ms"]
+        for label, n in zip(labels, counts):
+            if n:
+                lines.append(f"  {label:>8} {'█' * max(1, n * width // top)} {n}")
+        return "\n".join(lines)
+
+    def save(self):
+        """把本次计数累加到缓存文件"""
+        with self.lock:
+            counts = list(self.counts)
+        data = load_json(f"{self.name}.json", {}) or {}
+        if data.get("buckets") != self.buckets:
+            data = {"buckets": self.buckets, "counts": [0] * len(counts)}
+        data["counts"] = [a + b for a, b in zip(data["counts"], counts)]
+        save_json(f"{self.name}.json", data)
@@ -6,11 +6,12 @@
 - 自动读取 GitHub Actions / 系统环境变量
 - 支持文字
 - 支持图片
+- 实际发送走 engine.telegram_bot（连接复用 / 按 chat 限速 / 429 重试）
 """
 
 import os
-import requests
 from engine.safe_print import desensitize_text
+from engine.telegram_bot import bot
 
 # =========================
 # 环境变量读取
@@ -41,24 +42,7 @@ def send_telegram_text(text):
         return False
 
     print("📨 [TG] 发送文字通知")
-
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendMessage"
-    payload = {
-        "chat_id": TG_CHAT_ID,
-        "text": text,
-        "parse_mode": "HTML",
-        "disable_web_page_preview": True,
-    }
-
-    try:
-        r = requests.post(url, data=payload, timeout=30)
-        print(f"⬅️ [TG] HTTP {r.status_code}")
-        if not r.ok:
-            print(f"❌ [TG] 失败响应: {r.text}")
-        return r.ok
-    except Exception as e:
-        print(f"💥 [TG] 异常: {e}")
-        return False
+    return bot(TG_BOT_TOKEN).send(text, TG_CHAT_ID)
 
 
 # =========================
@@ -70,31 +54,7 @@ def send_telegram_image(image_path, caption=None):
         return False
 
     print(f"🖼️ [TG] 发送图片: {image_path}")
-
-    if not os.path.exists(image_path):
-        print("❌ 图片文件不存在")
-        return False
-
-    url = f"https://api.telegram.org/bot{TG_BOT_TOKEN}/sendPhoto"
-
-    data = {
-        "chat_id": TG_CHAT_ID,
-    }
-    if caption:
-        data["caption"] = caption
-
-    try:
-        with open(image_path, "rb") as f:
-            files = {"photo": f}
-            r = requests.post(url, data=data, files=files, timeout=60)
-
-        print(f"⬅️ [TG] HTTP {r.status_code}")
-        if not r.ok:
-            print(f"❌ [TG] 失败响应: {r.text}")
-        return r.ok
-    except Exception as e:
-        print(f"💥 [TG] 异常: {e}")
-        return False
+    return bot(TG_BOT_TOKEN).photo(image_path, caption, TG_CHAT_ID)
 
 
 # =========================
@@ -1,24 +1,11 @@
 # engine/playwright_login.py
 
 import time
-from playwright.sync_api import sync_playwright
 
 LOGIN_URL = "https://leaflow.net/login"
 DASHBOARD_URL = "https://leaflow.net/dashboard"
 
 
-def open_browser():
-    print("🌐 启动浏览器")
-    pw = sync_playwright().start()
-    browser = pw.chromium.launch(
-        headless=True,
-        args=["--no-sandbox", "--disable-dev-shm-usage"]
-    )
-    ctx = browser.new_context()
-    page = ctx.new_page()
-    return pw, browser, ctx, page
-
-
 def cookies_ok(page):
     print("🔍 校验 cookies")
     page.goto(DASHBOARD_URL, timeout=30000)
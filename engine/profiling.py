@@ -0,0 +1,116 @@
+# engine/profiling.py
+# -*- coding: utf-8 -*-
+
+"""
+按需性能分析：命令行带 --profile 或设置 ENGINE_PROFILE=1
+- cProfile（确定性）跑调用它的线程，结果存 profile_<名称>.prof，可用 snakeviz / pstats 打开
+- 采样线程每 ENGINE_PROFILE_INTERVAL 秒抓一次所有线程的调用栈，
+  存 profile_<名称>.collapsed（flamegraph.pl / speedscope 直接可用）
+- 结束后打印耗时最多的函数
+- 文件放在截图所在的当前目录（ENGINE_PROFILE_DIR 可改）
+没开启时 profiled() 只做一次判断就直接调用，不加载 cProfile、不启动线程
+"""
+
+import os
+import sys
+
+PROFILE_FLAG = "--profile"
+
+
+def enabled(argv=None):
+    argv = sys.argv if argv is None else argv
+    return PROFILE_FLAG in argv or os.getenv("ENGINE_PROFILE", "") not in ("", "0")
+
+
+def profiled(fn, name, enable=None):
+    """调用 fn()；开启分析时包上 cProfile + 栈采样"""
+    if not (enabled() if enable is None else enable):
+        return fn()
+    return _run_profiled(fn, name)
+
+
+class StackSampler:
+    """定时抓取所有线程的调用栈，按折叠格式计数"""
+
+    def __init__(self, interval=None):
+        import threading
+        from collections import Counter
+
+        self.interval = interval or float(os.getenv("ENGINE_PROFILE_INTERVAL", "0.01"))
+        self.counts = Counter()
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    @staticmethod
+    def _label(code):
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        import threading
+
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(tid, str(tid)))
+                self.counts[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, n in self.counts.most_common():
+                f.write(f"{stack} {n}\n")
+
+
+def _run_profiled(fn, name, top=20):
+    import io
+    import time
+    import pstats
+    import cProfile
+
+    out_dir = os.getenv("ENGINE_PROFILE_DIR") or os.getcwd()
+    os.makedirs(out_dir, exist_ok=True)
+    base = os.path.join(out_dir, f"profile_{name}_{time.strftime('%Y%m%d_%H%M%S')}")
+
+    print(f"🔬 [Profile] 已开启，结果写入 {base}.*")
+    sampler = StackSampler()
+    profiler = cProfile.Profile()
+    sampler.start()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        return fn()
+    finally:
+        profiler.disable()
+        wall = time.perf_counter() - start
+        sampler.stop()
+
+        profiler.dump_stats(f"{base}.prof")
+        sampler.write(f"{base}.collapsed")
+
+        buf = io.StringIO()
+        stats = pstats.Stats(profiler, stream=buf)
+        stats.sort_stats("cumulative").print_stats(top)
+        buf.write("\n")
+        stats.sort_stats("tottime").print_stats(top)
+        with open(f"{base}.txt", "w", encoding="utf-8") as f:
+            f.write(buf.getvalue())
+
+        print(f"🔬 [Profile] 总耗时 {wall:.2f}s，采样 {sum(sampler.counts.values())} 次")
+        print(f"🔬 [Profile] 自身耗时最多的函数（完整结果见 {base}.txt）:")
+        rows = sorted(stats.stats.items(), key=lambda kv: kv[1][2], reverse=True)[:10]
+        for (filename, line, func), (_, ncalls, tottime, cumtime, _) in rows:
+            print(f"   {tottime:8.3f}s self {cumtime:8.3f}s cum {ncalls:>7} 次  "
+                  f"{func} ({os.path.basename(filename)}:{line})")
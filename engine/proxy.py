@@ -0,0 +1,346 @@
+# engine/proxy.py
+# -*- coding: utf-8 -*-
+
+"""
+代理探测
+- PROXY 里的所有代理同时探测，按实测延迟排序
+- 最快的可用代理返回后只再等一个很短的窗口收集备选，不再等其余探测
+  （它们在 daemon 线程里按各自超时跑完，结果只计入健康记录）
+- 返回排好序的列表，调用方可依次故障切换
+- 健康记录（延迟 EWMA / 成功率 / 最近失败）在进程内更新，退出时写一次 .cache/proxy_health.json，
+  下次先试历史最好的代理，冷却中的跳过，其余只后台抽查几个
+- 出口 IP 用纯 HTTP 检测，可与浏览器启动并行，结果在本次运行内缓存
+- proxy_session() 返回按排名走代理的 Session：每个响应计入健康记录，代理连不上时切到下一个
+"""
+
+import os
+import time
+import queue
+import atexit
+import random
+import threading
+
+import requests
+
+from engine import scope
+from engine.cache import load_json, save_json
+from engine.http_pool import run_background
+
+TEST_URL = "https://myip.ipip.net"
+HEADERS = {"User-Agent": "Mozilla/5.0"}
+
+HEALTH_CACHE = "proxy_health.json"
+EWMA_ALPHA = 0.3
+COOLDOWN = int(os.getenv("PROXY_COOLDOWN", "1800"))  # 失败后冷却秒数
+SAMPLE_SIZE = int(os.getenv("PROXY_SAMPLE", "2"))     # 每次后台抽查的代理数
+
+_health = None          # 进程内的健康记录，第一次用到时从缓存加载
+_health_dirty = False
+_health_lock = threading.Lock()
+
+_egress_cache = {}  # server | "direct" -> (ok, ip_text 或错误)
+_egress_lock = threading.Lock()
+
+
+def parse_proxies(raw):
+    """逗号分隔的 PROXY -> 补全协议后的列表"""
+    result = []
+    for p in (raw or "").split(","):
+        p = p.strip()
+        if not p:
+            continue
+        if not p.startswith(("http://", "https://", "socks5://")):
+            p = f"http://{p}"
+        result.append(p)
+    return result
+
+
+# ==================================================
+# 健康记录
+# ==================================================
+
+def _records():
+    """调用方持有 _health_lock"""
+    global _health
+    if _health is None:
+        _health = load_json(HEALTH_CACHE, {}) or {}
+        atexit.register(flush_health)
+    return _health
+
+
+def load_health():
+    """当前健康记录的快照"""
+    with _health_lock:
+        return {server: dict(rec) for server, rec in _records().items()}
+
+
+def flush_health():
+    """有变化时把健康记录写回缓存；进程退出时自动调用"""
+    global _health_dirty
+    with _health_lock:
+        if _health is None or not _health_dirty:
+            return
+        save_json(HEALTH_CACHE, _health)
+        _health_dirty = False
+
+
+def record_result(server, ok, latency=None, ip_text=None):
+    """
+    记录一次经过代理的请求结果；ip_text 为探测到的出口 IP，供之后的备选列表展示
+    每个走代理的响应都会调用，只改内存，不碰磁盘
+    """
+    global _health_dirty
+    with _health_lock:
+        rec = _records().setdefault(server, {
+            "latency": None,
+            "success_rate": 0.5,
+            "last_failure": 0,
+            "last_success": 0,
+            "samples": 0,
+        })
+        now = int(time.time())
+        rec["samples"] += 1
+        rec["success_rate"] = (1 - EWMA_ALPHA) * rec["success_rate"] + EWMA_ALPHA * (1 if ok else 0)
+        if ok:
+            rec["last_success"] = now
+            if ip_text:
+                rec["ip"] = ip_text
+            if latency is not None:
+                rec["latency"] = latency if rec["latency"] is None else \
+                    (1 - EWMA_ALPHA) * rec["latency"] + EWMA_ALPHA * latency
+        else:
+            rec["last_failure"] = now
+        _health_dirty = True
+
+
+def in_cooldown(rec, now=None):
+    if not rec:
+        return False
+    now = now or time.time()
+    return rec["last_failure"] > rec["last_success"] and now - rec["last_failure"] < COOLDOWN
+
+
+def health_key(rec):
+    """排序键：成功率高、延迟低的在前；没有记录的排在中间"""
+    if not rec:
+        return (-0.5, float("inf"))
+    latency = rec["latency"] if rec["latency"] is not None else float("inf")
+    return (-rec["success_rate"], latency)
+
+
+def track_session(session, server=None):
+    """
+    给走代理的 requests.Session 挂上钩子，每个响应都计入健康记录
+    server 为 None 时取 session.proxy_server（会故障切换的 ProxySession）
+    """
+    def hook(resp, *args, **kwargs):
+        current = server or getattr(session, "proxy_server", None)
+        if current:
+            record_result(current, resp.status_code < 500, resp.elapsed.total_seconds())
+    session.hooks["response"].append(hook)
+    return session
+
+
+# 请求还没到达目标站点就失败（代理本身的问题），换代理重发是安全的，POST 也不会重复
+_PROXY_ERRORS = (requests.exceptions.ProxyError, requests.exceptions.ConnectTimeout)
+
+
+class ProxySession(requests.Session):
+    """按 ranking 顺序使用代理；代理连不上时记一次失败并切到下一个，全部失败后抛出"""
+
+    def __init__(self, servers, log=print):
+        super().__init__()
+        self.servers = list(servers)
+        self.log = log
+        self.switch_lock = threading.Lock()
+        self._use(0)
+        track_session(self)
+
+    def _use(self, index):
+        self.index = index
+        self.proxy_server = self.servers[index]
+        self.proxies = {"http": self.proxy_server, "https": self.proxy_server}
+
+    def request(self, *args, **kwargs):
+        while True:
+            index, server = self.index, self.proxy_server
+            try:
+                return super().request(*args, **kwargs)
+            except _PROXY_ERRORS as e:
+                record_result(server, False)
+                with self.switch_lock:
+                    if self.index == index:
+                        # 别的线程还没切过，由本线程切
+                        if index + 1 >= len(self.servers):
+                            raise
+                        self._use(index + 1)
+                        self.log(f"🔀 代理 {server} 不可用（{type(e).__name__}），切换到 {self.proxy_server}")
+
+
+def proxy_session(raw, timeout=10, log=print):
+    """
+    raw 为逗号分隔的代理列表：排名后返回 ProxySession；没配置或全部不可用返回普通 Session（直连）
+    """
+    servers = parse_proxies(raw)
+    if not servers:
+        return requests.Session()
+    ranking = rank_proxies(servers, timeout=timeout, log=log)
+    if not ranking:
+        log("🚫 所有代理均不可用，使用直连")
+        return requests.Session()
+    return ProxySession([server for server, _, _ in ranking], log=log)
+
+
+# ==================================================
+# 探测
+# ==================================================
+
+def probe_proxy(server, timeout=10, session=None):
+    """返回 (ok, 延迟秒, IP 文本或错误)；server 为 None 时直连"""
+    session = session or requests.Session()
+    start = time.monotonic()
+    try:
+        resp = session.get(
+            TEST_URL,
+            proxies={"http": server, "https": server} if server else None,
+            headers=HEADERS,
+            timeout=timeout,
+            verify=False,          # 防止代理 https 证书问题
+            allow_redirects=True
+        )
+        latency = time.monotonic() - start
+        if resp.status_code == 200 and resp.text.strip():
+            with _egress_lock:
+                _egress_cache[server or "direct"] = (True, resp.text.strip())
+            return True, latency, resp.text.strip()
+        return False, latency, f"HTTP {resp.status_code}"
+    except Exception as e:
+        return False, time.monotonic() - start, repr(e)
+
+
+def _probe_all(servers, timeout, grace, log):
+    """
+    并发探测 servers，返回截止时已可用的列表（未排序）
+    进行中的请求无法中途取消：没等到的探测留在 daemon 线程里，最迟 timeout 秒后结束，
+    结果照常写入健康记录，不影响本次返回
+    """
+    results = queue.Queue()
+
+    def worker(server):
+        ok, latency, info = probe_proxy(server, timeout)
+        record_result(server, ok, latency if ok else None, info if ok else None)
+        results.put((server, ok, latency, info))
+
+    worker = scope.wrap(worker)
+    for server in servers:
+        threading.Thread(target=worker, args=(server,), daemon=True).start()
+
+    healthy = []
+    deadline = time.monotonic() + timeout + 1
+    pending = len(servers)
+
+    while pending:
+        wait = deadline - time.monotonic()
+        if wait <= 0:
+            break
+        try:
+            server, ok, latency, info = results.get(timeout=wait)
+        except queue.Empty:
+            break
+        pending -= 1
+        if ok:
+            log(f"✅ 代理可用 {server}（{latency * 1000:.0f}ms）")
+            if not healthy:
+                deadline = min(deadline, time.monotonic() + grace)
+            healthy.append((server, latency, info))
+        else:
+            log(f"❌ 代理失败 {server}: {info}")
+
+    if pending:
+        log(f"⏭ 不再等待剩余 {pending} 个代理探测（后台跑完只更新健康记录）")
+
+    return healthy
+
+
+def _revalidate_background(servers, timeout):
+    """后台抽查，只更新健康记录（daemon 线程，不阻塞退出）"""
+    def worker(server):
+        ok, latency, info = probe_proxy(server, timeout)
+        record_result(server, ok, latency if ok else None, info if ok else None)
+
+    for server in servers:
+        threading.Thread(target=worker, args=(server,), daemon=True).start()
+
+
+def rank_proxies(servers, timeout=10, grace=1.0, log=print):
+    """
+    返回按优先级排序的可用代理 [(server, latency, ip_text)]
+    1. 冷却中的代理跳过（全部冷却时仍全部探测）
+    2. 历史最好的代理先单独探测，可用就直接用，其余只后台抽查 SAMPLE_SIZE 个
+    3. 否则并发探测剩余代理，第一个可用结果出现后最多再等 grace 秒（其余探测不取消，只是不再等）
+    """
+    if not servers:
+        return []
+
+    health = load_health()
+    now = time.time()
+    active = [s for s in servers if not in_cooldown(health.get(s), now)]
+    if len(active) < len(servers):
+        log(f"🧊 跳过冷却中的代理 {len(servers) - len(active)} 个")
+    if not active:
+        active = list(servers)
+
+    ordered = sorted(active, key=lambda s: health_key(health.get(s)))
+    best = ordered[0]
+    rest = ordered[1:]
+
+    if health.get(best, {}).get("last_success"):
+        log(f"⭐ 先试历史最佳代理 {best}")
+        ok, latency, info = probe_proxy(best, timeout)
+        record_result(best, ok, latency if ok else None, info if ok else None)
+        if ok:
+            log(f"✅ 代理可用 {best}（{latency * 1000:.0f}ms）")
+            sample = random.sample(rest, min(SAMPLE_SIZE, len(rest)))
+            if sample:
+                log(f"🔍 后台抽查 {len(sample)} 个代理")
+                _revalidate_background(sample, timeout)
+            # 备选按历史健康度排，延迟 / 出口 IP 用历史记录
+            backups = [
+                (s, health[s]["latency"], health[s].get("ip") or "（历史记录）") for s in rest
+                if health.get(s, {}).get("latency") is not None
+            ]
+            return [(best, latency, info)] + backups
+        log(f"❌ 历史最佳代理失败 {best}: {info}")
+    else:
+        rest = ordered
+
+    healthy = _probe_all(rest, timeout, grace, log)
+    healthy.sort(key=lambda x: x[1])
+    return healthy
+
+
+# ==================================================
+# 出口 IP
+# ==================================================
+
+def detect_egress_ip(server=None, timeout=10):
+    """
+    通过 HTTP 检测出口 IP（server 为 None 时直连），本次运行内缓存
+    返回 (ok, IP 文本或错误)
+    """
+    key = server or "direct"
+    with _egress_lock:
+        if key in _egress_cache:
+            return _egress_cache[key]
+
+    ok, latency, info = probe_proxy(server, timeout)
+    if server:
+        record_result(server, ok, latency if ok else None, info if ok else None)
+    with _egress_lock:
+        _egress_cache[key] = (ok, info)
+    return ok, info
+
+
+def detect_egress_ip_async(server=None, timeout=10):
+    """后台检测出口 IP，返回 Future，便于和浏览器启动并行"""
+    return run_background(detect_egress_ip, server, timeout)
@@ -0,0 +1,157 @@
+# engine/redeem_planner.py
+# -*- coding: utf-8 -*-
+
+"""
+兑换码分配计划
+- 按码前缀（c/r/d/t/h）判断资源类型
+- 实例排序：历史成功率高的优先，其次当前该项资源少的优先
+- 按计划依次尝试，成功即停；码本身失效（已用 / 不存在 / 过期）也立即停
+- 每次结果追加到状态库 ledger（kind=redeem_attempt），下次排序更准
+- 历史只在进程内读一次（最近 HISTORY_DAYS 天），之后随结果在内存里累加，码到达时不查库
+"""
+
+import re
+import time
+import threading
+
+from engine.state import open_state
+
+LEDGER_KIND = "redeem_attempt"
+HISTORY_DAYS = 30
+
+CODE_REGEX = re.compile(r'\b[crdth]-[\w-]{8,40}\b')
+
+# 实例 JSON 里各类资源可能的字段名
+RESOURCE_FIELDS = {
+    "c": ("cpu", "cpu_limit", "cpuLimit", "cpu_max"),
+    "r": ("memory", "ram", "memory_limit", "memoryLimit", "memory_max"),
+    "d": ("disk", "disk_size", "diskSize", "disk_max"),
+    "t": ("traffic", "traffic_limit", "trafficLimit", "bandwidth"),
+}
+
+# 明确说「码」本身不能再用时才停，换实例也没意义；
+# 只说 invalid / 无效 / not found 而没提到码的（实例不存在、instanceId 无效）按实例错误处理
+_DEAD = r"(?:已被使用|已使用|已兑换|已被兑换|不存在|无效|已?过期|已失效)"
+_DEAD_EN = r"(?:invalid|used|expired|not found|does not exist|redeemed)"
+CODE_DEAD_PATTERNS = (
+    re.compile(r"(?:兑换码|兑换券|激活码|(?<!密)码)[^，,。；;]{0,8}?" + _DEAD),
+    re.compile(_DEAD + r"的?(?:兑换码|兑换券|激活码)"),
+    re.compile(r"code\b[^,.;]{0,30}?\b" + _DEAD_EN),
+    re.compile(r"\b" + _DEAD_EN + r"\s+(?:redeem\s*)?code"),
+    re.compile(r"already\s+redeemed"),
+)
+
+def code_type(code):
+    code = (code or "").strip()
+    if len(code) > 1 and code[1] == "-" and code[0] in "crdth":
+        return code[0]
+    return None
+
+
+def classify_error(msg):
+    """返回 'code'（码失效，停止）或 'instance'（换下一个实例）"""
+    text = (msg or "").lower()
+    if any(p.search(text) for p in CODE_DEAD_PATTERNS):
+        return "code"
+    return "instance"
+
+
+# ==================================================
+# 历史结果
+# ==================================================
+
+def _key(ctype, instance_id):
+    return f"{ctype or '?'}:{instance_id}"
+
+
+def score(outcomes, ctype, instance_id):
+    """拉普拉斯平滑后的成功率，没有记录时为 0.5"""
+    rec = outcomes.get(_key(ctype, instance_id)) or {}
+    ok = rec.get("ok", 0)
+    fail = rec.get("fail", 0)
+    return (ok + 1) / (ok + fail + 2)
+
+
+_outcomes = None
+_lock = threading.Lock()
+
+
+def _count(key, ok):
+    rec = _outcomes.setdefault(key, {"ok": 0, "fail": 0})
+    rec["ok" if ok else "fail"] += 1
+
+
+def outcomes():
+    """
+    (类型:实例) -> {"ok": 成功次数, "fail": 失败次数}
+    第一次调用时从 ledger 读最近 HISTORY_DAYS 天（预热时调用一次），之后只用内存
+    """
+    global _outcomes
+    with _lock:
+        if _outcomes is None:
+            _outcomes = {}
+            since = time.time() - HISTORY_DAYS * 86400
+            for row in open_state().ledger("incudal", kind=LEDGER_KIND, since=since):
+                _count(row["key"], row["status"] == "ok")
+        return _outcomes
+
+
+def record(code, instance_id, ok, error=None):
+    key = _key(code_type(code), instance_id)
+    open_state().append_ledger(
+        "incudal", None, LEDGER_KIND, key, "ok" if ok else "fail", {"code": code, "error": error},
+    )
+    with _lock:
+        if _outcomes is not None:
+            _count(key, ok)
+
+
+# ==================================================
+# 计划
+# ==================================================
+
+def resource_value(instance, ctype):
+    for field in RESOURCE_FIELDS.get(ctype, ()):
+        value = instance.get(field)
+        if isinstance(value, (int, float)):
+            return value
+        if isinstance(value, str) and value.replace(".", "", 1).isdigit():
+            return float(value)
+    return None
+
+
+def plan(code, instances):
+    """返回按优先级排好的实例列表"""
+    ctype = code_type(code)
+    history = outcomes()
+
+    def rank(ins):
+        value = resource_value(ins, ctype)
+        return (
+            -score(history, ctype, ins["id"]),
+            value is None,
+            value or 0,
+        )
+
+    return sorted(instances, key=rank)
+
+
+def redeem_with_plan(code, instances, redeem_fn):
+    """
+    按计划依次兑换，redeem_fn(code, instance_id) -> (ok, msg)
+    返回 (成功的实例 id | None, 请求次数, 码失效的错误信息 | None)
+    第三项只在服务端明确说码本身不可用时非空；网络错误、实例错误都为 None（以后可以重试）
+    """
+    attempts = 0
+    for ins in plan(code, instances):
+        attempts += 1
+        ok, msg = redeem_fn(code, ins["id"])
+        if ok:
+            record(code, ins["id"], True)
+            return ins["id"], attempts, None
+        if classify_error(msg) == "code":
+            print(f"🛑 [Planner] {code} 已不可用，停止尝试")
+            return None, attempts, msg
+        # 只有实例相关的失败才计入该实例
+        record(code, ins["id"], False, msg)
+    return None, attempts, None
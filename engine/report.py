@@ -0,0 +1,94 @@
+# engine/report.py
+# -*- coding: utf-8 -*-
+
+"""
+运行历史汇总：python -m engine report [--days 7] [--baseline-days 28] [--provider incudal]
+- 最近 days 天按 (provider, step) 统计 n / p50 / p95 / max / 失败率 / 非 2xx 状态码
+- 和之前 baseline-days 天（基线）对比：p50 或 p95 变慢超过 threshold 倍、
+  或失败率上升超过 FAIL_RATE_DELTA，标记为回归
+- 基线样本少于 MIN_BASELINE 条的不下结论
+"""
+
+import time
+from collections import Counter, defaultdict
+
+from engine.metrics import percentile
+from engine.state import open_state
+
+THRESHOLD = 1.3
+FAIL_RATE_DELTA = 0.1
+MIN_BASELINE = 5
+
+
+def summarize(rows):
+    """[(provider, step) -> 统计]"""
+    groups = defaultdict(list)
+    for r in rows:
+        groups[(r["provider"], r["step"])].append(r)
+
+    stats = {}
+    for key, items in groups.items():
+        seconds = [r["seconds"] for r in items if r["seconds"] is not None]
+        codes = Counter(r["status"] for r in items if r["status"] and not 200 <= r["status"] < 300)
+        stats[key] = {
+            "n": len(items),
+            "p50": percentile(seconds, 50),
+            "p95": percentile(seconds, 95),
+            "max": max(seconds) if seconds else None,
+            "fail_rate": sum(1 for r in items if r["outcome"] == "fail") / len(items),
+            "codes": dict(codes),
+        }
+    return stats
+
+
+def regressions(current, baseline, threshold=THRESHOLD):
+    """返回 [原因]，没有回归返回空列表"""
+    if not baseline or baseline["n"] < MIN_BASELINE:
+        return []
+    found = []
+    for p in ("p50", "p95"):
+        now, base = current[p], baseline[p]
+        if now is not None and base and now > base * threshold:
+            found.append(f"{p} {base:.2f}s→{now:.2f}s")
+    if current["fail_rate"] - baseline["fail_rate"] > FAIL_RATE_DELTA:
+        found.append(f"失败率 {baseline['fail_rate']:.0%}→{current['fail_rate']:.0%}")
+    return found
+
+
+def _fmt(seconds):
+    return "-" if seconds is None else f"{seconds:.2f}s"
+
+
+def build_report(days=7, baseline_days=28, provider=None, threshold=THRESHOLD, now=None):
+    """返回 (文本, 回归条数)"""
+    now = now or time.time()
+    since = now - days * 86400
+    store = open_state()
+    current = summarize(store.metrics(provider, since=since))
+    baseline = summarize(store.metrics(provider, since=since - baseline_days * 86400, until=since))
+
+    if not current:
+        return f"📈 最近 {days} 天没有运行记录", 0
+
+    lines = [f"📈 最近 {days} 天 vs 之前 {baseline_days} 天（阈值 ×{threshold}）"]
+    flagged = 0
+    last_provider = None
+    for (prov, step), s in sorted(current.items()):
+        if prov != last_provider:
+            lines.append(f"\n[{prov}]")
+            last_provider = prov
+        line = (
+            f"  {step}: n={s['n']} p50={_fmt(s['p50'])} p95={_fmt(s['p95'])} "
+            f"max={_fmt(s['max'])} 失败 {s['fail_rate']:.0%}"
+        )
+        if s["codes"]:
+            line += " " + " ".join(f"{code}×{n}" for code, n in sorted(s["codes"].items()))
+        reasons = regressions(s, baseline.get((prov, step)), threshold)
+        if reasons:
+            flagged += 1
+            line += "  ⚠️ 回归: " + "，".join(reasons)
+        lines.append(line)
+
+    lines.append("")
+    lines.append(f"⚠️ {flagged} 项回归" if flagged else "✅ 没有发现回归")
+    return "\n".join(lines), flagged
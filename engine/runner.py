@@ -0,0 +1,126 @@
+# engine/runner.py
+# -*- coding: utf-8 -*-
+
+"""
+统一运行入口：python -m engine run leaflow incudal clawcloud ...
+- 选中的脚本在同一个进程里并发执行，只冷启动一次 Python / Playwright
+- 需要浏览器的脚本交给 BrowserPool（每个池线程一个 Chromium，跑完一个接着复用）
+- 纯 HTTP 的脚本各开一个线程
+- 通知、Secret 回写（公钥只取一次）、GitHub 登录态在同一进程内共用
+- 结束后打印并推送一份合并的耗时 / 结果汇总
+"""
+
+import os
+import sys
+import time
+import importlib
+import traceback
+
+from engine.browser import BrowserPool
+from engine.http_pool import run_background
+from engine import history, scope
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BROWSERS = int(os.getenv("ENGINE_BROWSERS", "2"))
+
+# 名称 -> (目录, 模块, 调用, 是否需要浏览器)
+PROVIDERS = {
+    "leaflow": ("leaflow", "Leaflow_checkin", lambda m: m.main(), True),
+    "incudal": ("Incudal", "Incudal_checkin", lambda m: m.AutoLogin().run(), True),
+    "clawcloud": ("ClawCloud", "ClawCloud_alive", lambda m: m.AutoLogin().run(), True),
+    "github": ("", "update_github_session", lambda m: m.main(), True),
+    "instances": ("Incudal", "Incudal_instances", lambda m: m.main(), False),
+    "redeem": ("Incudal", "Incudal_redeem", lambda m: m.main(), False),
+}
+
+def _load(folder, module):
+    path = os.path.join(BASE_DIR, folder)
+    if path not in sys.path:
+        sys.path.insert(0, path)
+    return importlib.import_module(module)
+
+
+def _run_one(name, module, call):
+    scope.bind(name)
+    start = time.time()
+    try:
+        call(module)
+        ok, detail = True, ""
+    except SystemExit as e:
+        ok = e.code in (None, 0)
+        detail = "" if ok else f"exit {e.code}"
+    except Exception as e:
+        traceback.print_exc()
+        ok, detail = False, f"{type(e).__name__}: {e}"
+    finally:
+        scope.bind(None)
+    return {"name": name, "ok": ok, "seconds": time.time() - start, "detail": detail}
+
+
+def render_report(results, wall):
+    from engine.secret_writer import WRITES
+    from engine.locate import summary as locate_summary
+    from engine.telegram_bot import summary as telegram_summary
+
+    lines = []
+    width = max(len(r["name"]) for r in results)
+    for r in results:
+        line = f"{'✅' if r['ok'] else '❌'} {r['name']:<{width}} {r['seconds']:6.1f}s"
+        if r["detail"]:
+            line += f"  {r['detail']}"
+        lines.append(line)
+
+    total = sum(r["seconds"] for r in results)
+    lines.append("")
+    lines.append(f"⏱ 总耗时 {wall:.1f}s（逐个运行合计 {total:.1f}s）")
+    if WRITES:
+        lines.append("🔐 Secret 回写: " + ", ".join(f"{n} {'✅' if ok else '❌'}" for n, ok in WRITES))
+    for r in results:
+        located = locate_summary(r["name"])
+        if located:
+            lines.append(f"🎯 [{r['name']}] {located}")
+    sent = telegram_summary()
+    if sent:
+        lines.append(f"📨 {sent}")
+    return "\n".join(lines)
+
+
+def run(names, browsers=BROWSERS):
+    from engine.notify import send_notify
+
+    start = time.time()
+    modules = {}
+    results = []
+    for name in names:
+        folder, module, _, _ = PROVIDERS[name]
+        try:
+            modules[name] = _load(folder, module)
+        except Exception as e:
+            print(f"❌ [Runner] 加载 {name} 失败: {e}")
+            results.append({"name": name, "ok": False, "seconds": 0.0, "detail": f"导入失败: {e}"})
+
+
+    browser_jobs = [n for n in modules if PROVIDERS[n][3]]
+    pool = BrowserPool(min(browsers, len(browser_jobs))) if browser_jobs else None
+    futures = []
+    for name, module in modules.items():
+        call = PROVIDERS[name][2]
+        if PROVIDERS[name][3]:
+            futures.append(pool.submit(_run_one, name, module, call))
+        else:
+            futures.append(run_background(_run_one, name, module, call))
+    print(f"🚀 [Runner] 启动 {len(futures)} 个任务（浏览器池 {len(pool.threads) if pool else 0}）")
+
+    try:
+        results.extend(f.result() for f in futures)
+    finally:
+        if pool:
+            pool.close()
+
+    results.sort(key=lambda r: names.index(r["name"]))
+    for r in results:
+        history.record("runner", r["name"], r["seconds"], outcome="ok" if r["ok"] else "fail")
+    report = render_report(results, time.time() - start)
+    print("\n🧾 Engine 运行汇总\n" + report)
+    send_notify("🧾 Engine 运行汇总", report)
+    return all(r["ok"] for r in results)
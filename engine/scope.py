@@ -0,0 +1,38 @@
+# engine/scope.py
+# -*- coding: utf-8 -*-
+
+"""
+当前脚本名
+- python -m engine run 在同一进程里并发跑多个脚本，输出前缀 / 选择器统计等按脚本区分
+- bind(name) 设置当前上下文所属的脚本，current() 读取；单独运行脚本时为空串
+- 存在 ContextVar 里，新线程默认不继承：run_concurrent / run_background 等用 wrap(fn) 显式带过去
+- tag(line) 给脚本自己的日志加前缀，不改全局 print
+"""
+
+import contextvars
+
+_name = contextvars.ContextVar("engine_scope", default="")
+
+
+def current():
+    return _name.get() or ""
+
+
+def bind(name):
+    _name.set(name or "")
+
+
+def wrap(fn):
+    """在调用方的上下文里执行 fn（可在其它线程、并发多次调用）"""
+    ctx = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        # 同一个 Context 不能在多个线程里同时进入，每次调用用一份拷贝
+        return ctx.copy().run(fn, *args, **kwargs)
+
+    return run
+
+
+def tag(line):
+    name = current()
+    return f"[{name}] {line}" if name else line
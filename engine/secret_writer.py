@@ -0,0 +1,139 @@
+# engine/secret_writer.py
+# -*- coding: utf-8 -*-
+
+"""
+GitHub Actions Secret 回写
+- 仓库公钥每个进程只取一次，所有脚本共用
+- 写入串行执行（同一进程里多个脚本可能同时回写）
+- WRITES 记录本次运行写过的 secret，供汇总报告使用
+- GUARDED 里的 secret（多个 workflow 都会回写）按指纹做 compare-and-swap：
+  仓库变量 <名称>_FP 记录最近一次回写的指纹，和本次运行启动时读到的不同，
+  说明期间别的运行已经写过更新的值，放弃本次回写（返回 None）
+  GitHub API 没有原子操作，检查到写入之间仍有几秒窗口；变量读不到（权限不够）时照常写入
+"""
+
+import os
+import base64
+import hashlib
+import threading
+
+from engine.http_pool import shared_session
+
+API = "https://api.github.com"
+
+WRITES = []  # [(name, ok)]
+
+GUARDED = {"GH_SESSION"}
+
+# 本进程写过的值：之后的回写以它为基准
+_expected = {}
+
+_lock = threading.Lock()
+_public_key = None
+
+
+def enabled():
+    return bool(os.getenv("REPO_TOKEN") and os.getenv("GITHUB_REPOSITORY"))
+
+
+def _headers():
+    return {
+        "Authorization": f"token {os.getenv('REPO_TOKEN')}",
+        "Accept": "application/vnd.github.v3+json",
+    }
+
+
+def _get_public_key(repo):
+    global _public_key
+    if _public_key is None:
+        r = shared_session().get(
+            f"{API}/repos/{repo}/actions/secrets/public-key",
+            headers=_headers(),
+            timeout=30,
+        )
+        print(f"⬅️ [Secret] 公钥接口返回 {r.status_code}")
+        r.raise_for_status()
+        _public_key = r.json()
+    return _public_key
+
+
+def _fingerprint(text):
+    return hashlib.sha256((text or "").encode()).hexdigest()[:16]
+
+
+def _variable_url(repo, name=None):
+    return f"{API}/repos/{repo}/actions/variables" + (f"/{name}" if name else "")
+
+
+def _read_variable(repo, name):
+    """返回变量值；不存在返回 ""，读不到（无权限等）返回 None"""
+    r = shared_session().get(_variable_url(repo, name), headers=_headers(), timeout=30)
+    if r.status_code == 404:
+        return ""
+    if not r.ok:
+        print(f"⚠ [Secret] 读取变量 {name} HTTP {r.status_code}，不做并发检查")
+        return None
+    return r.json().get("value", "")
+
+
+def _write_variable(repo, name, value):
+    r = shared_session().patch(
+        _variable_url(repo, name), headers=_headers(), json={"name": name, "value": value}, timeout=30,
+    )
+    if r.status_code == 404:
+        r = shared_session().post(
+            _variable_url(repo), headers=_headers(), json={"name": name, "value": value}, timeout=30,
+        )
+    if not r.ok:
+        print(f"⚠ [Secret] 写入变量 {name} HTTP {r.status_code}")
+
+
+def _conflict(repo, name):
+    """别的运行在本次启动后回写过 name 时返回 True"""
+    current = _read_variable(repo, f"{name}_FP")
+    if not current:
+        return False
+    base = _expected.get(name, os.getenv(name) or "")
+    return current != _fingerprint(base.strip())
+
+
+def write_secret(name, value):
+    """
+    加密并写入 secret，成功返回 True
+    GUARDED 的 secret 已被别的运行更新时不写，返回 None
+    """
+    if not enabled():
+        print("⚠ [Secret] 未配置 GITHUB_REPOSITORY / REPO_TOKEN，跳过")
+        return False
+
+    from nacl import encoding, public
+
+    repo = os.getenv("GITHUB_REPOSITORY")
+    with _lock:
+        try:
+            if name in GUARDED and _conflict(repo, name):
+                print(f"⏭ [Secret] {name} 已被其它运行更新，保留对方的值")
+                return None
+            key = _get_public_key(repo)
+            pk = public.PublicKey(key["key"].encode(), encoding.Base64Encoder())
+            encrypted = public.SealedBox(pk).encrypt(value.encode())
+
+            r = shared_session().put(
+                f"{API}/repos/{repo}/actions/secrets/{name}",
+                headers=_headers(),
+                json={
+                    "encrypted_value": base64.b64encode(encrypted).decode(),
+                    "key_id": key["key_id"],
+                },
+                timeout=30,
+            )
+            ok = r.status_code in (201, 204)
+            print(f"{'✅' if ok else '❌'} [Secret] {name} 回写 HTTP {r.status_code}")
+            if ok and name in GUARDED:
+                _expected[name] = value
+                _write_variable(repo, f"{name}_FP", _fingerprint(value.strip()))
+        except Exception as e:
+            print(f"❌ [Secret] {name} 回写失败: {e}")
+            ok = False
+        WRITES.append((name, ok))
+        return ok
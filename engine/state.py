@@ -0,0 +1,293 @@
+# engine/state.py
+# -*- coding: utf-8 -*-
+
+"""
+本地状态库（SQLite，.cache/state.db）
+- credentials：cookies / token / session，按 (provider, account, kind) 主键，单条读写
+- ledger     ：兑换、开实例等流水，按 (provider, account, ts) 索引
+- metrics    ：运行耗时 / 状态码 / 结果，只追加
+- meta       ：杂项键值（secret 导入 / 回写过的指纹）
+WAL 模式：读写互不阻塞，多线程共用一个连接（加锁），多进程靠 busy_timeout 排队
+
+和 GitHub Secret 的关系：
+- sync_secret(name)   环境变量里的 secret 有变化时导入（旧值不会覆盖库里更新的值）
+- export_secret(name) 按 secret 原来的格式导出，用于回写
+- dirty(name) / mark_exported(name) 只有内容变了才需要回写
+"""
+
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import atexit
+import threading
+
+from engine.cache import cache_path
+
+DB_NAME = "state.db"
+
+# secret 名 -> (provider, kind, 格式)
+# accounts: {account: value} 的 JSON；json: 单账号 JSON；text: 单账号纯字符串
+SECRET_FORMATS = {
+    "LEAFLOW_COOKIES": ("leaflow", "cookies", "accounts"),
+    "USER_SESSION": ("incudal", "session", "json"),
+    "GH_SESSION": ("github", "session", "text"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS credentials (
+    provider   TEXT NOT NULL,
+    account    TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    value      TEXT NOT NULL,
+    updated_at INTEGER NOT NULL,
+    PRIMARY KEY (provider, account, kind)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS ledger (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,
+    provider TEXT NOT NULL,
+    account  TEXT NOT NULL,
+    kind     TEXT NOT NULL,
+    key      TEXT,
+    status   TEXT,
+    detail   TEXT
+);
+CREATE INDEX IF NOT EXISTS ledger_account ON ledger (provider, account, ts);
+CREATE INDEX IF NOT EXISTS ledger_key ON ledger (kind, key);
+
+CREATE TABLE IF NOT EXISTS metrics (
+    id       INTEGER PRIMARY KEY,
+    ts       REAL NOT NULL,
+    run_id   TEXT,
+    provider TEXT NOT NULL,
+    account  TEXT,
+    step     TEXT NOT NULL,
+    seconds  REAL,
+    status   INTEGER,
+    outcome  TEXT
+);
+CREATE INDEX IF NOT EXISTS metrics_step ON metrics (provider, step, ts);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+) WITHOUT ROWID;
+"""
+
+
+def default_account():
+    return os.getenv("GH_USERNAME") or "default"
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, sort_keys=True)
+
+
+def _fingerprint(text):
+    return hashlib.sha256((text or "").encode()).hexdigest()[:16]
+
+
+class StateStore:
+
+    def __init__(self, path=None):
+        self.path = path or cache_path(DB_NAME)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def _exec(self, sql, args=()):
+        with self.lock:
+            return self.db.execute(sql, args).fetchall()
+
+    def close(self):
+        with self.lock:
+            try:
+                # 合并 WAL，缓存目录里只留一个完整的 db 文件
+                self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                self.db.close()
+
+    # ==================================================
+    # credentials
+    # ==================================================
+
+    def get(self, provider, account, kind, default=None):
+        rows = self._exec(
+            "SELECT value FROM credentials WHERE provider=? AND account=? AND kind=?",
+            (provider, account, kind),
+        )
+        return json.loads(rows[0][0]) if rows else default
+
+    def put(self, provider, account, kind, value):
+        """写入一条；内容没变返回 False（不改 updated_at）"""
+        text = _dumps(value)
+        with self.lock:
+            row = self.db.execute(
+                "SELECT value FROM credentials WHERE provider=? AND account=? AND kind=?",
+                (provider, account, kind),
+            ).fetchone()
+            if row and row[0] == text:
+                return False
+            self.db.execute(
+                "INSERT OR REPLACE INTO credentials VALUES (?, ?, ?, ?, ?)",
+                (provider, account, kind, text, int(time.time())),
+            )
+            return True
+
+    def delete(self, provider, account, kind):
+        self._exec(
+            "DELETE FROM credentials WHERE provider=? AND account=? AND kind=?",
+            (provider, account, kind),
+        )
+
+    def accounts(self, provider, kind):
+        rows = self._exec(
+            "SELECT account FROM credentials WHERE provider=? AND kind=? ORDER BY account",
+            (provider, kind),
+        )
+        return [r[0] for r in rows]
+
+    # ==================================================
+    # ledger / metrics
+    # ==================================================
+
+    def append_ledger(self, provider, account, kind, key=None, status=None, detail=None):
+        self._exec(
+            "INSERT INTO ledger (ts, provider, account, kind, key, status, detail) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), provider, account or default_account(), kind, key, status,
+             _dumps(detail) if detail is not None else None),
+        )
+
+    def ledger(self, provider, account=None, kind=None, since=0):
+        sql = "SELECT ts, account, kind, key, status, detail FROM ledger WHERE provider=? AND ts>=?"
+        args = [provider, since]
+        if account:
+            sql += " AND account=?"
+            args.append(account)
+        if kind:
+            sql += " AND kind=?"
+            args.append(kind)
+        rows = self._exec(sql + " ORDER BY ts, id", args)
+        return [
+            {"ts": ts, "account": a, "kind": k, "key": key, "status": s,
+             "detail": json.loads(d) if d else None}
+            for ts, a, k, key, s, d in rows
+        ]
+
+    def record_metric(self, provider, step, seconds=None, status=None, outcome=None, account=None, run_id=None):
+        self._exec(
+            "INSERT INTO metrics (ts, run_id, provider, account, step, seconds, status, outcome) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (time.time(), run_id, provider, account, step, seconds, status, outcome),
+        )
+
+    def metrics(self, provider=None, since=0, until=None):
+        sql = "SELECT ts, run_id, provider, account, step, seconds, status, outcome FROM metrics WHERE ts>=?"
+        args = [since]
+        if until is not None:
+            sql += " AND ts<?"
+            args.append(until)
+        if provider:
+            sql += " AND provider=?"
+            args.append(provider)
+        cols = ("ts", "run_id", "provider", "account", "step", "seconds", "status", "outcome")
+        return [dict(zip(cols, row)) for row in self._exec(sql + " ORDER BY ts", args)]
+
+    # ==================================================
+    # meta
+    # ==================================================
+
+    def get_meta(self, key, default=None):
+        rows = self._exec("SELECT value FROM meta WHERE key=?", (key,))
+        return rows[0][0] if rows else default
+
+    def set_meta(self, key, value):
+        self._exec("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    # ==================================================
+    # secret 导入 / 导出
+    # ==================================================
+
+    def import_secret(self, name, raw, account=None):
+        """把 secret 原文拆成单条记录写入，返回变化的条数"""
+        provider, kind, layout = SECRET_FORMATS[name]
+        if layout == "accounts":
+            items = json.loads(raw).items()
+        else:
+            value = raw.strip() if layout == "text" else json.loads(raw)
+            items = [(account or default_account(), value)]
+        return sum(1 for acc, value in items if self.put(provider, acc, kind, value))
+
+    def export_secret(self, name, account=None):
+        """按 secret 原来的格式导出；没有数据返回 None"""
+        provider, kind, layout = SECRET_FORMATS[name]
+        if layout == "accounts":
+            data = {acc: self.get(provider, acc, kind) for acc in self.accounts(provider, kind)}
+            return json.dumps(data, ensure_ascii=False) if data else None
+        value = self.get(provider, account or default_account(), kind)
+        if value is None:
+            return None
+        return value if layout == "text" else json.dumps(value, ensure_ascii=False)
+
+    def load(self, name, account=None):
+        """sync_secret 之后返回解析好的值（多账号 secret 返回 dict）"""
+        self.sync_secret(name, account)
+        provider, kind, layout = SECRET_FORMATS[name]
+        if layout == "accounts":
+            return {acc: self.get(provider, acc, kind) for acc in self.accounts(provider, kind)}
+        return self.get(provider, account or default_account(), kind)
+
+    def sync_secret(self, name, account=None):
+        """
+        环境变量里的 secret 和上次导入的不同（说明外部更新过）才导入
+        同一个旧值不会反复覆盖本地更新过、但还没回写成功的记录
+        """
+        raw = (os.getenv(name) or "").strip()
+        if not raw:
+            return 0
+        fp = _fingerprint(raw)
+        key = f"imported:{name}:{account or ''}"
+        if self.get_meta(key) == fp:
+            return 0
+        try:
+            changed = self.import_secret(name, raw, account)
+        except Exception as e:
+            print(f"⚠ [State] 导入 {name} 失败: {e}")
+            return 0
+        self.set_meta(key, fp)
+        # secret 里现在就是这份内容，导出结果相同时不必回写
+        self.mark_exported(name, account)
+        if changed:
+            print(f"📥 [State] 从 {name} 导入 {changed} 条")
+        return changed
+
+    def dirty(self, name, account=None):
+        """导出结果和 secret 里的（上次导入 / 回写的）不一样"""
+        text = self.export_secret(name, account)
+        if text is None:
+            return False
+        return _fingerprint(text) != self.get_meta(f"exported:{name}:{account or ''}")
+
+    def mark_exported(self, name, account=None):
+        text = self.export_secret(name, account)
+        if text is not None:
+            self.set_meta(f"exported:{name}:{account or ''}", _fingerprint(text))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def open_state():
+    """进程内共用一个 StateStore"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+            atexit.register(_store.close)
+        return _store
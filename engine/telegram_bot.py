@@ -0,0 +1,425 @@
+# engine/telegram_bot.py
+# -*- coding: utf-8 -*-
+
+"""
+共用的 Telegram Bot API 客户端（engine.notify / 各脚本的 Telegram 类都走这里）
+- 连接复用：所有请求走 shared_session() 的连接池，不再每条消息新建 TLS 连接
+- 限速：每个 chat 一个令牌桶（默认 1 条/秒，可突发 3 条），另有全局 30 条/秒
+- 429：按响应里的 parameters.retry_after 暂停该 chat 的令牌桶后重试；5xx / 网络错误指数退避重试
+- 失败不再静默：打印方法、状态码和 description，send / photo 返回 False
+- 指标：每次调用的耗时 / 状态码 / 结果记入运行历史（provider=telegram），
+  进程内统计见 stats() / summary()
+- 收消息：每个客户端一个 UpdateDispatcher 后台线程连续长轮询 getUpdates（两次轮询之间不 sleep），
+  把消息按注册顺序分给等待者（/code、审批回复等），等待者拿到的是 Future
+"""
+
+import os
+import time
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+API = "https://api.telegram.org"
+
+CHAT_RATE = float(os.getenv("TG_CHAT_RATE", "1"))     # 每个 chat 每秒条数
+CHAT_BURST = int(os.getenv("TG_CHAT_BURST", "3"))     # 每个 chat 可突发条数
+GLOBAL_RATE = 30                                      # Bot API 全局上限（条/秒）
+RETRIES = 3
+
+POLL_TIMEOUT = 25        # getUpdates 长轮询秒数
+IDLE_STOP = 60           # 没有等待者超过这么久，轮询线程退出（不和其它进程抢消息）
+RECENT_SECONDS = 300     # 没人认领的消息保留多久，给稍后注册的等待者
+RECENT_MAX = 50
+
+# 不进运行历史的方法（长轮询耗时取决于 timeout，没有参考意义）
+UNRECORDED = {"getUpdates"}
+
+_bots = {}
+_bots_lock = threading.Lock()
+
+
+class TelegramError(Exception):
+
+    def __init__(self, method, status, description, retry_after=None):
+        super().__init__(f"{method} HTTP {status}: {description}")
+        self.method = method
+        self.status = status
+        self.description = description
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """rate 个/秒，最多攒 burst 个；acquire 预约一个令牌，不够就在锁外等"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """服务端要求等待（retry_after）：清空令牌，seconds 秒后才有下一个"""
+        with self.lock:
+            self.tokens = min(self.tokens, 1) - seconds * self.rate
+            self.updated = time.monotonic()
+
+
+class BotClient:
+
+    def __init__(self, token, chat_id=None, retries=RETRIES):
+        from engine.http_pool import shared_session
+
+        self.token = token
+        self.chat_id = str(chat_id) if chat_id else None
+        self.retries = retries
+        self.session = shared_session()
+        self.global_bucket = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self.buckets = {}
+        self.lock = threading.Lock()
+        # 方法 -> [(耗时, 是否成功)]
+        self.calls = defaultdict(list)
+        self.dispatcher = None
+
+    def _bucket(self, chat_id):
+        with self.lock:
+            bucket = self.buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.buckets[chat_id] = TokenBucket(CHAT_RATE, CHAT_BURST)
+            return bucket
+
+    def _observe(self, method, seconds, status, ok):
+        with self.lock:
+            self.calls[method].append((seconds, ok))
+        if method not in UNRECORDED:
+            from engine.history import record
+            record("telegram", method, seconds, status, "ok" if ok else "fail")
+
+    # ==================================================
+    # 底层调用
+    # ==================================================
+
+    def call(self, method, data=None, files=None, timeout=30):
+        """
+        调用 Bot API，返回 result；最终失败抛 TelegramError
+        files: {字段: (文件名, bytes)}，重试时可以重复发送
+        """
+        import requests
+
+        data = dict(data or {})
+        chat_id = str(data["chat_id"]) if data.get("chat_id") else None
+        url = f"{API}/bot{self.token}/{method}"
+
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            if chat_id:
+                self._bucket(chat_id).acquire()
+                self.global_bucket.acquire()
+
+            start = time.monotonic()
+            try:
+                r = self.session.post(url, data=data, files=files, timeout=timeout)
+            except requests.RequestException as e:
+                self._observe(method, time.monotonic() - start, None, False)
+                if last:
+                    raise TelegramError(method, None, str(e)) from e
+                print(f"🔁 [TG] {method} 网络错误，第 {attempt + 1} 次重试: {e}")
+                time.sleep(2 ** attempt)
+                continue
+
+            seconds = time.monotonic() - start
+            try:
+                body = r.json()
+            except ValueError:
+                body = {"ok": False, "description": r.text[:200]}
+
+            if r.ok and body.get("ok"):
+                self._observe(method, seconds, r.status_code, True)
+                return body.get("result")
+
+            self._observe(method, seconds, r.status_code, False)
+            description = body.get("description") or r.reason
+            retry_after = (body.get("parameters") or {}).get("retry_after")
+
+            if r.status_code == 429 and not last:
+                wait = float(retry_after or 2 ** attempt)
+                print(f"🐢 [TG] {method} 触发限流，{wait:.0f}s 后重试")
+                if chat_id:
+                    self._bucket(chat_id).pause(wait)
+                else:
+                    time.sleep(wait)
+                continue
+            if r.status_code >= 500 and not last:
+                print(f"🔁 [TG] {method} HTTP {r.status_code}，第 {attempt + 1} 次重试")
+                time.sleep(2 ** attempt)
+                continue
+            raise TelegramError(method, r.status_code, description, retry_after)
+
+    # ==================================================
+    # 常用方法
+    # ==================================================
+
+    def send(self, text, chat_id=None, parse_mode="HTML", preview=False):
+        """发文字，成功返回 True；失败打印原因返回 False"""
+        data = {
+            "chat_id": chat_id or self.chat_id,
+            "text": text,
+            "disable_web_page_preview": not preview,
+        }
+        if parse_mode:
+            data["parse_mode"] = parse_mode
+        try:
+            self.call("sendMessage", data)
+            return True
+        except TelegramError as e:
+            print(f"❌ [TG] 发送失败: {e}")
+            return False
+
+    def photo(self, path, caption=None, chat_id=None):
+        if not os.path.exists(path):
+            print(f"❌ [TG] 图片不存在: {path}")
+            return False
+        with open(path, "rb") as f:
+            content = f.read()
+        data = {"chat_id": chat_id or self.chat_id}
+        if caption:
+            data["caption"] = caption[:1024]
+        try:
+            self.call("sendPhoto", data, files={"photo": (os.path.basename(path), content)}, timeout=60)
+            return True
+        except TelegramError as e:
+            print(f"❌ [TG] 发送图片失败: {e}")
+            return False
+
+    def get_updates(self, offset=None, timeout=0):
+        """长轮询 getUpdates；HTTP 超时比 timeout 多留 10 秒"""
+        data = {"timeout": timeout}
+        if offset is not None:
+            data["offset"] = offset
+        return self.call("getUpdates", data, timeout=timeout + 10) or []
+
+    def updates(self):
+        """这个 bot 的消息分发器（同一进程只有它调用 getUpdates）"""
+        with self.lock:
+            if self.dispatcher is None:
+                self.dispatcher = UpdateDispatcher(self)
+            return self.dispatcher
+
+    # ==================================================
+    # 统计
+    # ==================================================
+
+    def stats(self):
+        """{方法: {n, fail, p50, p95}}，耗时单位秒"""
+        from engine.metrics import percentile
+
+        with self.lock:
+            calls = {m: list(v) for m, v in self.calls.items()}
+        return {
+            method: {
+                "n": len(items),
+                "fail": sum(1 for _, ok in items if not ok),
+                "p50": percentile([s for s, _ in items], 50),
+                "p95": percentile([s for s, _ in items], 95),
+            }
+            for method, items in calls.items()
+        }
+
+    def summary(self):
+        """一行统计，没有调用过返回空串"""
+        parts = [
+            f"{method} {s['n']} 次 p50={s['p50']:.2f}s p95={s['p95']:.2f}s"
+            + (f" 失败 {s['fail']}" if s["fail"] else "")
+            for method, s in sorted(self.stats().items())
+            if method not in UNRECORDED
+        ]
+        return "Telegram：" + "，".join(parts) if parts else ""
+
+
+class UpdateDispatcher:
+    """
+    后台连续长轮询 getUpdates，把消息交给第一个匹配的等待者
+    - register(match, chat_id, since) 返回 Future；match(message) 返回非 None 即认领，结果就是该值
+    - 只认 since 之后发出的消息（按消息自带的 date），取代原来的 flush_updates
+    - 没人认领的消息保留 RECENT_SECONDS 秒，稍后注册的等待者也能拿到
+    - 有等待者时才启动线程；空闲 IDLE_STOP 秒后退出，下次注册再启动（offset 保留）
+    """
+
+    def __init__(self, client, poll_timeout=POLL_TIMEOUT):
+        self.client = client
+        self.poll_timeout = poll_timeout
+        self.offset = None
+        self.waiters = []   # [(match, chat_id, since, future)]
+        self.recent = deque(maxlen=RECENT_MAX)
+        self.lock = threading.Lock()
+        self.thread = None
+        self.idle_at = None
+
+    @staticmethod
+    def _accepts(waiter, msg):
+        match, chat_id, since, _ = waiter
+        if chat_id and str((msg.get("chat") or {}).get("id")) != chat_id:
+            return None
+        if msg.get("date", 0) < since:
+            return None
+        return match(msg)
+
+    def register(self, match, chat_id=None, since=None):
+        waiter = (match, str(chat_id) if chat_id else None, int(since or time.time()), Future())
+        future = waiter[3]
+        with self.lock:
+            for msg in list(self.recent):
+                value = self._accepts(waiter, msg)
+                if value is not None:
+                    self.recent.remove(msg)
+                    future.set_result(value)
+                    return future
+            self.waiters.append(waiter)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="tg-updates", daemon=True)
+                self.thread.start()
+        return future
+
+    def cancel(self, future):
+        with self.lock:
+            self.waiters = [w for w in self.waiters if w[3] is not future]
+        future.cancel()
+
+    def _dispatch(self, msg):
+        with self.lock:
+            for waiter in self.waiters:
+                value = self._accepts(waiter, msg)
+                if value is not None:
+                    self.waiters.remove(waiter)
+                    waiter[3].set_result(value)
+                    return
+            cutoff = time.time() - RECENT_SECONDS
+            while self.recent and self.recent[0].get("date", 0) < cutoff:
+                self.recent.popleft()
+            if msg.get("date", 0) >= cutoff:
+                self.recent.append(msg)
+
+    def _should_stop(self):
+        """没有等待者且空闲够久：在锁内清掉 thread，保证 register 能看到并重新启动"""
+        with self.lock:
+            self.waiters = [w for w in self.waiters if not w[3].done()]
+            if self.waiters:
+                self.idle_at = None
+                return False
+            now = time.monotonic()
+            self.idle_at = self.idle_at or now
+            if now - self.idle_at < IDLE_STOP:
+                return False
+            self.thread = None
+            self.idle_at = None
+            return True
+
+    def _run(self):
+        errors = 0
+        try:
+            while not self._should_stop():
+                try:
+                    updates = self.client.get_updates(self.offset, timeout=self.poll_timeout)
+                    errors = 0
+                    for upd in updates:
+                        self.offset = upd["update_id"] + 1
+                        msg = upd.get("message")
+                        if msg:
+                            self._dispatch(msg)
+                except Exception as e:
+                    # 只有出错才等待；409 说明别的进程 / webhook 在收这个 bot 的消息
+                    # 网络异常、坏数据、match 抛错也不能让线程悄悄退出
+                    errors += 1
+                    wait = min(30, 2 ** errors)
+                    print(f"⚠️ [TG] 拉取 / 分发消息失败，{wait}s 后重试: {e}")
+                    time.sleep(wait)
+        finally:
+            # 无论怎么退出都清掉 thread，下次 register 才会重新启动
+            with self.lock:
+                if self.thread is threading.current_thread():
+                    self.thread = None
+                    self.idle_at = None
+
+
+def bot(token=None, chat_id=None):
+    """进程内按 token 共用一个客户端；没配置 TG_BOT_TOKEN 返回 None"""
+    token = token or os.getenv("TG_BOT_TOKEN")
+    if not token:
+        return None
+    with _bots_lock:
+        client = _bots.get(token)
+        if client is None:
+            client = _bots[token] = BotClient(token, chat_id or os.getenv("TG_CHAT_ID"))
+        return client
+
+
+def summary():
+    with _bots_lock:
+        clients = list(_bots.values())
+    return "；".join(filter(None, (c.summary() for c in clients)))
+
+
+class Telegram:
+    """
+    脚本里用的 Telegram 对象：send / photo / wait_code / wait_for，只和 TG_CHAT_ID 对话
+    没配置 TG_BOT_TOKEN / TG_CHAT_ID 时 ok=False，所有方法直接返回
+    """
+
+    def __init__(self):
+        self.chat_id = os.environ.get("TG_CHAT_ID")
+        self.bot = bot() if self.chat_id else None
+        self.ok = self.bot is not None
+
+    def send(self, msg):
+        return self.ok and self.bot.send(msg, self.chat_id)
+
+    def photo(self, path, caption=""):
+        return self.ok and self.bot.photo(path, caption, self.chat_id)
+
+    def expect(self, pattern, since=None):
+        """
+        登记等待 TG_CHAT_ID 发来的、匹配 pattern 的消息，返回 Future
+        结果是第一个分组（没有分组时是整条文本）；先登记再发提示，就不会漏掉很快的回复
+        """
+        import re
+
+        regex = re.compile(pattern)
+
+        def match(msg):
+            m = regex.match((msg.get("text") or "").strip())
+            if not m:
+                return None
+            return m.group(1) if regex.groups else m.group(0)
+
+        return self.bot.updates().register(match, self.chat_id, since)
+
+    def wait_for(self, pattern, timeout=120, since=None):
+        """等待匹配的消息（/code、审批回复等），超时返回 None"""
+        if not self.ok:
+            return None
+        future = self.expect(pattern, since)
+        try:
+            return future.result(timeout)
+        except FutureTimeout:
+            self.bot.updates().cancel(future)
+            # 超时到取消之间刚好派发过来的消息：取消后不会再被派发，已有结果就用上
+            if future.done() and not future.cancelled():
+                return future.result()
+            return None
+
+    def wait_code(self, timeout=120, since=None):
+        """
+        等待你在 TG 里发 /code 123456
+        只接受来自 TG_CHAT_ID、since（默认调用时刻）之后的消息
+        """
+        return self.wait_for(r"^/code\s+(\d{6,8})$", timeout, since)  # 6位TOTP 或 8位恢复码也行
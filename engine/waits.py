@@ -0,0 +1,111 @@
+# engine/waits.py
+# -*- coding: utf-8 -*-
+
+"""
+Playwright 条件等待（替代固定 sleep + networkidle）
+- wait_url      : 基于导航事件，URL 满足条件立即返回
+- wait_selector : 元素出现 / 可见
+- wait_response : 执行动作并等待匹配的响应
+- wait_cookie   : 等某个 cookie 写入
+- wait_until    : 任意组合条件（短间隔检查，无网络请求）
+- settle        : 只等 DOM 就绪，不等 networkidle
+所有函数都带截止时间，超时返回 False / None，不抛异常
+playwright 在第一次真正超时时才导入（except 子句只在有异常时求值），纯 HTTP 路径不加载它
+"""
+
+import time
+
+
+def playwright_timeout():
+    from playwright.sync_api import TimeoutError
+    return TimeoutError
+
+
+def wait_url(page, predicate, timeout, tick=None, on_tick=None):
+    """
+    等待 page.url 满足 predicate(url)，超时返回 False
+    on_tick(已等待秒数) 每 tick 秒调用一次
+    """
+    start = time.monotonic()
+    deadline = start + timeout
+
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+
+        window = min(remaining, tick) if tick else remaining
+        try:
+            page.wait_for_url(predicate, wait_until="commit", timeout=window * 1000)
+            return True
+        except playwright_timeout():
+            pass
+
+        if on_tick and time.monotonic() < deadline:
+            on_tick(int(time.monotonic() - start))
+
+
+def wait_until(predicate, timeout, interval=0.1, page=None):
+    """
+    predicate() 为真立即返回 True；predicate 抛异常视为未满足
+    传入 page 时用 page.wait_for_timeout 间隔，保证 sync API 期间事件照常派发（page.url 会更新）
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if predicate():
+                return True
+        except Exception:
+            pass
+        if time.monotonic() >= deadline:
+            return False
+        if page is not None:
+            page.wait_for_timeout(interval * 1000)
+        else:
+            time.sleep(interval)
+
+
+def wait_selector(page, selector, timeout, state="visible"):
+    try:
+        page.locator(selector).first.wait_for(state=state, timeout=timeout * 1000)
+        return True
+    except playwright_timeout():
+        return False
+
+
+def wait_response(page, match, action, timeout):
+    """
+    执行 action() 并等待 URL / 谓词匹配的响应
+    返回 Response，超时返回 None
+    """
+    try:
+        with page.expect_response(match, timeout=timeout * 1000) as info:
+            action()
+        return info.value
+    except playwright_timeout():
+        return None
+
+
+def wait_cookie(context, name, timeout, domain=None, interval=0.2):
+    """等待 context 中出现名为 name 的 cookie，返回 cookie dict 或 None"""
+    found = {}
+
+    def check():
+        for c in context.cookies():
+            if c["name"] == name and (not domain or domain in c.get("domain", "")):
+                found["cookie"] = c
+                return True
+        return False
+
+    page = context.pages[0] if context.pages else None
+    wait_until(check, timeout, interval, page=page)
+    return found.get("cookie")
+
+
+def settle(page, timeout=15):
+    """等 DOM 就绪（不等 networkidle，长连接 / 轮询页面不会拖满超时）"""
+    try:
+        page.wait_for_load_state("domcontentloaded", timeout=timeout * 1000)
+        return True
+    except playwright_timeout():
+        return False
@@ -7,7 +7,6 @@ Leaflow Playwright + API 自动签到
 """
 import os
 import sys
-import json
 import time
 from datetime import datetime
 
@@ -18,8 +17,11 @@ from engine.safe_print import enable_safe_print
 enable_safe_print()
 
 from engine.notify import send_notify
+from engine.browser import browser_scope
+from engine.state import open_state
+from engine.history import record
+from engine.profiling import profiled
 from engine.playwright_login import (
-    open_browser,
     cookies_ok,
     login_and_get_cookies,
 )
@@ -59,18 +61,14 @@ def load_accounts():
 
 
 def load_cookies():
-    raw = os.getenv("LEAFLOW_COOKIES")
-    if not raw:
+    # LEAFLOW_COOKIES 有更新时导入本地状态库，之后按账号单条读取
+    cookies = open_state().load("LEAFLOW_COOKIES")
+    if not cookies:
         print("ℹ️ 未检测到 cookies，首次运行")
         return {}
 
-    try:
-        cookies = json.loads(raw)
-        print(f"🍪 已加载 cookies 账号数: {len(cookies)}")
-        return cookies
-    except Exception as e:
-        print(f"❌ cookies JSON 解析失败: {e}")
-        return {}
+    print(f"🍪 已加载 cookies 账号数: {len(cookies)}")
+    return cookies
 
 
 # ================= 单账号流程 =================
@@ -79,41 +77,53 @@ def process_account(email, password, cookies_map):
     print("=" * 60)
     print(f"👤 处理账号: {email}")
 
-    pw, browser, ctx, page = open_browser()
     note = ""
+    started = time.monotonic()
 
-    try:
-        # ---------- cookies 尝试 ----------
-        if email in cookies_map:
-            print("🍪 尝试复用 cookies")
-            ctx.add_cookies(cookies_map[email])
+    with browser_scope() as launch:
+        browser = launch(
+            headless=True,
+            args=["--no-sandbox", "--disable-dev-shm-usage"]
+        )
+        ctx = browser.new_context()
+        page = ctx.new_page()
 
-            if cookies_ok(page):
-                print("✅ cookies 有效")
-                note = "cookies复用"
+        try:
+            # ---------- cookies 尝试 ----------
+            if email in cookies_map:
+                print("🍪 尝试复用 cookies")
+                ctx.add_cookies(cookies_map[email])
+
+                if cookies_ok(page):
+                    print("✅ cookies 有效")
+                    note = "cookies复用"
+                else:
+                    print("♻ cookies 已失效")
+                    raise RuntimeError("cookies expired")
             else:
-                print("♻ cookies 已失效")
-                raise RuntimeError("cookies expired")
-        else:
-            raise RuntimeError("no cookies")
-
-    except Exception:
-        # ---------- 登录 ----------
-        print("🔐 执行 Playwright 登录")
-        cookies = login_and_get_cookies(page, email, password)
-        cookies_map[email] = cookies
-        note = "重新登录"
-
-    finally:
-        # 同步 cookies
-        cookies_map[email] = ctx.cookies()
-        browser.close()
-        pw.stop()
+                raise RuntimeError("no cookies")
+
+        except Exception:
+            # ---------- 登录 ----------
+            print("🔐 执行 Playwright 登录")
+            cookies = login_and_get_cookies(page, email, password)
+            cookies_map[email] = cookies
+            note = "重新登录"
+
+        finally:
+            # 同步 cookies
+            cookies_map[email] = ctx.cookies()
+            open_state().put("leaflow", email, "cookies", cookies_map[email])
+
+    record("leaflow", "浏览器登录" if note == "重新登录" else "cookies 校验", time.monotonic() - started, account=email)
 
     # ---------- API 签到 ----------
     print("📡 执行 API 签到")
+    started = time.monotonic()
     ok, msg = perform_token_checkin(cookies_map[email], email, checkin_url, main_site,headers)
+    record("leaflow", "API 签到", time.monotonic() - started, outcome="ok" if ok else "fail", account=email)
     print(f"ℹ️ API 签到: {ok},{msg}")
+    open_state().append_ledger("leaflow", email, "checkin", status="ok" if ok else "fail", detail=msg)
     return ok, f"{note} | {msg}"
 
 
@@ -131,10 +141,13 @@ def main():
         except Exception as e:
             results.append(f"❌ {email} — {e}")
 
-    # ---------- 回写 cookies ----------
-    SecretUpdater("LEAFLOW_COOKIES").update(
-        json.dumps(cookies_map, ensure_ascii=False)
-    )
+    # ---------- 回写 cookies（内容没变就不写） ----------
+    store = open_state()
+    if store.dirty("LEAFLOW_COOKIES"):
+        if SecretUpdater("LEAFLOW_COOKIES").update(store.export_secret("LEAFLOW_COOKIES")):
+            store.mark_exported("LEAFLOW_COOKIES")
+    else:
+        print("ℹ️ LEAFLOW_COOKIES 未变化，跳过回写")
 
     # ---------- 通知 ----------
     send_notify(
@@ -144,4 +157,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    profiled(main, "leaflow")
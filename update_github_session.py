@@ -2,13 +2,13 @@
 # -*- coding: utf-8 -*-
 
 import os
-import time
-import base64
-import requests
-import pyotp
-from playwright.sync_api import sync_playwright
 
 from engine.notify import send_notify
+from engine.browser import browser_scope
+from engine.github_session import validate_session, session_cookies
+from engine.github_identity import GitHubIdentity
+from engine.secret_writer import write_secret
+from engine.profiling import profiled
 
 # ================== 基础配置 ==================
 
@@ -17,11 +17,7 @@ GITHUB_TEST_URL = "https://github.com/settings/profile"
 
 GH_USERNAME = os.getenv("GH_USERNAME")
 GH_PASSWORD = os.getenv("GH_PASSWORD")
-GH_SESSION = (os.getenv("GH_SESSION") or "").strip()
-GH_2FA_SECRET = os.getenv("GH_2FA_SECRET")
 
-REPO = os.getenv("GITHUB_REPOSITORY")
-REPO_TOKEN = os.getenv("REPO_TOKEN")
 
 # ================== 工具函数 ==================
 
@@ -35,38 +31,8 @@ def mask_email(email: str) -> str:
     return f"{name[:3]}***{name[-2:]}@{domain}"
 
 def update_github_secret(name, value):
-    from nacl import encoding, public
-
     print("📤 更新 GitHub Actions Secret", flush=True)
-
-    headers = {
-        "Authorization": f"token {REPO_TOKEN}",
-        "Accept": "application/vnd.github.v3+json"
-    }
-
-    r = requests.get(
-        f"https://api.github.com/repos/{REPO}/actions/secrets/public-key",
-        headers=headers,
-        timeout=20
-    )
-    if r.status_code != 200:
-        print("❌ 获取 Secret 公钥失败", flush=True)
-        return False
-
-    key = r.json()
-    pk = public.PublicKey(key["key"].encode(), encoding.Base64Encoder())
-    encrypted = public.SealedBox(pk).encrypt(value.encode())
-
-    r = requests.put(
-        f"https://api.github.com/repos/{REPO}/actions/secrets/{name}",
-        headers=headers,
-        json={
-            "encrypted_value": base64.b64encode(encrypted).decode(),
-            "key_id": key["key_id"]
-        },
-        timeout=20
-    )
-    return r.status_code in (201, 204)
+    return write_secret(name, value)
 
 def save_screenshot(page, name):
     path = f"{name}.png"
@@ -77,15 +43,47 @@ def save_screenshot(page, name):
 
 def main():
     masked = mask_email(GH_USERNAME)
+    identity = GitHubIdentity(
+        username=GH_USERNAME,
+        password=GH_PASSWORD,
+        save_secret=update_github_secret,
+    )
+    # GH_SESSION 有更新时先导入本地状态库，再取最新的
+    gh_session = identity.user_session
 
     print(f"🔐 读取账号数: 1", flush=True)
-    print(f"🍪 已加载 cookies 账号数: {1 if GH_SESSION else 0}", flush=True)
+    print(f"🍪 已加载 cookies 账号数: {1 if gh_session else 0}", flush=True)
     sep()
 
-    with sync_playwright() as p:
+    # ================== 🧠 阶段一：cookies 校验（纯 HTTP） ==================
+
+    sep()
+    print("🧠 阶段一：cookies 校验", flush=True)
+    sep()
+
+    valid = False
+    if gh_session:
+        print("🍪 检测到 GH_SESSION，HTTP 校验（不跟随重定向）", flush=True)
+        valid, detail = validate_session(gh_session)
+        print(f"🔍 校验结果: {detail}", flush=True)
+
+        if valid:
+            # 常见路径：不启动浏览器，session 未变也无需回写
+            print("✅ cookies 有效，跳过登录", flush=True)
+            send_notify("✅ GH_SESSION 有效", f"账号 {masked} 无需更新")
+            return
+        if valid is False:
+            print("⚠️ cookies 已失效，需要重新登录", flush=True)
+        else:
+            print("⚠️ 无法判断，交给浏览器确认", flush=True)
+    else:
+        print("🍪 未检测到 GH_SESSION", flush=True)
+        print("⚠️ cookies 不存在或已失效", flush=True)
+
+    with browser_scope() as launch:
         print("🌐 启动浏览器", flush=True)
 
-        browser = p.chromium.launch(
+        browser = launch(
             headless=True,
             args=["--no-sandbox"]
         )
@@ -93,32 +91,12 @@ def main():
         context = browser.new_context()
         page = context.new_page()
 
-        # ================== 🧠 阶段一：cookies 校验 ==================
-
-        sep()
-        print("🧠 阶段一：cookies 校验", flush=True)
-        sep()
-
         cookies_ok = False
 
-        if GH_SESSION:
-            print("🍪 检测到 GH_SESSION", flush=True)
+        # HTTP 无法判断时（网络 / 限流）才用浏览器再确认一次
+        if gh_session and valid is None:
             print("🍪 注入 GitHub cookies", flush=True)
-
-            context.add_cookies([
-                {
-                    "name": "user_session",
-                    "value": GH_SESSION,
-                    "domain": "github.com",
-                    "path": "/"
-                },
-                {
-                    "name": "logged_in",
-                    "value": "yes",
-                    "domain": "github.com",
-                    "path": "/"
-                }
-            ])
+            context.add_cookies(session_cookies(gh_session))
 
             print("🔍 校验 cookies 是否有效", flush=True)
             page.goto(GITHUB_TEST_URL, timeout=30000)
@@ -129,9 +107,6 @@ def main():
                 cookies_ok = True
             else:
                 print("⚠️ cookies 已失效，需要重新登录", flush=True)
-        else:
-            print("🍪 未检测到 GH_SESSION", flush=True)
-            print("⚠️ cookies 不存在或已失效", flush=True)
 
         # ================== 🔐 阶段二：登录 ==================
 
@@ -146,46 +121,8 @@ def main():
             page.goto(GITHUB_LOGIN_URL, timeout=30000)
             page.wait_for_load_state("domcontentloaded", timeout=30000)
 
-            print("⌨️ 输入用户名和密码", flush=True)
-            page.fill('input[name="login"]', GH_USERNAME)
-            page.fill('input[name="password"]', GH_PASSWORD)
-            page.click('input[type="submit"]')
-
-            time.sleep(3)
-            page.wait_for_load_state("networkidle", timeout=30000)
-
-            # 2FA
-            # 2FA
-            if "two-factor" in page.url:
-                print("🔑 检测到两步验证", flush=True)
-            
-                if GH_2FA_SECRET:
-                    print("🔢 使用 TOTP 自动生成验证码", flush=True)
-                    code = pyotp.TOTP(GH_2FA_SECRET).now()
-            
-                    try:
-                        # 等待输入框出现
-                        page.wait_for_selector('input#app_totp', timeout=15000)
-                        page.fill('input#app_totp', code)
-                        page.keyboard.press("Enter")
-                        print("✅ 已填写二次验证验证码", flush=True)
-                    except Exception as e:
-                        print(f"❌ 填写 2FA 失败: {e}", flush=True)
-                        shot = save_screenshot(page, "2fa_failed")
-                        send_notify("❌ GitHub 登录失败", f"填写 2FA 失败: {e}", shot)
-                        return
-                else:
-                    print("❌ 未配置 GH_2FA_SECRET，无法继续", flush=True)
-                    shot = save_screenshot(page, "2fa_failed")
-                    send_notify("❌ GitHub 登录失败", "缺少 2FA 密钥", shot)
-                    return
-            
-                # 等待页面加载完成
-                time.sleep(3)
-                page.wait_for_load_state("networkidle", timeout=30000)
-
-
-            if "login" in page.url:
+            # 用户名密码 / 设备验证 / 2FA 与各 OAuth 站点共用同一套流程
+            if not identity.login(page, context):
                 print("❌ GitHub 登录失败", flush=True)
                 shot = save_screenshot(page, "login_failed")
                 send_notify("❌ GitHub 登录失败", "登录流程失败", shot)
@@ -199,12 +136,7 @@ def main():
         print("🔄 阶段三：更新 GH_SESSION", flush=True)
         sep()
 
-        new_session = None
-        for c in context.cookies():
-            if c["name"] == "user_session" and "github.com" in c["domain"]:
-                new_session = c["value"]
-                break
-
+        new_session = identity.context_session(context)
         if not new_session:
             print("❌ 未获取到新的 GH_SESSION", flush=True)
             shot = save_screenshot(page, "session_failed")
@@ -214,16 +146,14 @@ def main():
         print("🍪 获取新的 user_session", flush=True)
         print(f"🔐 新 GH_SESSION: {new_session[:6]}****{new_session[-4:]}", flush=True)
 
-        if update_github_secret("GH_SESSION", new_session):
+        # 与当前值 / 上次回写的值相同时 persist 直接跳过；成功 / 失败的 TG 通知由 persist 发出
+        if identity.persist(context):
             print("✅ GH_SESSION 更新成功", flush=True)
-            send_notify("✅ GH_SESSION 更新成功", f"账号 {masked} 已更新")
         else:
             print("❌ GH_SESSION 更新失败", flush=True)
-            send_notify("❌ GH_SESSION 更新失败", "Secret 写入失败")
 
-        browser.close()
 
 # ================== 入口 ==================
 
 if __name__ == "__main__":
-    main()
+    profiled(main, "github")